@@ -1,9 +1,20 @@
+import socket
+import threading
+import time
 import xml.etree.cElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from urllib.parse import urlparse
 
+import httplib2
 import oauth2
 from django.conf import settings
+from django.db import connection
 
-from VLE.models import Counter
+# Database sequence from which the message_ids of the requests are allocated, see `reserve_message_ids`
+MESSAGE_ID_SEQUENCE = 'vle_lti_message_id'
+# LMS response statuses after which a grade passback request is retried
+TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
 
 
 class GradePassBackRequest(object):
@@ -33,15 +44,22 @@ class GradePassBackRequest(object):
 
     @classmethod
     def get_message_id_and_increment(cls):
-        """Get the current count for message_id and increment this count."""
-        message_id_counter = Counter.objects.get_or_create(name='message_id')[0]
-        count = message_id_counter.count
-        message_id_counter.count += 1
-        message_id_counter.save()
-        return str(count)
-
-    def create_xml(self):
-        """Create the xml used as the body of the lti communication."""
+        """Get the next message_id, see `reserve_message_ids`."""
+        return cls.reserve_message_ids(1)[0]
+
+    @staticmethod
+    def reserve_message_ids(n):
+        """Reserve n message_ids from the message_id sequence.
+
+        Sequence values are never handed out twice, not even to concurrent transactions which are rolled back, and
+        are allocated without locking a row.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT nextval(%s) FROM generate_series(1, %s)', [MESSAGE_ID_SEQUENCE, n])
+            return [str(message_id) for message_id, in cursor.fetchall()]
+
+    def create_xml(self, message_id=None):
+        """Create the xml used as the body of the lti communication, a new message_id is used if none is given."""
         root = ET.Element(
             'imsx_POXEnvelopeRequest',
             xmlns='http://www.imsglobal.org/services/ltiv1p1/xsd/imsoms_v1p0'
@@ -51,7 +69,7 @@ class GradePassBackRequest(object):
         imsx_version = ET.SubElement(head_info, 'imsx_version')
         imsx_version.text = 'V1.0'
         msg_id = ET.SubElement(head_info, 'imsx_messageIdentifier')
-        msg_id.text = GradePassBackRequest.get_message_id_and_increment()
+        msg_id.text = message_id or GradePassBackRequest.get_message_id_and_increment()
         body = ET.SubElement(root, 'imsx_POXBody')
         request = ET.SubElement(body, 'replaceResultRequest')
 
@@ -89,6 +107,19 @@ class GradePassBackRequest(object):
 
         return ET.tostring(root, encoding='utf-8')
 
+    def client(self):
+        """Create an oauth client, which keeps its connection to the LMS alive between requests."""
+        return oauth2.Client(oauth2.Consumer(self.key, self.secret), timeout=settings.LTI_PASSBACK_TIMEOUT)
+
+    def response(self, content):
+        """Create the response dictionary from the content returned by the lti instance."""
+        return {
+            'user': self.author.user.username,
+            'grade': 'NOT UPDATED' if self.score is None else self.score,
+            'result_data': self.result_data,
+            **self.parse_return_xml(content),
+        }
+
     def send_post_request(self):
         """
         Send the grade replace post request.
@@ -96,22 +127,17 @@ class GradePassBackRequest(object):
         returns response dictionary with status of request
         """
         if self.url is not None and self.sourcedid is not None:
-            consumer = oauth2.Consumer(
-                self.key, self.secret
-            )
-            client = oauth2.Client(consumer)
-            _, content = client.request(
+            _, content = self.client().request(
                 self.url,
                 'POST',
                 body=self.create_xml(),
                 headers={'Content-Type': 'application/xml'}
             )
-            return {
-                'user': self.author.user.username,
-                'grade': 'NOT UPDATED' if self.score is None else self.score,
-                'result_data': self.result_data,
-                **self.parse_return_xml(content),
-            }
+            return self.response(content)
+        return self.no_url_response()
+
+    @staticmethod
+    def no_url_response():
         return {
             'severity': 'status',
             'code_mayor': 'No grade passback url set',
@@ -153,3 +179,93 @@ class GradePassBackRequest(object):
 
         return {'severity': severity, 'code_mayor': code_mayor,
                 'description': description}
+
+
+def _post(client, url, body, attempts, backoff):
+    """Post the body, retrying connection errors, timeouts and transient LMS responses with exponential backoff.
+
+    returns the response content or None, a description of the last error and the number of retries
+    """
+    for attempt in range(attempts):
+        if attempt:
+            time.sleep(backoff * 2 ** (attempt - 1))
+        try:
+            response, content = client.request(url, 'POST', body=body, headers={'Content-Type': 'application/xml'})
+        except (socket.error, httplib2.HttpLib2Error) as e:
+            error = '{}: {}'.format(e.__class__.__name__, e)
+            continue
+
+        if response.status in TRANSIENT_STATUSES:
+            error = 'LMS responded with status {}'.format(response.status)
+            continue
+        if response.status >= 400:
+            return None, 'LMS responded with status {}'.format(response.status), attempt
+        return content, None, attempt
+
+    return None, error, attempts - 1
+
+
+def send_post_requests(grade_requests, workers_per_host=None, attempts=None, backoff=None):
+    """Send the grade passback requests concurrently, see `GradePassBackRequest.send_post_request`.
+
+    At most `workers_per_host` requests are sent to the same LMS host at once, every worker reuses a single keep-alive
+    connection. Defaults to the LTI_PASSBACK_WORKERS_PER_HOST, LTI_PASSBACK_ATTEMPTS and LTI_PASSBACK_BACKOFF settings.
+    The request bodies are created and the responses parsed in the calling thread, as they require the database.
+
+    returns the responses in order of the requests, and a report summarizing the passback
+    """
+    workers_per_host = workers_per_host or settings.LTI_PASSBACK_WORKERS_PER_HOST
+    attempts = attempts or settings.LTI_PASSBACK_ATTEMPTS
+    backoff = settings.LTI_PASSBACK_BACKOFF if backoff is None else backoff
+
+    start = time.perf_counter()
+    grade_requests = list(grade_requests)
+    sendable = [request.url is not None and request.sourcedid is not None for request in grade_requests]
+    message_ids = iter(GradePassBackRequest.reserve_message_ids(sum(sendable)))
+    bodies = [
+        request.create_xml(next(message_ids)) if can_send else None
+        for request, can_send in zip(grade_requests, sendable)
+    ]
+    hosts = [urlparse(request.url).netloc if body else None for request, body in zip(grade_requests, bodies)]
+
+    clients = threading.local()
+
+    def post(request, body):
+        if not hasattr(clients, 'client'):
+            clients.client = request.client()
+        return _post(clients.client, request.url, body, attempts, backoff)
+
+    with ExitStack() as stack:
+        executors = {
+            host: stack.enter_context(ThreadPoolExecutor(max_workers=workers_per_host))
+            for host in set(hosts) if host is not None
+        }
+        futures = [
+            executors[host].submit(post, request, body) if host is not None else None
+            for request, body, host in zip(grade_requests, bodies, hosts)
+        ]
+        results = [future.result() if future is not None else None for future in futures]
+
+    responses = []
+    report = {'requests': len(grade_requests), 'sent': 0, 'successful': 0, 'failed': 0, 'retries': 0}
+    for request, result in zip(grade_requests, results):
+        if result is None:
+            responses.append(request.no_url_response())
+            continue
+
+        content, error, retries = result
+        report['sent'] += 1
+        report['retries'] += retries
+        if error is None:
+            try:
+                responses.append(request.response(content))
+            except ET.ParseError:
+                error = 'LMS responded with invalid xml'
+        if error is not None:
+            responses.append({'severity': 'error', 'code_mayor': 'failure', 'description': error})
+        report['successful' if responses[-1]['code_mayor'] == 'success' else 'failed'] += 1
+
+    report['hosts'] = {host: hosts.count(host) for host in executors}
+    report['seconds'] = time.perf_counter() - start
+
+    return responses, report
@@ -3,11 +3,12 @@ from urllib.parse import urljoin
 import oauth2
 import sentry_sdk
 from django.conf import settings
+from django.utils.functional import cached_property
 
 import VLE.factory as factory
 import VLE.utils.generic_utils as utils
-import VLE.utils.grading as grading
-from VLE.models import Assignment, AssignmentParticipation, Course, Group, Instance, Journal, Participation, Role, User
+from VLE.models import (Assignment, AssignmentParticipation, Course, Group, Instance, Journal, Participation,
+                        PendingPassback, Role, User)
 from VLE.utils.authentication import set_sentry_user_scope
 
 
@@ -72,21 +73,77 @@ def get_user_lti(request):
     """Check if a user with the lti_id exists"""
     lti_user_id = request['user_id']
 
-    users = User.objects.filter(lti_id=lti_user_id)
-    if users.exists():
-        user = users.first()
-        set_sentry_user_scope(user)
-        if 'custom_user_image' in request and \
-           Instance.objects.get_or_create(pk=1)[0].default_lms_profile_picture not in request['custom_user_image']:
-            user.profile_picture = request['custom_user_image']
-            user.save()
+    user = User.objects.filter(lti_id=lti_user_id).first()
+    if user is None:
+        return None
+
+    set_sentry_user_scope(user)
+    changed = False
+    if (
+        'custom_user_image' in request and request['custom_user_image'] != user.profile_picture and
+        Instance.objects.get_or_create(pk=1)[0].default_lms_profile_picture not in request['custom_user_image']
+    ):
+        user.profile_picture = request['custom_user_image']
+        changed = True
+
+    # NOTE: Canvas can also provide Institution wide roles, we should use this in stead of just any teacher role
+    if (
+        not user.is_teacher and 'roles' in request and
+        any(lti_role in roles_to_list(request) for lti_role in settings.ROLES['Teacher'])
+    ):
+        user.is_teacher = True
+        changed = True
+
+    if changed:
+        user.save()
+    return user
 
-        # NOTE: Canvas can also provide Institution wide roles, we should use this in stead of just any teacher role
-        if 'roles' in request and any(lti_role in roles_to_list(request) for lti_role in settings.ROLES['Teacher']):
-            user.is_teacher = True
-            user.save()
-        return user
-    return None
+
+class LaunchContext(object):
+    """The course, assignment, participation, groups and assignment participation an LTI launch operates on.
+
+    Each is loaded at most once per launch, so the steps of the launch share them instead of querying them again.
+    Linking the user to the course sets the new participation on the context.
+    """
+    def __init__(self, request, user):
+        self.request = request
+        self.user = user
+
+    @cached_property
+    def participation(self):
+        """The participation of the user in the course, with its course and groups loaded."""
+        course_lti_id = self.request.get('custom_course_id', None)
+        if course_lti_id is None or self.user is None:
+            return None
+        return Participation.objects.filter(user=self.user, course__active_lti_id=course_lti_id).select_related(
+            'course').prefetch_related('groups').first()
+
+    @cached_property
+    def course(self):
+        if self.participation is not None:
+            return self.participation.course
+
+        course_lti_id = self.request.get('custom_course_id', None)
+        if course_lti_id is None:
+            return None
+        # There can only be one actively linked course.
+        return Course.objects.filter(active_lti_id=course_lti_id).first()
+
+    @cached_property
+    def author(self):
+        """The assignment participation of the user, with its assignment and journal loaded."""
+        if self.user is None:
+            return None
+        # Assignment and lti_id_set values are unique together (no two assignments set contain the same lti id)
+        return AssignmentParticipation.objects.filter(
+            user=self.user, assignment__lti_id_set__contains=[self.request['custom_assignment_id']],
+        ).select_related('assignment', 'journal').first()
+
+    @cached_property
+    def assignment(self):
+        if self.author is not None:
+            return self.author.assignment
+        return Assignment.objects.filter(lti_id_set__contains=[self.request['custom_assignment_id']]).first()
 
 
 def create_lti_query_link(query):
@@ -114,12 +171,17 @@ def add_groups_if_not_exists(participation, group_ids):
         else:
             return 'Group {:d}'.format(n_groups + i + 1)
 
+    # Nothing to add if the participant is already in all groups passed by lti
+    participating_groups = participation.groups.all()
+    if set(group_ids) <= {group.lti_id for group in participating_groups}:
+        return participation.groups
+
     # Get all existing groups passed by lti that are also in the course
-    groups = Group.objects.filter(lti_id__in=group_ids, course=participation.course)
+    groups = Group.objects.filter(lti_id__in=group_ids, course=participation.course_id)
     # Get all to-be-created groups
     non_existing_group_ids = set(group_ids) - set(group.lti_id for group in groups)
     # Get the groups of the course which the user is not participating in
-    non_participating_groups = groups.exclude(pk__in=participation.groups.all())
+    non_participating_groups = [group for group in groups if group not in participating_groups]
 
     # Create new groups
     if non_existing_group_ids:
@@ -161,7 +223,7 @@ def _make_lti_participation(user, course, lti_role):
         user, course, Role.objects.get(name='Student', course=course), notify_user=False)
 
 
-def update_lti_course_if_exists(request, user, role):
+def update_lti_course_if_exists(request, user, role, context=None):
     """Update a course with lti request.
 
     If no course exists, return None
@@ -170,23 +232,20 @@ def update_lti_course_if_exists(request, user, role):
     2. Put the user in the course
     3. Add groups to the user
     """
-    course_lti_id = request.get('custom_course_id', None)
-    course = Course.objects.filter(active_lti_id=course_lti_id)
-    if course_lti_id is None or not course.exists():
+    context = context or LaunchContext(request, user)
+    course = context.course
+    if course is None:
         return None
 
-    # There can only be one actively linked course.
-    course = course.first()
-
     # Can only have one active test student per course at a time.
     if user.is_test_student:
         User.objects.filter(participation__course=course, is_test_student=True).exclude(pk=user.pk).delete()
 
     # If the user not is a participant, add participation with possibly the role given by the LTI instance.
-    if not user.is_participant(course):
+    participation = context.participation
+    if participation is None:
         participation = _make_lti_participation(user, course, role)
-    else:
-        participation = Participation.objects.get(course=course, user=user)
+        context.participation = participation
 
     group_ids, = utils.optional_params(request, 'custom_section_id')
     if group_ids:
@@ -195,21 +254,18 @@ def update_lti_course_if_exists(request, user, role):
     return course
 
 
-def update_lti_assignment_if_exists(request):
+def update_lti_assignment_if_exists(request, context=None):
     """Update a course with lti request.
 
     If no course exists, return None
     If it does exist:
         Update the published state
     """
-    assign_id = request['custom_assignment_id']
-    assignment = Assignment.objects.filter(lti_id_set__contains=[assign_id])
-    if not assignment.exists():
+    context = context or LaunchContext(request, None)
+    assignment = context.assignment
+    if assignment is None:
         return None
 
-    # Assignment and lti_id_set values are unique together (no two assignments set contain the same lti id)
-    assignment = assignment.first()
-
     # Only update is_published when needed, NOTE: this triggers the computedfields on all connected journals
     if 'custom_assignment_publish' in request and assignment.is_published != request['custom_assignment_publish']:
         assignment.is_published = request['custom_assignment_publish']
@@ -217,15 +273,20 @@ def update_lti_assignment_if_exists(request):
     return assignment
 
 
-def select_create_journal(request, user, assignment):
+def select_create_journal(request, user, assignment, context=None):
     """
     Select or create the requested journal.
     """
     if assignment is None or user is None:
         return None
 
-    author = AssignmentParticipation.objects.get_or_create(user=user, assignment=assignment)[0]
-    journal = Journal.objects.filter(authors__user=user, assignment=assignment).first()
+    context = context or LaunchContext(request, user)
+    if context.assignment == assignment and context.author is not None:
+        author = context.author
+        journal = author.journal
+    else:
+        author = AssignmentParticipation.objects.get_or_create(user=user, assignment=assignment)[0]
+        journal = Journal.objects.filter(authors__user=user, assignment=assignment).first()
     # Update the grade_url and sourcedid only for the active LMS link.
     if assignment.active_lti_id != request['custom_assignment_id']:
         return journal
@@ -242,7 +303,7 @@ def select_create_journal(request, user, assignment):
     author.save()
 
     if journal:
-        grading.task_author_status_to_LMS.delay(journal.pk, author.pk)
+        PendingPassback.objects.enqueue([journal.pk], author=author.pk)
         journal = Journal.objects.get(pk=journal.pk)
 
     return journal
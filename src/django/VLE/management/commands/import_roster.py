@@ -0,0 +1,44 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from VLE.models import Course
+from VLE.utils.error_handling import VLEBadRequest
+from VLE.utils.roster import BATCH_SIZE, import_roster, parse_roster
+
+
+class Command(BaseCommand):
+    help = 'Imports a CSV or JSON roster of users (username, full_name, email, lti_id, role, groups) into a course.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_id', type=int, help='Course the users are imported into.')
+        parser.add_argument('roster', help='Path of the roster file, a CSV file with a header row or a JSON list.')
+        parser.add_argument(
+            '--format', choices=['csv', 'json'], help='Format of the roster (default: derived from the extension).')
+        parser.add_argument(
+            '--no-notify', action='store_true', help='Do not notify the new participants of the course.')
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE, help='Number of users imported per transaction.')
+
+    def handle(self, *args, **options):
+        try:
+            course = Course.objects.get(pk=options['course_id'])
+        except Course.DoesNotExist:
+            raise CommandError('Course {} does not exist.'.format(options['course_id']))
+
+        roster_format = options['format'] or ('json' if os.path.splitext(options['roster'])[1] == '.json' else 'csv')
+        with open(options['roster'], encoding='utf-8-sig', newline='') as roster:
+            content = roster.read()
+
+        def progress(imported, total):
+            self.stdout.write('Imported {} of {} users.'.format(imported, total))
+
+        try:
+            counts = import_roster(course, parse_roster(content, roster_format), notify_users=not options['no_notify'],
+                                   batch_size=options['batch_size'], progress=progress)
+        except VLEBadRequest as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            'Created {users} users, {participations} participations, {groups} groups and {memberships} group '
+            'memberships, updated {roles} roles.'.format(**counts)))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from VLE.models import Counter, PendingPassback
+
+
+class Command(BaseCommand):
+    help = 'Reports the number of requested, sent and coalesced grade passbacks, and the number still pending.'
+
+    def handle(self, *args, **options):
+        counts = dict(Counter.objects.filter(
+            name__in=['passback_requests', 'passback_sends']).values_list('name', 'count'))
+        requests = counts.get('passback_requests', 0)
+        sends = counts.get('passback_sends', 0)
+        ratio = (requests - sends) / requests if requests else 0
+        self.stdout.write('Requested: {}, sent: {}, coalesced: {} ({:.2%}), pending: {}'.format(
+            requests, sends, requests - sends, ratio, PendingPassback.objects.count()))
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from VLE.permissions import get_permission_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Reports the number of hits and misses of the cross request permission cache.'
+
+    def handle(self, *args, **options):
+        if not settings.PERMISSION_CACHE_TIMEOUT:
+            self.stdout.write(self.style.WARNING('The permission cache is disabled, set PERMISSION_CACHE_TIMEOUT.'))
+
+        stats = get_permission_cache_stats()
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total if total else 0
+        self.stdout.write('Hits: {}, misses: {}, hit ratio: {:.2%}'.format(stats['hits'], stats['misses'], ratio))
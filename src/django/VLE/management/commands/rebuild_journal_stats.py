@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Q
+
+from VLE.models import Journal, JournalStats
+
+
+def outdated_journals(journals):
+    """Returns the journals whose stats are missing or differ from the stats computed from their entries and grades."""
+    outdated = Q(stats__isnull=True)
+    for field in JournalStats.FIELDS:
+        outdated |= ~Q(**{'stats__{}'.format(field): F('computed_{}'.format(field))})
+
+    return journals.annotate_computed_stats().filter(outdated)
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the materialized journal stats (grade sum, unpublished and needs marking) and verifies them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true', help='Only report outdated journal stats, without rebuilding them.')
+        parser.add_argument(
+            '--batch-size', type=int, default=500, help='Number of journals whose stats are rebuilt per transaction.')
+
+    def handle(self, *args, **options):
+        journals = Journal.all_objects.all()
+
+        if not options['verify']:
+            missing = journals.filter(stats__isnull=True).values_list('pk', flat=True)
+            JournalStats.objects.bulk_create(
+                [JournalStats(journal_id=pk) for pk in missing], batch_size=options['batch_size'])
+
+            journal_pks = list(journals.order_by('pk').values_list('pk', flat=True))
+            for i in range(0, len(journal_pks), options['batch_size']):
+                Journal.all_objects.filter(pk__in=journal_pks[i:i + options['batch_size']]).refresh_stats()
+            self.stdout.write('Rebuilt the stats of {} journals.'.format(len(journal_pks)))
+
+        outdated = list(outdated_journals(journals).values_list('pk', flat=True))
+        if outdated:
+            raise CommandError('Stats of {} journals are outdated: {}'.format(len(outdated), outdated))
+
+        self.stdout.write(self.style.SUCCESS('All journal stats are up to date.'))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from VLE.models import Journal, Notification
+from VLE.utils.error_handling import VLEParticipationError, VLEProgrammingError
+
+
+class Command(BaseCommand):
+    help = 'Renders the stored title, content and url of notifications created before their text was stored.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500, help='Number of notifications which are rendered per update.')
+        parser.add_argument(
+            '--all', action='store_true', help='Render all notifications again, not only those without text.')
+
+    def handle(self, *args, **options):
+        notifications = Notification.objects.all()
+        if not options['all']:
+            notifications = notifications.filter(title='')
+
+        notification_pks = list(notifications.order_by('pk').values_list('pk', flat=True))
+        failed = []
+        for i in range(0, len(notification_pks), options['batch_size']):
+            pks = notification_pks[i:i + options['batch_size']]
+            batch = list(Notification.objects.filter(pk__in=pks).select_related(
+                'user', 'course', 'assignment', 'journal', 'node__preset__forced_template', 'entry__template',
+                'comment__author'))
+            journals = Journal.objects.with_annotations('name', 'grade').in_bulk(
+                {notification.journal_id for notification in batch if notification.journal_id})
+
+            rendered = []
+            for notification in batch:
+                if notification.journal_id in journals:
+                    notification.annotated_journal = journals[notification.journal_id]
+                try:
+                    notification.render()
+                    rendered.append(notification)
+                except (VLEParticipationError, VLEProgrammingError):
+                    failed.append(notification.pk)
+
+            Notification.objects.bulk_update(rendered, ['title', 'content', 'batch_text', 'url'])
+
+        self.stdout.write('Rendered the text of {} notifications.'.format(len(notification_pks) - len(failed)))
+        if failed:
+            raise CommandError('Text of {} notifications could not be rendered: {}'.format(len(failed), failed))
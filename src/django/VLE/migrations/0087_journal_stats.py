@@ -0,0 +1,61 @@
+# Generated by Django 2.2.19 on 2026-10-17 02:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, FloatField, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def compute_journal_stats(apps, schema_editor):
+    Journal = apps.get_model('VLE', 'Journal')
+    JournalStats = apps.get_model('VLE', 'JournalStats')
+    Entry = apps.get_model('VLE', 'Entry')
+
+    JournalStats.objects.bulk_create(
+        [JournalStats(journal_id=pk) for pk in Journal.all_objects.values_list('pk', flat=True)],
+        batch_size=1000,
+    )
+
+    entries = Entry.objects.filter(node__journal=OuterRef('journal'), is_draft=False).values('node__journal')
+
+    def entry_count(**filters):
+        return Coalesce(Subquery(
+            entries.filter(**filters).annotate(entry_count=Count('pk')).values('entry_count'),
+            output_field=IntegerField(),
+        ), 0)
+
+    JournalStats.objects.update(
+        grade_sum=Coalesce(Subquery(
+            entries.filter(grade__published=True).annotate(entry_grade_sum=Sum('grade__grade')).values(
+                'entry_grade_sum'),
+            output_field=FloatField(),
+        ), 0),
+        unpublished=entry_count(grade__published=False),
+        needs_marking=entry_count(grade__isnull=True),
+    )
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('VLE', '0086_better_default_demo_instance_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JournalStats',
+            fields=[
+                ('creation_date', models.DateTimeField(auto_now_add=True)),
+                ('update_date', models.DateTimeField(auto_now=True)),
+                ('journal', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='VLE.Journal')),
+                ('grade_sum', models.FloatField(default=0)),
+                ('unpublished', models.IntegerField(default=0)),
+                ('needs_marking', models.IntegerField(default=0)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(compute_journal_stats, reverse_code=lambda apps, schema_editor: None),
+    ]
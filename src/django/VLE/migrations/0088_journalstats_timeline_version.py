@@ -0,0 +1,18 @@
+# Generated by Django 2.2.19 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('VLE', '0087_journal_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='journalstats',
+            name='timeline_version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
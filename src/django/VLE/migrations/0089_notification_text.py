@@ -0,0 +1,33 @@
+# Generated by Django 2.2.19 on 2026-10-17 08:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('VLE', '0088_journalstats_timeline_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='batch_text',
+            field=models.TextField(default=''),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='content',
+            field=models.TextField(default=''),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='title',
+            field=models.TextField(default=''),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='url',
+            field=models.TextField(default=''),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('VLE', '0089_notification_text'),
+    ]
+
+    operations = [
+        # Continue from the message_id counter, the counter is left in place
+        migrations.RunSQL(
+            sql=[
+                'CREATE SEQUENCE vle_lti_message_id MINVALUE 0 START WITH 0',
+                """SELECT setval('vle_lti_message_id', COALESCE(
+                    (SELECT MAX("count") FROM "VLE_counter" WHERE "name" = 'message_id'), 0), false)""",
+            ],
+            reverse_sql=[
+                """UPDATE "VLE_counter" SET "count" = nextval('vle_lti_message_id') WHERE "name" = 'message_id'""",
+                'DROP SEQUENCE vle_lti_message_id',
+            ],
+        ),
+    ]
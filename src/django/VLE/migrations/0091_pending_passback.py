@@ -0,0 +1,34 @@
+# Generated by Django 2.2.19 on 2026-10-17 10:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('VLE', '0090_lti_message_id_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingPassback',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creation_date', models.DateTimeField(auto_now_add=True)),
+                ('update_date', models.DateTimeField(auto_now=True)),
+                ('left_journal', models.BooleanField(default=False)),
+                ('requests', models.IntegerField(default=1)),
+                ('author', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='VLE.AssignmentParticipation')),
+                ('journal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='VLE.Journal')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='pendingpassback',
+            constraint=models.UniqueConstraint(condition=models.Q(author__isnull=True), fields=('journal',), name='unique_pending_journal_passback'),
+        ),
+        migrations.AddConstraint(
+            model_name='pendingpassback',
+            constraint=models.UniqueConstraint(condition=models.Q(author__isnull=False), fields=('journal', 'author', 'left_journal'), name='unique_pending_author_passback'),
+        ),
+    ]
@@ -6,6 +6,7 @@ Database file
 import os
 import random
 import string
+from collections import defaultdict
 from datetime import datetime
 
 from django.conf import settings
@@ -14,19 +15,21 @@ from django.contrib.postgres.aggregates import ArrayAgg, StringAgg
 from django.contrib.postgres.fields import ArrayField, CIEmailField, CITextField
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
-from django.db.models import (Case, CharField, CheckConstraint, Count, F, FloatField, IntegerField, Min, OuterRef,
-                              Prefetch, Q, Subquery, Sum, TextField, Value, When)
+from django.db.models import (Case, CharField, CheckConstraint, Count, Exists, F, FloatField, IntegerField, Min,
+                              OuterRef, Prefetch, Q, Subquery, Sum, TextField, UniqueConstraint, Value, When,
+                              prefetch_related_objects)
 from django.db.models.deletion import CASCADE, SET_NULL
 from django.db.models.functions import Cast, Coalesce
 from django.db.models.query import QuerySet
 from django.dispatch import receiver
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.timezone import now
 
 import VLE.permissions
 import VLE.utils.file_handling as file_handling
 import VLE.utils.generic_utils as generic_utils
-from VLE.tasks.email import send_push_notification
+from VLE.tasks.email import send_push_notification, send_push_notifications
 from VLE.tasks.notifications import (generate_new_assignment_notifications, generate_new_comment_notifications,
                                      generate_new_entry_notifications, generate_new_node_notifications)
 from VLE.utils import sanitization
@@ -348,6 +351,9 @@ class User(AbstractUser):
     def is_participant(self, obj):
         if self.is_superuser:
             return True
+        matrix = VLE.permissions.get_permission_matrix(self)
+        if matrix and isinstance(obj, (Course, Assignment)):
+            return matrix.is_participant(obj)
         if isinstance(obj, Course):
             return Course.objects.filter(pk=obj.pk, users=self).exists()
         if isinstance(obj, Assignment):
@@ -367,13 +373,20 @@ class User(AbstractUser):
 
         elif isinstance(obj, Assignment):
             if self.is_participant(obj):
-                if self.has_permission('can_have_journal', obj) and obj.assigned_groups.exists() and \
-                   not obj.assigned_groups.filter(participation__user=self).exists():
+                matrix = VLE.permissions.get_permission_matrix(self)
+                if matrix:
+                    is_assigned = matrix.is_assigned_to(obj)
+                else:
+                    is_assigned = not obj.assigned_groups.exists() or \
+                        obj.assigned_groups.filter(participation__user=self).exists()
+                if self.has_permission('can_have_journal', obj) and not is_assigned:
                     return False
                 return obj.is_published or self.has_permission('can_view_unpublished_assignment', obj)
             return False
         elif isinstance(obj, Journal):
-            if not obj.authors.filter(user=self).exists():
+            matrix = VLE.permissions.get_permission_matrix(self)
+            is_author = matrix.is_author_of(obj) if matrix else obj.authors.filter(user=self).exists()
+            if not is_author:
                 return self.has_permission('can_view_all_journals', obj.assignment)
             else:
                 return self.has_permission('can_have_journal', obj.assignment)
@@ -586,6 +599,153 @@ class Preferences(CreateUpdateModel):
         return "Preferences"
 
 
+class NotificationQuerySet(models.QuerySet):
+    def bulk_notify(self, type, recipients, **context):
+        """Creates a notification of the type about the context objects (e.g. comment, entry or node) for each recipient.
+
+        See `bulk_create_notifications`.
+        """
+        if isinstance(recipients, QuerySet):
+            recipients = recipients.only('pk')
+
+        return self.bulk_create_notifications([
+            Notification(type=type, user_id=getattr(recipient, 'pk', recipient), **context) for recipient in recipients
+        ])
+
+    def bulk_create_notifications(self, notifications):
+        """Bulk creates the unsaved notifications, skipping those `Notification.save` would not create.
+
+        The preferences, course visibility and own group rules are evaluated for all notifications in a few queries,
+        the text of the notifications is rendered with their journals loaded at once, push notifications are sent in
+        batches.
+        """
+        notifications = [notification for notification in notifications]
+        if not notifications:
+            return []
+
+        user_pks = {notification.user_id for notification in notifications}
+        preference_fields = {field.name for field in Preferences._meta.get_fields()} & {
+            Notification.TYPES[notification.type]['name'] for notification in notifications}
+        users = {
+            user['pk']: user for user in User.objects.filter(pk__in=user_pks).values(
+                'pk', 'is_superuser', 'preferences__group_only_notifications',
+                *['preferences__{}'.format(field) for field in preference_fields])
+        }
+
+        def email_preference(notification):
+            return users[notification.user_id].get(
+                'preferences__{}'.format(Notification.TYPES[notification.type]['name']))
+
+        # Should not create a notification if notifications are off for this type
+        notifications = [
+            notification for notification in notifications
+            if notification.user_id in users and email_preference(notification) != Preferences.OFF
+        ]
+
+        assignments = {}
+        for notification in notifications:
+            notification.resolve_context()
+            if notification.assignment:
+                notification.assignment = assignments.setdefault(notification.assignment.pk, notification.assignment)
+        prefetch_related_objects(list(assignments.values()), 'courses')
+
+        participations = set(Participation.objects.filter(
+            user__in=user_pks,
+            course__in=[course.pk for assignment in assignments.values() for course in assignment.courses.all()] + [
+                notification.course_id for notification in notifications if notification.course_id],
+        ).values_list('user', 'course'))
+
+        def can_view(user_pk, course):
+            return users[user_pk]['is_superuser'] or course is not None and (user_pk, course.pk) in participations
+
+        lti_courses = {}
+        for notification in notifications:
+            if notification.assignment:
+                # Should get the active lti course if there is an active LTI link, else the normal procedure
+                if notification.assignment.active_lti_id:
+                    if notification.assignment.pk not in lti_courses:
+                        lti_courses[notification.assignment.pk] = notification.assignment.get_active_lti_course()
+                    notification.course = lti_courses[notification.assignment.pk]
+                else:
+                    notification.course = notification.assignment.get_active_course_from(
+                        lambda course: can_view(notification.user_id, course))
+
+        # Should not create notifications for courses that the user cannot see
+        notifications = [
+            notification for notification in notifications if can_view(notification.user_id, notification.course)]
+
+        # Should not create a notification as user only wants notification from within their group
+        group_only = [
+            notification for notification in notifications
+            if notification.type in Notification.OWN_GROUP_TYPES and
+            users[notification.user_id]['preferences__group_only_notifications']
+        ]
+        if group_only:
+            outside_own_groups = self._outside_own_groups(group_only)
+            notifications = [
+                notification for notification in notifications
+                if (notification.user_id, notification.journal_id) not in outside_own_groups
+            ]
+
+        journals = Journal.objects.with_annotations('name', 'grade').in_bulk(
+            {notification.journal_id for notification in notifications if notification.journal_id})
+        for notification in notifications:
+            if notification.journal_id in journals:
+                notification.annotated_journal = journals[notification.journal_id]
+            notification.render()
+
+        notifications = super().bulk_create(notifications)
+
+        # Send notification on creation if user preference is set to push
+        push = [notification.pk for notification in notifications if email_preference(notification) == Preferences.PUSH]
+        for i in range(0, len(push), Notification.PUSH_BATCH_SIZE):
+            send_push_notifications.apply_async(
+                args=[push[i:i + Notification.PUSH_BATCH_SIZE]], countdown=settings.WEBSERVER_TIMEOUT)
+
+        return notifications
+
+    def _outside_own_groups(self, notifications):
+        """Returns the (user, journal) pairs of the notifications about a journal outside the groups of the user.
+
+        Equivalent to `Notification.has_journal_in_own_groups` for users with users in their own groups.
+        NOTE: notifications are still created if there are no users in any groups
+        """
+        assignments = {notification.assignment.pk: notification.assignment for notification in notifications}
+        courses = {
+            assignment.pk: {course.pk for course in assignment.courses.all()} for assignment in assignments.values()}
+
+        user_groups = defaultdict(set)
+        for user, course, group in Participation.groups.through.objects.filter(
+            participation__user__in={notification.user_id for notification in notifications},
+            participation__course__in=set().union(*courses.values()),
+        ).values_list('participation__user', 'participation__course', 'group'):
+            user_groups[user].add((course, group))
+
+        group_users = defaultdict(set)
+        for group, user in Participation.groups.through.objects.filter(
+                group__in={group for groups in user_groups.values() for _, group in groups}).values_list(
+                'group', 'participation__user'):
+            group_users[group].add(user)
+
+        journal_users = defaultdict(set)
+        assignment_users = defaultdict(set)
+        for journal, assignment, user in Journal.objects.with_annotations('minimal').filter(
+                assignment__in=assignments.keys()).values_list('pk', 'assignment', 'authors__user'):
+            journal_users[journal].add(user)
+            assignment_users[assignment].add(user)
+
+        outside = set()
+        for notification in notifications:
+            users_in_own_groups = set().union(*[
+                group_users[group] for course, group in user_groups[notification.user_id]
+                if course in courses[notification.assignment.pk]
+            ]) & assignment_users[notification.assignment.pk]
+            if users_in_own_groups and not users_in_own_groups & journal_users[notification.journal_id]:
+                outside.add((notification.user_id, notification.journal_id))
+
+        return outside
+
+
 class Notification(CreateUpdateModel):
     NEW_COURSE = 'COURSE'
     NEW_ASSIGNMENT = 'ASSIGNMENT'
@@ -675,6 +835,11 @@ class Notification(CreateUpdateModel):
 
     OWN_GROUP_TYPES = {NEW_ENTRY, NEW_COMMENT, NEW_JOURNAL_IMPORT_REQUEST}
 
+    # Number of push notifications sent per task
+    PUSH_BATCH_SIZE = 100
+
+    objects = models.Manager.from_queryset(NotificationQuerySet)()
+
     type = models.CharField(
         max_length=10,
         choices=((type, dic['name']) for type, dic in TYPES.items()),
@@ -730,9 +895,29 @@ class Notification(CreateUpdateModel):
         null=True,
     )
 
+    # Text of the notification, rendered on creation, see `render`
+    title = models.TextField(
+        default='',
+    )
+    content = models.TextField(
+        default='',
+    )
+    # Content used when the notification is batched, with {n} left to be filled in
+    batch_text = models.TextField(
+        default='',
+    )
+    url = models.TextField(
+        default='',
+    )
+
+    @cached_property
+    def annotated_journal(self):
+        """The journal of the notification, annotated with the name and grade used in the notification text."""
+        return Journal.objects.with_annotations('name', 'grade').get(pk=self.journal.pk)
+
     def _fill_text(self, text, n=None):
         if self.journal:
-            journal = Journal.objects.get(pk=self.journal.pk)
+            journal = self.annotated_journal
 
         node_name = None
         if self.node:
@@ -752,25 +937,38 @@ class Notification(CreateUpdateModel):
             n=n,
         )
 
-    @property
-    def title(self):
-        return self._fill_text(self.TYPES[self.type]['content']['title'])
-
-    @property
-    def content(self):
-        return self._fill_text(self.TYPES[self.type]['content']['content'])
+    def render(self):
+        """Renders the title, content, batch content and url of the notification, which are stored along."""
+        content = self.TYPES[self.type]['content']
+        self.title = self._fill_text(content['title'])
+        self.content = self._fill_text(content['content'])
+        self.batch_text = self._fill_text(content['batch_content'], n='{n}') if 'batch_content' in content else ''
+        # The user is only needed to find the course, which is known for all newly created notifications
+        self.url = gen_url(
+            node=self.node, journal=self.journal, assignment=self.assignment, course=self.course,
+            user=self.user if self.course is None else None)
 
     @property
     def button_text(self):
         return Notification.TYPES[self.type]['content']['button_text']
 
     def batch_content(self, n=None):
-        return self._fill_text(self.TYPES[self.type]['content']['batch_content'], n=n)
-
-    @property
-    def url(self):
-        return gen_url(
-            node=self.node, journal=self.journal, assignment=self.assignment, course=self.course, user=self.user)
+        return self.batch_text.replace('{n}', str(n))
+
+    def resolve_context(self):
+        """Sets the entry, node, journal and assignment of the notification, derived from its most specific object."""
+        if self.comment:
+            self.entry = self.comment.entry
+        elif self.grade:
+            self.entry = self.grade.entry
+        if self.entry:
+            self.node = self.entry.node
+        if self.node:
+            self.journal = self.node.journal
+        if self.jir:
+            self.journal = self.jir.target
+        if self.journal:
+            self.assignment = self.journal.assignment
 
     def has_journal_in_own_groups(self):
         """Checks if a notification is from a user that is connected to the notification user via a group"""
@@ -788,18 +986,7 @@ class Notification(CreateUpdateModel):
 
         is_new = self._state.adding
         if is_new:
-            if self.comment:
-                self.entry = self.comment.entry
-            elif self.grade:
-                self.entry = self.grade.entry
-            if self.entry:
-                self.node = self.entry.node
-            if self.node:
-                self.journal = self.node.journal
-            if self.jir:
-                self.journal = self.jir.target
-            if self.journal:
-                self.assignment = self.journal.assignment
+            self.resolve_context()
             if self.assignment:
                 # Should get the active lti course if there is an active LTI link, else the normal procedure
                 if self.assignment.active_lti_id:
@@ -816,6 +1003,9 @@ class Notification(CreateUpdateModel):
            and self.assignment.has_users_in_own_groups(self.user) and not self.has_journal_in_own_groups():
             return
 
+        if is_new:
+            self.render()
+
         super(Notification, self).save(*args, **kwargs)
 
         if is_new:
@@ -1056,6 +1246,58 @@ class Role(CreateUpdateModel):
         unique_together = ('name', 'course',)
 
 
+class ParticipationQuerySet(models.QuerySet):
+    def bulk_create(self, participations, *args, notify_users=True, **kwargs):
+        """Bulk creates the participations, equivalent to `Participation.save` for each new participation.
+
+        The users are connected to the assignments of their new course they are not connected to yet, the assignment
+        participations (and their journals) are created per kind of assignment with
+        `AssignmentParticipationQuerySet.bulk_create`.
+        When {notify_users} the users are notified of their new course, except for the course author.
+        """
+        participations = list(participations)
+        with transaction.atomic():
+            participations = super().bulk_create(participations, *args, **kwargs)
+            user_pks = {participation.user_id for participation in participations}
+            VLE.permissions.clear_permission_matrices()
+            if settings.PERMISSION_CACHE_TIMEOUT:
+                VLE.permissions.invalidate_permission_cache(user_pks)
+
+            course_assignments = {}
+            for course, assignment in Assignment.courses.through.objects.filter(
+                    course__in={participation.course_id for participation in participations}).values_list(
+                    'course', 'assignment'):
+                course_assignments.setdefault(course, set()).add(assignment)
+            assignments = Assignment.objects.in_bulk(set().union(*course_assignments.values()))
+            existing = set(AssignmentParticipation.objects.filter(
+                user__in=user_pks, assignment__in=assignments.keys()).values_list('user', 'assignment'))
+
+            # Equivalent to `AssignmentParticipation.save`, journals are only created for published individual
+            # assignments, and only users of published assignments are notified
+            aps = {(True, True): [], (True, False): [], (False, False): []}
+            for participation in participations:
+                for pk in course_assignments.get(participation.course_id, []):
+                    if (participation.user_id, pk) not in existing:
+                        existing.add((participation.user_id, pk))
+                        assignment = assignments[pk]
+                        kind = (assignment.is_published, assignment.is_published and not assignment.is_group_assignment)
+                        aps[kind].append(AssignmentParticipation(assignment=assignment, user_id=participation.user_id))
+            for (is_published, create_journals), kind_aps in aps.items():
+                AssignmentParticipation.objects.bulk_create(
+                    kind_aps, create_missing_journals=create_journals, new_assignment_notification=is_published)
+
+            if notify_users:
+                courses = Course.objects.in_bulk({participation.course_id for participation in participations})
+                course_users = {}
+                for participation in participations:
+                    if participation.user_id != courses[participation.course_id].author_id:
+                        course_users.setdefault(participation.course_id, []).append(participation.user_id)
+                for course, users in course_users.items():
+                    Notification.objects.bulk_notify(Notification.NEW_COURSE, users, course=courses[course])
+
+            return participations
+
+
 class Participation(CreateUpdateModel):
     """Participation.
 
@@ -1063,6 +1305,8 @@ class Participation(CreateUpdateModel):
     The user is now linked to the course, and has a set of permissions
     associated with its role.
     """
+    objects = models.Manager.from_queryset(ParticipationQuerySet)()
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     role = models.ForeignKey(
@@ -1089,11 +1333,7 @@ class Participation(CreateUpdateModel):
             for assignment in Assignment.objects.filter(courses__in=[self.course]).exclude(pk__in=existing):
                 AssignmentParticipation.objects.create(assignment=assignment, user=self.user)
             if notify_user and self.user != self.course.author:
-                Notification.objects.create(
-                    type=Notification.NEW_COURSE,
-                    user=self.user,
-                    course=self.course
-                )
+                Notification.objects.bulk_notify(Notification.NEW_COURSE, [self.user], course=self.course)
 
     class Meta:
         """Meta data for the model: unique_together."""
@@ -1110,6 +1350,34 @@ class Participation(CreateUpdateModel):
             self.user.to_string(user=user), self.course.to_string(user=user), self.role.to_string(user=user))
 
 
+class AssignmentQuerySet(models.QuerySet):
+    def with_permission(self, user, permission):
+        """Filters the assignments where the user has the given permission in any of the courses of the assignment."""
+        return self.filter(pk__in=Assignment.courses.through.objects.filter(
+            course__in=Role.objects.filter(role__user=user, **{permission: True}).values('course'),
+        ).values('assignment'))
+
+    def viewable_by(self, user):
+        """Filters the assignments the user can view, equivalent to `User.can_view` for each assignment."""
+        if user.is_superuser:
+            return self
+
+        def with_permission(permission):
+            return Q(pk__in=Assignment.objects.with_permission(user, permission).values('pk'))
+
+        # Users with a journal, can only view assignments assigned to specific groups when in one of those groups
+        unassigned = Q(pk__in=Assignment.assigned_groups.through.objects.values('assignment')) & ~Q(
+            pk__in=Assignment.assigned_groups.through.objects.filter(
+                group__participation__user=user).values('assignment'))
+
+        return self.filter(
+            Q(is_published=True) | with_permission('can_view_unpublished_assignment'),
+            pk__in=Assignment.courses.through.objects.filter(course__participation__user=user).values('assignment'),
+        ).exclude(
+            with_permission('can_have_journal') & ~with_permission('can_view_all_journals') & unassigned,
+        )
+
+
 class Assignment(CreateUpdateModel):
     """Assignment.
 
@@ -1137,6 +1405,8 @@ class Assignment(CreateUpdateModel):
         on_delete=models.SET_NULL,
         null=True
     )
+    objects = models.Manager.from_queryset(AssignmentQuerySet)()
+
     is_published = models.BooleanField(default=False)
     points_possible = models.FloatField(
         'points_possible',
@@ -1193,7 +1463,7 @@ class Assignment(CreateUpdateModel):
         if user is not None:
             courses = courses.filter(users=user)
         if journals_only:
-            users = Journal.objects.filter(assignment=self).values('authors__user')
+            users = Journal.objects.with_annotations('minimal').filter(assignment=self).values('authors__user')
         else:
             users = self.assignmentparticipation_set.values('user')
         return User.objects.filter(participations__in=courses, pk__in=users).distinct()
@@ -1416,6 +1686,7 @@ class Assignment(CreateUpdateModel):
         )
         for ap, journal in zip(aps, journals):
             ap.journal = journal
+        VLE.permissions.clear_permission_matrices()
         return AssignmentParticipation.objects.bulk_update(aps, ['journal'])
 
     def handle_active_lti_id_modified(self):
@@ -1465,11 +1736,6 @@ class Assignment(CreateUpdateModel):
         Compatible with prefetched courses.
         Will trigger N permission queries for N courses.
         """
-        # If there are no courses connected, return none
-        courses = self.courses.all()
-        if not self.courses:
-            return None
-
         can_view_course_map = {}
 
         def cached_can_view_courses(course):
@@ -1477,10 +1743,23 @@ class Assignment(CreateUpdateModel):
                 can_view_course_map[course] = user.can_view(course)
             return can_view_course_map[course]
 
+        return self.get_active_course_from(cached_can_view_courses)
+
+    def get_active_course_from(self, can_view_course):
+        """"
+        Retrieves the course which is most relevant to the assignment, of the courses accepted by `can_view_course`.
+
+        Compatible with prefetched courses.
+        """
+        # If there are no courses connected, return none
+        courses = self.courses.all()
+        if not self.courses:
+            return None
+
         # Get matching LTI course if possible
         for course in courses:
             if self.active_lti_id in course.assignment_lti_id_set:
-                if cached_can_view_courses(course):
+                if can_view_course(course):
                     return course
 
         courses_with_startdate = [course for course in courses if course.startdate]
@@ -1490,21 +1769,21 @@ class Assignment(CreateUpdateModel):
         comparison = [course for course in courses_with_startdate if course.startdate <= now]
         comparison.sort(key=lambda x: x.startdate, reverse=True)
         for course in comparison:
-            if cached_can_view_courses(course):
+            if can_view_course(course):
                 return course
 
         # Else get the course that starts the soonest
         comparison = [course for course in courses_with_startdate if course.startdate > now]
         comparison.sort(key=lambda x: x.startdate)
         for course in comparison:
-            if cached_can_view_courses(course):
+            if can_view_course(course):
                 return course
 
         # Else get the first course without start date
         comparison = [course for course in courses if course.startdate is None]
         comparison.sort(key=lambda x: x.pk)
         for course in comparison:
-            if cached_can_view_courses(course):
+            if can_view_course(course):
                 return course
 
         return None
@@ -1623,13 +1902,16 @@ class AssignmentParticipationQuerySet(models.QuerySet):
                     ap.journal = journal
 
             aps = super().bulk_create(aps, *args, **kwargs)
+            VLE.permissions.clear_permission_matrices()
 
             # Generate new assignment notifications
             if new_assignment_notification:
-                generate_new_assignment_notifications.apply_async(
-                    args=[[ap.pk for ap in aps if ap.user != ap.assignment.author]],
-                    countdown=settings.WEBSERVER_TIMEOUT,
-                )
+                ap_pks = [ap.pk for ap in aps if ap.user_id != ap.assignment.author_id]
+                for i in range(0, len(ap_pks), AssignmentParticipation.NOTIFICATION_BATCH_SIZE):
+                    generate_new_assignment_notifications.apply_async(
+                        args=[ap_pks[i:i + AssignmentParticipation.NOTIFICATION_BATCH_SIZE]],
+                        countdown=settings.WEBSERVER_TIMEOUT,
+                    )
             return aps
 
 
@@ -1639,6 +1921,8 @@ class AssignmentParticipation(CreateUpdateModel):
     A user that is connected to an assignment
     this can then be used as a participation for a journal
     """
+    NOTIFICATION_BATCH_SIZE = 500
+
     objects = models.Manager.from_queryset(AssignmentParticipationQuerySet)()
 
     journal = models.ForeignKey(
@@ -1702,6 +1986,7 @@ class JournalQuerySet(models.QuerySet):
     def bulk_create(self, journals, *args, **kwargs):
         with transaction.atomic():
             journals = super().bulk_create(journals, *args, **kwargs)
+            JournalStats.objects.bulk_create([JournalStats(journal=journal) for journal in journals])
 
             # Bulk create nodes
             nodes = []
@@ -1731,105 +2016,117 @@ class JournalQuerySet(models.QuerySet):
         )
 
     def allowed_journals(self):
-        """Filter on only journals with can_have_journal and that are in the assigned to groups"""
+        """
+        Filter on only journals with can_have_journal and that are in the assigned to groups
+
+        Group journals are always allowed. Other journals need an author with a can_have_journal participation in
+        one of the assignment's courses, which is in one of the assigned groups (if the assignment has any).
+        """
+        author_participations = Participation.objects.filter(
+            course__assignment=OuterRef('assignment'),
+            user__assignmentparticipation__journal=OuterRef('pk'),
+            role__can_have_journal=True,
+        )
+
         return self.annotate(
-            p_user=F('assignment__courses__participation__user'),
-            p_group=F('assignment__courses__participation__groups'),
-            can_have_journal=F('assignment__courses__participation__role__can_have_journal')
-        ).filter(
-            # Filter on only can_have_journal
-            Q(assignment__is_group_assignment=True) | Q(p_user__in=F('authors__user'), can_have_journal=True),
+            has_journal_author=Exists(author_participations),
+            has_assigned_groups=Exists(Assignment.assigned_groups.through.objects.filter(
+                assignment=OuterRef('assignment'))),
+            has_assigned_group_author=Exists(author_participations.filter(groups__assignment=OuterRef('assignment'))),
         ).filter(
-            # Filter on only assigned groups
-            Q(assignment__is_group_assignment=True) | Q(p_group__in=F('assignment__assigned_groups')) |
-            Q(assignment__assigned_groups=None),
-        ).annotate(
-            # Reset group, as that could lead to distinct not working
-            p_group=F('pk'), p_user=F('pk'), can_have_journal=F('pk'),
-        ).distinct().order_by('pk')
+            Q(assignment__is_group_assignment=True)
+            | Q(has_journal_author=True, has_assigned_groups=False)
+            | Q(has_assigned_group_author=True)
+        )
 
     def annotate_fields(self):
         """Calls all individual annotations which were used as computed fields."""
-        return (
-            self
-            .annotate_full_names()
-            .annotate_usernames()
-            .annotate_name()
-            .annotate_import_requests()
-            .annotate_image()
-            .annotate_unpublished()
-            .annotate_grade()
-            .annotate_needs_marking()
-            .annotate_needs_lti_link()
-            .annotate_groups()
-        )
+        return self.with_annotations('full')
 
-    def annotate_grade(self):
-        """"Annotates for each journal the rounded published grade sum of all entries as `grade`"""
-        grade_qry = Subquery(
-            Entry.objects.filter(
-                node__journal=OuterRef('pk'),
-                grade__published=True,
-                is_draft=False,
-            ).values(
-                'node__journal',  # NOTE: Could be replaced by Sum(distinct=True) in Django 3.0+
-            ).annotate(
-                entry_grade_sum=Sum('grade__grade'),
-            ).values(
-                'entry_grade_sum',
-            ),
-            output_field=FloatField(),
-        )
+    def with_annotations(self, *fields):
+        """
+        Annotates only the given annotated fields, annotation profiles (see `Journal.ANNOTATION_PROFILES`) can be
+        used instead of listing the fields, e.g. `with_annotations('grade', 'name')` or `with_annotations('minimal')`.
+        """
+        qry = self
+        for field in Journal.expand_annotated_fields(fields):
+            qry = getattr(qry, 'annotate_{}'.format(field))()
+
+        return qry
 
-        return self.annotate(grade=(Round2(F('bonus_points') + Coalesce(grade_qry, 0))))
+    def annotate_grade(self):
+        """"Annotates for each journal the rounded published grade sum of all entries plus bonus points as `grade`"""
+        return self.annotate(grade=(Round2(F('bonus_points') + Coalesce(F('stats__grade_sum'), 0))))
 
     def annotate_unpublished(self):
         """"Annotates for each journal the count of entries which have an unpublished grade as `unpublished`"""
-        unpublished_entries_qry = Subquery(
-            Entry.objects.filter(
-                grade__published=False,
-                node__journal=OuterRef('pk'),
-                is_draft=False,
-            ).values(
-                'node__journal',
-            ).annotate(
-                unpublished_count=Count('pk')
-            ).values(
-                'unpublished_count',
-            ),
-            output_field=IntegerField(),
-        )
-
-        return self.annotate(unpublished=Coalesce(unpublished_entries_qry, 0))
+        return self.annotate(unpublished=Coalesce(F('stats__unpublished'), 0))
 
     def annotate_needs_marking(self):
         """"Annotates for each journal the count of entries which are ungraded as `needs_marking`"""
-        needs_marking_entries_qry = Subquery(
-            Entry.objects.filter(
-                grade__isnull=True,
-                node__journal=OuterRef('pk'),
-                is_draft=False,
-            ).values(
-                'node__journal',
-            ).annotate(
-                needs_marking_count=Count('pk')
-            ).values(
-                'needs_marking_count',
-            ),
-            output_field=IntegerField(),
-        )
+        return self.annotate(needs_marking=Coalesce(F('stats__needs_marking'), 0))
+
+    def annotate_computed_stats(self):
+        """
+        Annotates for each journal the statistics as aggregated from its entries and grades, prefixed by `computed_`.
+
+        Used to (re)build and verify the materialized `JournalStats`, prefer the regular annotations otherwise.
+        """
+        return self.annotate(**{
+            'computed_{}'.format(field): expression
+            for field, expression in JournalStats.computed_fields(journal=OuterRef('pk')).items()
+        })
+
+    def refresh_stats(self):
+        """
+        Recomputes the materialized `JournalStats` of each journal in the queryset.
+
+        The stats rows are locked before they are computed, so concurrent refreshes of the same journal are applied
+        one after the other, each seeing the changes committed by the previous one.
+        As stats are refreshed whenever entries or grades change, the timeline version is bumped as well.
+        """
+        with transaction.atomic():
+            stats = JournalStats.objects.filter(journal__in=self.values('pk'))
+            list(stats.select_for_update().order_by('pk').values_list('pk', flat=True))
+            stats.update(
+                update_date=now(),
+                timeline_version=F('timeline_version') + 1,
+                **JournalStats.computed_fields(journal=OuterRef('journal')),
+            )
+
+    def viewable_by(self, user):
+        """Filters the journals the user can view, equivalent to `User.can_view` for each journal."""
+        if user.is_superuser:
+            return self
 
-        return self.annotate(needs_marking=Coalesce(needs_marking_entries_qry, 0))
+        can_have_journal = Q(assignment__in=Assignment.objects.with_permission(user, 'can_have_journal').values('pk'))
+        can_view_all_journals = Q(
+            assignment__in=Assignment.objects.with_permission(user, 'can_view_all_journals').values('pk'))
+        is_author = Q(pk__in=AssignmentParticipation.objects.filter(user=user, journal__isnull=False).values('journal'))
+
+        return self.filter(
+            (is_author & can_have_journal & ~can_view_all_journals) | (~is_author & can_view_all_journals))
+
+    def bump_timeline_version(self):
+        """Invalidates the serialized timelines of the journals in the queryset, see `VLE.timeline.get_etag`."""
+        JournalStats.objects.filter(journal__in=self.values('pk')).update(
+            timeline_version=F('timeline_version') + 1)
 
     def annotate_import_requests(self):
         """"Annotates for each journal the number of pending JIRs with it as target as `import_requests`"""
-        return self.annotate(
-            import_requests=Count(
-                'import_request_targets',
-                filter=Q(import_request_targets__state=JournalImportRequest.PENDING),
-                distinct=True,
+        return self.annotate(import_requests=Coalesce(Subquery(
+            JournalImportRequest.objects.filter(
+                target=OuterRef('pk'),
+                state=JournalImportRequest.PENDING,
+            ).values(
+                'target',
+            ).annotate(
+                import_requests=Count('pk'),
+            ).values(
+                'import_requests',
             ),
-        )
+            output_field=IntegerField(),
+        ), 0))
 
     def annotate_needs_lti_link(self):
         """
@@ -1897,10 +2194,14 @@ class JournalQuerySet(models.QuerySet):
 
 class JournalManager(models.Manager):
     def get_queryset(self):
+        return self.with_annotations('full')
+
+    def with_annotations(self, *fields):
+        """Allowed journals annotated with only the given fields or profiles, see `JournalQuerySet.with_annotations`"""
         return (
             JournalQuerySet(self.model, using=self._db)
             .allowed_journals()
-            .annotate_fields()
+            .with_annotations(*fields)
         )
 
 
@@ -1928,6 +2229,11 @@ class Journal(CreateUpdateModel):
         'needs_lti_link',
         'groups',
     ]
+    # Named sets of annotated fields, so callers only pay for the (aggregate) annotations they make use of
+    ANNOTATION_PROFILES = {
+        'minimal': [],
+        'full': ANNOTATED_FIELDS,
+    }
 
     assignment = models.ForeignKey(
         'Assignment',
@@ -1970,6 +2276,7 @@ class Journal(CreateUpdateModel):
 
     def remove_author(self, author):
         self.authors.remove(author)
+        VLE.permissions.clear_permission_matrices()
         self.remove_jirs_on_user_remove_from_jounal(author.user)
 
         if self.authors.count() == 0:
@@ -2038,6 +2345,7 @@ class Journal(CreateUpdateModel):
         super(Journal, self).save(*args, **kwargs)
         # On create add preset nodes
         if is_new:
+            JournalStats.objects.create(journal=self)
             self.generate_missing_nodes()
 
     @property
@@ -2060,6 +2368,35 @@ class Journal(CreateUpdateModel):
     def missing_annotated_field(self):
         return any(not hasattr(self, field) for field in self.ANNOTATED_FIELDS)
 
+    @staticmethod
+    def expand_annotated_fields(fields):
+        """Returns the annotated fields described by the given fields and profiles, in `ANNOTATED_FIELDS` order."""
+        expanded = set()
+        for field in fields:
+            if field in Journal.ANNOTATION_PROFILES:
+                expanded.update(Journal.ANNOTATION_PROFILES[field])
+            elif field in Journal.ANNOTATED_FIELDS:
+                expanded.add(field)
+            else:
+                raise VLEProgrammingError('Unknown journal annotation: {}'.format(field))
+
+        return [field for field in Journal.ANNOTATED_FIELDS if field in expanded]
+
+    def fill_annotated_fields(self, *fields):
+        """
+        Sets the given annotated fields or profiles (all by default) which are not yet present on the journal.
+
+        Only the missing fields are queried, in a single query, so this is cheap to call on an annotated journal.
+        """
+        missing = [
+            field for field in self.expand_annotated_fields(fields or ['full']) if not hasattr(self, field)]
+        if missing:
+            values = Journal.all_objects.filter(pk=self.pk).with_annotations(*missing).values(*missing).get()
+            for field, value in values.items():
+                setattr(self, field, value)
+
+        return self
+
     def can_add(self, user):
         """
         Checks wether the provided user can add an entry to the journal
@@ -2093,6 +2430,86 @@ class Journal(CreateUpdateModel):
         return self.name
 
 
+class JournalStats(CreateUpdateModel):
+    """JournalStats.
+
+    Materialized grading statistics of a journal, so listing journals does not require aggregating over all their
+    entries and grades. Kept up to date via `JournalQuerySet.refresh_stats` whenever entries or grades change.
+    - grade_sum: the sum of the published grades of all non draft entries (excluding bonus points).
+    - unpublished: the number of non draft entries which have an unpublished grade.
+    - needs_marking: the number of non draft entries which are ungraded.
+    - timeline_version: incremented whenever anything shown in the timeline of the journal changes.
+    """
+    journal = models.OneToOneField(
+        'Journal',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+    )
+    grade_sum = models.FloatField(
+        default=0,
+    )
+    unpublished = models.IntegerField(
+        default=0,
+    )
+    needs_marking = models.IntegerField(
+        default=0,
+    )
+    timeline_version = models.IntegerField(
+        default=0,
+    )
+
+    FIELDS = ['grade_sum', 'unpublished', 'needs_marking']
+
+    @staticmethod
+    def computed_fields(journal):
+        """
+        Returns the expressions computing each of the statistics from the entries and grades of a journal.
+
+        Args:
+            journal (OuterRef): Reference to the pk of the journal the statistics should be computed for.
+        """
+        def entry_count(**filters):
+            return Coalesce(Subquery(
+                Entry.objects.filter(
+                    node__journal=journal,
+                    is_draft=False,
+                    **filters,
+                ).values(
+                    'node__journal',
+                ).annotate(
+                    entry_count=Count('pk'),
+                ).values(
+                    'entry_count',
+                ),
+                output_field=IntegerField(),
+            ), 0)
+
+        grade_sum_qry = Subquery(
+            Entry.objects.filter(
+                node__journal=journal,
+                grade__published=True,
+                is_draft=False,
+            ).values(
+                'node__journal',  # NOTE: Could be replaced by Sum(distinct=True) in Django 3.0+
+            ).annotate(
+                entry_grade_sum=Sum('grade__grade'),
+            ).values(
+                'entry_grade_sum',
+            ),
+            output_field=FloatField(),
+        )
+
+        return {
+            'grade_sum': Coalesce(grade_sum_qry, 0),
+            'unpublished': entry_count(grade__published=False),
+            'needs_marking': entry_count(grade__isnull=True),
+        }
+
+    def to_string(self, user=None):
+        return "JournalStats"
+
+
 def CASCADE_IF_UNLIMITED_ENTRY_NODE_ELSE_SET_NULL(collector, field, sub_objs, using):
     # NOTE: Either the function is not yet defined or the node type is not defined.
     # Tag Node.FIELD, update hard coded if changed
@@ -2230,6 +2647,9 @@ class Node(CreateUpdateModel):
 
         super(Node, self).save(*args, **kwargs)
 
+        if self.entry_id:
+            Journal.all_objects.filter(pk=self.journal_id).refresh_stats()
+
         # Create a notification for deadline PresetNodes
         if is_new and self.type in [self.ENTRYDEADLINE, self.PROGRESS]:
             for author in self.journal.authors.all():
@@ -2732,6 +3152,9 @@ class Entry(CreateUpdateModel):
 
         super().save(*args, **kwargs)
 
+        if not isinstance(self, TeacherEntry):
+            Journal.all_objects.filter(pk=node.journal_id).refresh_stats()
+
         if self.should_send_new_entry_notification(is_new, was_draft):
             generate_new_entry_notifications.apply_async(
                 args=[self.pk, self.node.pk], countdown=settings.WEBSERVER_TIMEOUT)
@@ -2766,6 +3189,19 @@ class Entry(CreateUpdateModel):
         return "Entry"
 
 
+@receiver(models.signals.pre_delete, sender=Entry)
+def store_journal_of_deleted_entry(sender, instance, **kwargs):
+    """Stores the journal of the entry, as its node might no longer be available once the entry is deleted."""
+    instance.stats_journal_ids = list(Node.objects.filter(entry=instance).values_list('journal', flat=True))
+
+
+@receiver(models.signals.post_delete, sender=Entry)
+def refresh_journal_stats_on_entry_delete(sender, instance, **kwargs):
+    """Updates the stats of the journal the deleted entry belonged to."""
+    if getattr(instance, 'stats_journal_ids', None):
+        Journal.all_objects.filter(pk__in=instance.stats_journal_ids).refresh_stats()
+
+
 class TeacherEntry(Entry):
     """TeacherEntry.
 
@@ -2809,6 +3245,8 @@ class Grade(CreateUpdateModel):
 
     Used to keep a history of grades.
     """
+    NOTIFICATION_BATCH_SIZE = 500
+
     entry = models.ForeignKey(
         'Entry',
         related_name='grade_set',
@@ -2863,6 +3301,80 @@ class Counter(CreateUpdateModel):
     def to_string(self, user=None):
         return self.name + " is on " + self.count
 
+    @staticmethod
+    def increment(name, n=1):
+        """Increments the count of the counter with the name by n, without reading it first."""
+        Counter.objects.get_or_create(name=name)
+        Counter.objects.filter(name=name).update(count=F('count') + n)
+
+
+class PendingPassbackQuerySet(models.QuerySet):
+    def enqueue(self, journals, author=None, left_journal=False):
+        """Requests a grade passback of the journals, or only of the author of the journals.
+
+        Requests for a journal (and author) which is already pending are coalesced into the pending one.
+        """
+        journal_pks = {getattr(journal, 'pk', journal) for journal in journals}
+        if not journal_pks:
+            return
+
+        author_pk = getattr(author, 'pk', author)
+        self.bulk_create([
+            PendingPassback(journal_id=pk, author_id=author_pk, left_journal=left_journal, requests=0)
+            for pk in journal_pks
+        ], ignore_conflicts=True)
+        self.filter(journal__in=journal_pks, author=author_pk, left_journal=left_journal).update(
+            requests=F('requests') + 1)
+
+    def drain(self, before):
+        """Removes and returns the pending passbacks requested first before the given time.
+
+        Rows which are being drained concurrently are skipped.
+        """
+        with transaction.atomic():
+            pending = list(self.select_for_update(skip_locked=True, of=('self',)).filter(
+                creation_date__lte=before).select_related('author__user'))
+            self.filter(pk__in=[passback.pk for passback in pending]).delete()
+
+        return pending
+
+
+class PendingPassback(CreateUpdateModel):
+    """PendingPassback.
+
+    Grade passback to the LMS which is requested, but not yet sent, see `grading.send_pending_passbacks`.
+    - journal: the journal whose grade should be passed back.
+    - author: when set, only the status of this author is passed back, else that of all authors of the journal.
+    - left_journal: whether the author has left the journal.
+    - requests: the number of times the passback was requested while pending.
+    """
+    objects = models.Manager.from_queryset(PendingPassbackQuerySet)()
+
+    journal = models.ForeignKey(
+        'Journal',
+        on_delete=models.CASCADE,
+    )
+    author = models.ForeignKey(
+        'AssignmentParticipation',
+        on_delete=models.CASCADE,
+        null=True,
+    )
+    left_journal = models.BooleanField(
+        default=False,
+    )
+    requests = models.IntegerField(
+        default=1,
+    )
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=['journal'], condition=Q(author__isnull=True), name='unique_pending_journal_passback'),
+            UniqueConstraint(
+                fields=['journal', 'author', 'left_journal'], condition=Q(author__isnull=False),
+                name='unique_pending_author_passback'),
+        ]
+
 
 class TemplateChain(CreateUpdateModel):
     """
@@ -3229,12 +3741,28 @@ class Content(CreateUpdateModel):
         return "Content"
 
 
+class CommentQuerySet(models.QuerySet):
+    def viewable_by(self, user):
+        """Filters the comments the user can view, equivalent to `User.can_view` for each comment."""
+        if user.is_superuser:
+            return self
+
+        can_grade = Q(
+            entry__node__journal__assignment__in=Assignment.objects.with_permission(user, 'can_grade').values('pk'))
+
+        return self.filter(
+            Q(published=True) | can_grade,
+            entry__node__journal__in=Journal.all_objects.viewable_by(user).values('pk'),
+        )
+
+
 class Comment(CreateUpdateModel):
     """Comment.
 
     Comments contain the comments given to the entries.
     It is linked to a single entry with a single author and the comment text.
     """
+    objects = models.Manager.from_queryset(CommentQuerySet)()
 
     entry = models.ForeignKey(
         'Entry',
@@ -3527,3 +4055,78 @@ class EntryCategoryLink(CreateUpdateModel):
         null=True,
         on_delete=models.SET_NULL,
     )
+
+
+def _timeline_journals(instance):
+    """Returns the journals whose timeline (see `VLE.timeline.get_nodes`) serializes the given instance."""
+    if isinstance(instance, Node):
+        return Journal.all_objects.filter(pk=instance.journal_id)
+    if isinstance(instance, TeacherEntry):
+        return Journal.all_objects.filter(node__entry__teacher_entry=instance.pk)
+    if isinstance(instance, (Grade, Content, EntryCategoryLink)):
+        # Teacher entry content is shown as part of the entries copied from it
+        return Journal.all_objects.filter(
+            Q(node__entry=instance.entry_id) | Q(node__entry__teacher_entry=instance.entry_id))
+    if isinstance(instance, (PresetNode, Template)):
+        return Journal.all_objects.filter(assignment__format=instance.format_id)
+    if isinstance(instance, (Field, TemplateCategoryLink)):
+        return Journal.all_objects.filter(assignment__format__template=instance.template_id)
+    if isinstance(instance, Category):
+        return Journal.all_objects.filter(assignment=instance.assignment_id)
+
+    raise VLEProgrammingError('{} is not part of the timeline'.format(type(instance).__name__))
+
+
+def bump_timeline_version(sender, instance, **kwargs):
+    """Bumps the timeline version of the journals affected by the change of the instance."""
+    _timeline_journals(instance).bump_timeline_version()
+
+
+# Entries and grades bump the version of their journal when refreshing the journal stats.
+# Comments are not part of the timeline, so these do not invalidate it.
+for timeline_model in [Node, TeacherEntry, Grade, Content, EntryCategoryLink, PresetNode, Template, Field,
+                       TemplateCategoryLink, Category]:
+    models.signals.post_save.connect(bump_timeline_version, sender=timeline_model)
+    models.signals.post_delete.connect(bump_timeline_version, sender=timeline_model)
+
+
+# Changes to roles, participations and journal authors invalidate the permission matrices loaded by the request
+for permission_model in [Participation, Role, AssignmentParticipation, Journal, Course, Assignment, Group]:
+    models.signals.post_save.connect(VLE.permissions.clear_permission_matrices, sender=permission_model)
+    models.signals.post_delete.connect(VLE.permissions.clear_permission_matrices, sender=permission_model)
+for permission_through_model in [Assignment.courses.through, Assignment.assigned_groups.through,
+                                 Participation.groups.through]:
+    models.signals.m2m_changed.connect(VLE.permissions.clear_permission_matrices, sender=permission_through_model)
+
+
+@receiver(models.signals.post_save, sender=Role)
+def invalidate_role_permission_cache(sender, instance, **kwargs):
+    """Invalidates the cached permissions of the users with the saved role."""
+    if settings.PERMISSION_CACHE_TIMEOUT:
+        VLE.permissions.invalidate_permission_cache(
+            Participation.objects.filter(role=instance).values_list('user', flat=True))
+
+
+@receiver(models.signals.post_save, sender=Participation)
+@receiver(models.signals.post_delete, sender=Participation)
+def invalidate_participation_permission_cache(sender, instance, **kwargs):
+    """Invalidates the cached permissions of the user of the created, deleted or updated participation."""
+    if settings.PERMISSION_CACHE_TIMEOUT:
+        VLE.permissions.invalidate_permission_cache([instance.user_id])
+
+
+@receiver(models.signals.m2m_changed, sender=Assignment.courses.through)
+def invalidate_assignment_courses_permission_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    """Invalidates the cached permissions of the participants of the courses added to or removed from an assignment."""
+    if not settings.PERMISSION_CACHE_TIMEOUT:
+        return
+
+    if action in ['post_add', 'post_remove'] and pk_set:
+        courses = [instance.pk] if reverse else pk_set
+    elif action == 'pre_clear':
+        courses = [instance.pk] if reverse else instance.courses.values_list('pk', flat=True)
+    else:
+        return
+
+    VLE.permissions.invalidate_permission_cache(
+        Participation.objects.filter(course__in=courses).values_list('user', flat=True))
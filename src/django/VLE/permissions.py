@@ -3,11 +3,187 @@ permissions.py.
 
 All the permission functions.
 """
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import BoolOr
+from django.core.cache import cache
+from django.db import transaction
 from django.db.models import Q
+from django.utils.functional import cached_property
 
 import VLE.models
 import VLE.utils.error_handling
 
+# Holds the permission matrices of the request currently handled by the thread, see `PermissionMatrixMiddleware`
+_request_scope = threading.local()
+
+
+PERMISSION_CACHE_STATS = ['hits', 'misses']
+
+
+def _permission_cache_key(user_pk):
+    return 'permissions-{}'.format(user_pk)
+
+
+def _count_permission_cache(stat):
+    key = 'permission-cache-{}'.format(stat)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_permission_cache_stats():
+    """Returns the number of hits and misses of the permission cache, counted by the cache backend."""
+    return {stat: cache.get('permission-cache-{}'.format(stat), 0) for stat in PERMISSION_CACHE_STATS}
+
+
+def invalidate_permission_cache(user_pks):
+    """
+    Removes the cached permissions of the given users.
+
+    The permissions are removed again once the current transaction commits, so permissions loaded by concurrent
+    requests before the change was committed are not kept either.
+    """
+    keys = [_permission_cache_key(pk) for pk in set(user_pks)]
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def _query_course_permissions(user):
+    permissions = [*VLE.models.Role.COURSE_PERMISSIONS, *VLE.models.Role.ASSIGNMENT_PERMISSIONS]
+    courses = {
+        participation['course']: {
+            permission: participation['role__{}'.format(permission)] for permission in permissions
+        }
+        for participation in VLE.models.Participation.objects.filter(user=user).values(
+            'course', *['role__{}'.format(permission) for permission in permissions])
+    }
+
+    assignment_courses = defaultdict(set)
+    for assignment, course in VLE.models.Assignment.courses.through.objects.filter(
+            course__in=courses.keys()).values_list('assignment', 'course'):
+        assignment_courses[assignment].add(course)
+
+    return courses, dict(assignment_courses)
+
+
+def get_course_permissions(user):
+    """
+    Returns the role flags of the user for each of their courses, and the courses of the user linked to each assignment.
+
+    If PERMISSION_CACHE_TIMEOUT is set, these are cached across requests and invalidated whenever roles,
+    participations or the courses of an assignment change. This requires a cache backend shared by all processes.
+    """
+    if not settings.PERMISSION_CACHE_TIMEOUT:
+        return _query_course_permissions(user)
+
+    key = _permission_cache_key(user.pk)
+    permissions = cache.get(key)
+    if permissions is None:
+        _count_permission_cache('misses')
+        permissions = _query_course_permissions(user)
+        cache.set(key, permissions, settings.PERMISSION_CACHE_TIMEOUT)
+    else:
+        _count_permission_cache('hits')
+
+    return permissions
+
+
+class PermissionMatrix:
+    """
+    The course and assignment permissions of a user, loaded once and answered from memory afterwards.
+
+    - courses: for each course the user participates in, the permission flags of the user's role.
+    - assignment_courses: for each assignment of those courses, the courses of the user it is linked to.
+    """
+    def __init__(self, user):
+        self.user = user
+        self.courses, self.assignment_courses = get_course_permissions(user)
+
+    @cached_property
+    def groups(self):
+        """The pks of the groups the user is a member of."""
+        return set(VLE.models.Participation.groups.through.objects.filter(
+            participation__user=self.user).values_list('group', flat=True))
+
+    @cached_property
+    def assigned_groups(self):
+        """For each assignment of the user which is assigned to specific groups, the pks of those groups."""
+        assigned_groups = defaultdict(set)
+        for assignment, group in VLE.models.Assignment.assigned_groups.through.objects.filter(
+                assignment__in=self.assignment_courses.keys()).values_list('assignment', 'group'):
+            assigned_groups[assignment].add(group)
+        return assigned_groups
+
+    @cached_property
+    def journals(self):
+        """The pks of the journals the user is an author of."""
+        return set(VLE.models.AssignmentParticipation.objects.filter(
+            user=self.user, journal__isnull=False).values_list('journal', flat=True))
+
+    def has_course_permission(self, permission, course):
+        return self.courses.get(course.pk, {}).get(permission, False)
+
+    def has_assignment_permission(self, permission, assignment):
+        return any(self.courses[course][permission] for course in self.assignment_courses.get(assignment.pk, []))
+
+    def is_participant(self, obj):
+        if isinstance(obj, VLE.models.Course):
+            return obj.pk in self.courses
+        return obj.pk in self.assignment_courses
+
+    def is_assigned_to(self, assignment):
+        """Whether the assignment is not limited to specific groups, or the user is in one of those groups."""
+        groups = self.assigned_groups.get(assignment.pk)
+        return not groups or not groups.isdisjoint(self.groups)
+
+    def is_author_of(self, journal):
+        return journal.pk in self.journals
+
+
+def get_permission_matrix(user):
+    """Returns the permission matrix of the user within the current request, None when not handling a request."""
+    matrices = getattr(_request_scope, 'matrices', None)
+    if matrices is None or user.pk is None:
+        return None
+
+    if user.pk not in matrices:
+        matrices[user.pk] = PermissionMatrix(user)
+    return matrices[user.pk]
+
+
+def clear_permission_matrices(*args, **kwargs):
+    """Discards the loaded permission matrices, used whenever the current request changes roles or participations."""
+    matrices = getattr(_request_scope, 'matrices', None)
+    if matrices:
+        matrices.clear()
+
+
+@contextmanager
+def permission_matrix_scope():
+    """Permission checks within the scope are answered from the permission matrix of the user, loaded once."""
+    _request_scope.matrices = {}
+    try:
+        yield
+    finally:
+        _request_scope.matrices = None
+
+
+class PermissionMatrixMiddleware:
+    """Scopes the permission matrices to a single request, so permissions are loaded at most once per request."""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with permission_matrix_scope():
+            return self.get_response(request)
+
 
 def has_general_permission(user, permission):
     """Check if the user has the needed "global" permission.
@@ -50,6 +226,10 @@ def has_course_permission(user, permission, course):
     if user.is_superuser:
         return True
 
+    matrix = get_permission_matrix(user)
+    if matrix:
+        return matrix.has_course_permission(permission, course)
+
     return VLE.models.Role.objects.filter(
         **{permission: True},
         role__user=user, course=course).exists()
@@ -76,6 +256,12 @@ def has_assignment_permission(user, permission, assignment):
             return False
         return True
 
+    matrix = get_permission_matrix(user)
+    if matrix:
+        if permission == 'can_have_journal' and matrix.has_assignment_permission('can_view_all_journals', assignment):
+            return False
+        return matrix.has_assignment_permission(permission, assignment)
+
     if permission == 'can_have_journal' and VLE.models.Role.objects.filter(can_view_all_journals=True,
        role__user=user, course__in=assignment.courses.all()).exists():
         return False
@@ -117,7 +303,10 @@ def can_edit(user, obj):
 
 
 def _can_edit_entry(user, entry):
-    journal = VLE.models.Journal.objects.filter(node__entry=entry).select_related('assignment').get()
+    journal = (
+        VLE.models.Journal.objects.with_annotations('needs_lti_link')
+        .filter(node__entry=entry).select_related('assignment').get()
+    )
 
     if (
         journal.assignment.is_locked() or
@@ -143,20 +332,41 @@ def serialize_course_permissions(user, course):
     ).first()
 
 
-def serialize_assignment_permissions(user, assignment):
-    permissions = {}
-    for course in assignment.courses.all():
-        perms = VLE.models.Role.objects.values(*VLE.models.Role.ASSIGNMENT_PERMISSIONS).filter(
-            role__user=user,
-            course=course,
-        ).first()
-
-        if perms:
-            for perm, value in perms.items():
-                if value or perm not in permissions:
-                    permissions[perm] = value
-
+def _assignment_permissions(user, permissions):
     if permissions.get('can_view_all_journals', False) or user.is_superuser:
         permissions['can_have_journal'] = False
 
     return permissions
+
+
+def serialize_assignment_permissions(user, assignment):
+    """Serializes the assignment permissions of the user, OR-ed over the roles of the user in the assignment courses."""
+    permissions = VLE.models.Role.objects.filter(
+        role__user=user,
+        course__in=assignment.courses.values('pk'),
+    ).aggregate(**{permission: BoolOr(permission) for permission in VLE.models.Role.ASSIGNMENT_PERMISSIONS})
+
+    # Without any role in the assignment courses, all permissions aggregate to NULL
+    if all(value is None for value in permissions.values()):
+        permissions = {}
+
+    return _assignment_permissions(user, permissions)
+
+
+def serialize_assignments_permissions(user, assignments):
+    """Serializes the assignment permissions of the user for each of the assignments, in a single query.
+
+    Returns {assignment.pk: permissions}, formatted as `serialize_assignment_permissions`.
+    """
+    assignment_pks = [assignment.pk for assignment in assignments]
+    permissions = {pk: {} for pk in assignment_pks}
+    for row in VLE.models.Role.objects.filter(
+        role__user=user,
+        course__assignment__in=assignment_pks,
+    ).values('course__assignment').annotate(
+        **{f'any_{permission}': BoolOr(permission) for permission in VLE.models.Role.ASSIGNMENT_PERMISSIONS}
+    ).order_by():
+        permissions[row['course__assignment']] = {
+            permission: row[f'any_{permission}'] for permission in VLE.models.Role.ASSIGNMENT_PERMISSIONS}
+
+    return {pk: _assignment_permissions(user, perms) for pk, perms in permissions.items()}
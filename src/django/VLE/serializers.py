@@ -6,7 +6,7 @@ Functions to convert certain data to other formats.
 import datetime
 
 from django.conf import settings
-from django.db.models import Avg, Count, Prefetch, QuerySet, Sum
+from django.db.models import Avg, Count, Exists, Prefetch, Q, QuerySet, Sum
 from rest_framework import serializers
 from sentry_sdk import capture_message
 
@@ -319,15 +319,10 @@ class OwnUserSerializer(serializers.ModelSerializer):
             if user.can_view(course):
                 perms[f'course{course.id}'] = VLE.permissions.serialize_course_permissions(user, course)
 
-        assignments = set()
-        for course in courses:
-            for assignment in course.assignment_set.all():
-                if user.can_view(assignment):
-                    assignments.add(assignment)
+        assignments = VLE.models.Assignment.objects.filter(courses__in=courses).distinct().viewable_by(user)
 
-        for assignment in assignments:
-            perms[f'assignment{assignment.pk}'] = VLE.permissions.serialize_assignment_permissions(
-                user, assignment)
+        for pk, assignment_perms in VLE.permissions.serialize_assignments_permissions(user, assignments).items():
+            perms[f'assignment{pk}'] = assignment_perms
 
         return perms
 
@@ -601,7 +596,7 @@ class AssignmentSerializer(ExtendedModelSerializer, EagerLoadingMixin):
             if assignment.is_group_assignment:
                 journals = VLE.models.Journal.objects.filter(assignment=assignment).order_by_authors_first()
             else:
-                journals = VLE.models.Journal.objects.filter(assignment=assignment)
+                journals = VLE.models.Journal.objects.filter(assignment=assignment).order_by('pk')
 
             journals = journals.for_course(course)
             journals = journals.annotate(
@@ -619,47 +614,52 @@ class AssignmentSerializer(ExtendedModelSerializer, EagerLoadingMixin):
 
         # Upcoming specifically requests stats for all of the assignment's courses
         if course == settings.EXPLICITLY_WITHOUT_CONTEXT:
-            relevant_stat_users = VLE.utils.statistics.get_user_lists_with_scopes(assignment, user)
+            scopes = VLE.utils.statistics.get_author_participations_with_scopes(assignment, user)
         else:
             # We are not dealing explicitly without context, and we have no specific course, stats should not be needed.
             if course is None:
                 return None
-            relevant_stat_users = VLE.utils.statistics.get_user_lists_with_scopes(assignment, user, course=course)
-
-        # Evaluation needs to be forced to play nice with ArrayAgg annotations (needs_lti_link, groups)
-        relevant_stat_users_all = list(relevant_stat_users['all'])
-        relevant_stat_users_own = list(relevant_stat_users['own'])
-
-        all_j = VLE.models.Journal.objects.filter(assignment=assignment, authors__user__in=relevant_stat_users_all)
-        own_j = VLE.models.Journal.objects.filter(assignment=assignment, authors__user__in=relevant_stat_users_own)
-
-        all_j_stats = all_j.aggregate(
+            scopes = VLE.utils.statistics.get_author_participations_with_scopes(assignment, user, course=course)
+
+        # Both scopes are aggregated in a single query, grouping on the assignment rather than using aggregate(),
+        # which cannot aggregate over the (Exists) annotations.
+        journal_stats = VLE.models.Journal.objects.with_annotations(
+            'grade', 'unpublished', 'needs_marking', 'import_requests',
+        ).filter(
+            assignment=assignment,
+        ).annotate(
+            in_all_scope=Exists(scopes['all']),
+            in_own_scope=Exists(scopes['own']),
+        ).filter(
+            in_all_scope=True,
+        ).values(
+            'assignment',
+        ).annotate(
             average_points=Avg('grade'),
             needs_marking_sum=Sum('needs_marking'),
             unpublished_sum=Sum('unpublished'),
             import_requests_sum=Sum('import_requests'),
-        )
-        own_j_stats = own_j.aggregate(
-            needs_marking_sum=Sum('needs_marking'),
-            unpublished_sum=Sum('unpublished'),
-            import_requests_sum=Sum('import_requests'),
-        )
+            needs_marking_own_sum=Sum('needs_marking', filter=Q(in_own_scope=True)),
+            unpublished_own_sum=Sum('unpublished', filter=Q(in_own_scope=True)),
+            import_requests_own_sum=Sum('import_requests', filter=Q(in_own_scope=True)),
+        ).order_by()
+        journal_stats = journal_stats[0] if journal_stats else {}
 
         # Grader stats
         if self.permission_from_context('can_grade', assignment):
             stats.update({
-                'needs_marking': all_j_stats['needs_marking_sum'] or 0,
-                'unpublished': all_j_stats['unpublished_sum'] or 0,
-                'needs_marking_own_groups': own_j_stats['needs_marking_sum'] or 0,
-                'unpublished_own_groups': own_j_stats['unpublished_sum'] or 0,
+                'needs_marking': journal_stats.get('needs_marking_sum') or 0,
+                'unpublished': journal_stats.get('unpublished_sum') or 0,
+                'needs_marking_own_groups': journal_stats.get('needs_marking_own_sum') or 0,
+                'unpublished_own_groups': journal_stats.get('unpublished_own_sum') or 0,
             })
         if self.permission_from_context('can_manage_journal_import_requests', assignment):
             stats.update({
-                'import_requests': all_j_stats['import_requests_sum'] or 0,
-                'import_requests_own_groups': own_j_stats['import_requests_sum'] or 0,
+                'import_requests': journal_stats.get('import_requests_sum') or 0,
+                'import_requests_own_groups': journal_stats.get('import_requests_own_sum') or 0,
             })
         # Other stats
-        stats['average_points'] = all_j_stats['average_points']
+        stats['average_points'] = journal_stats.get('average_points')
 
         return stats
 
@@ -973,14 +973,18 @@ class EntrySerializer(serializers.ModelSerializer, EagerLoadingMixin):
         content_dict.update(_get_content(entry))
         return content_dict
 
+    def permission_from_context(self, permission, assignment):
+        if permission in self.context:
+            return self.context[permission]
+        return self.context['user'].has_permission(permission, assignment)
+
     def get_grade(self, entry):
         # TODO: Add permission can_view_grade
         if 'user' not in self.context or not self.context['user']:
             return None
 
         grade = entry.grade
-        if grade and (grade.published or
-                      self.context['user'].has_permission('can_grade', entry.node.journal.assignment)):
+        if grade and (grade.published or self.permission_from_context('can_grade', entry.node.journal.assignment)):
             return GradeSerializer(grade).data
 
         return None
@@ -1135,8 +1139,7 @@ class JournalImportRequestSerializer(serializers.ModelSerializer, EagerLoadingMi
             return 'Source journal no longer exists.'
 
         source = jir.source
-        if source.missing_annotated_field:
-            source = VLE.models.Journal.objects.get(pk=source.pk)
+        source.fill_annotated_fields()
 
         return {
             'journal': JournalSerializer(source, context=self.context, read_only=True).data,
@@ -1145,8 +1148,7 @@ class JournalImportRequestSerializer(serializers.ModelSerializer, EagerLoadingMi
 
     def get_target(self, jir):
         target = jir.target
-        if target.missing_annotated_field:
-            target = VLE.models.Journal.objects.get(pk=target.pk)
+        target.fill_annotated_fields()
 
         return {
             'journal': JournalSerializer(target, context=self.context, read_only=True).data,
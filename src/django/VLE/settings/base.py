@@ -57,6 +57,10 @@ ANYMAIL = {
     'MAILGUN_SENDER_DOMAIN': os.environ['MAILGUN_SENDER_DOMAIN'],
 }
 EMAIL_SENDER_DOMAIN = ANYMAIL['MAILGUN_SENDER_DOMAIN']
+# Number of emails sent over a single backend connection, attempts per email and concurrent connections
+EMAIL_BATCH_SIZE = int(os.environ.get('EMAIL_BATCH_SIZE', 100))
+EMAIL_SEND_ATTEMPTS = int(os.environ.get('EMAIL_SEND_ATTEMPTS', 2))
+EMAIL_SEND_WORKERS = int(os.environ.get('EMAIL_SEND_WORKERS', 1))
 
 
 @dataclass
@@ -115,6 +119,14 @@ LTI_ROLES = OrderedDict({
 })
 # Names we have encountered used for test students
 LTI_TEST_STUDENT_FULL_NAMES = {'Test student'}
+# Concurrent grade passback requests per LMS host, seconds before a request times out, attempts per request and the
+# seconds waited before the first retry (doubled for every next retry)
+LTI_PASSBACK_WORKERS_PER_HOST = int(os.environ.get('LTI_PASSBACK_WORKERS_PER_HOST', 4))
+LTI_PASSBACK_TIMEOUT = int(os.environ.get('LTI_PASSBACK_TIMEOUT', 10))
+LTI_PASSBACK_ATTEMPTS = int(os.environ.get('LTI_PASSBACK_ATTEMPTS', 3))
+LTI_PASSBACK_BACKOFF = float(os.environ.get('LTI_PASSBACK_BACKOFF', 0.5))
+# Seconds requested grade passbacks are pending before they are sent, repeated requests within the window are coalesced
+LTI_PASSBACK_WINDOW = int(os.environ.get('LTI_PASSBACK_WINDOW', 60))
 
 # Celery settings
 CELERY_BROKER_URL = os.environ['BROKER_URL']
@@ -134,6 +146,12 @@ DJANGO_CELERY_BEAT_TZ_AWARE = False
 # Webserver settings
 WEBSERVER_TIMEOUT = 60
 
+# Seconds a serialized journal timeline is cached server side, keyed by its version. Disabled if 0.
+TIMELINE_CACHE_TIMEOUT = int(os.environ.get('TIMELINE_CACHE_TIMEOUT', 0))
+# Seconds the course permissions of a user are cached across requests, 0 disables the cache.
+# Invalidation only reaches other processes if the cache backend is shared, e.g. Redis.
+PERMISSION_CACHE_TIMEOUT = int(os.environ.get('PERMISSION_CACHE_TIMEOUT', 0))
+
 
 # Read for webserver, r + w for django
 FILE_UPLOAD_PERMISSIONS = 0o644
@@ -194,6 +212,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'VLE.utils.error_handling.ErrorMiddleware',
+    'VLE.permissions.PermissionMatrixMiddleware',
     'csp.middleware.CSPMiddleware',
 ]
 
@@ -37,6 +37,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'VLE.utils.error_handling.ErrorMiddleware',
+    'VLE.permissions.PermissionMatrixMiddleware',
 ]
 ALLOWED_HOSTS = ['*']
 
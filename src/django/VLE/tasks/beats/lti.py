@@ -10,3 +10,8 @@ import VLE.utils
 def check_if_need_VLE_publish():
     for journal in VLE.models.Journal.objects.all():
         VLE.utils.grading.send_journal_status_to_LMS(journal)
+
+
+@shared_task
+def send_pending_grade_passbacks():
+    return VLE.utils.grading.send_pending_passbacks()
@@ -1,17 +1,21 @@
 from __future__ import absolute_import, unicode_literals
 
 import datetime
+import functools
+import operator
+import time
 
 from celery import shared_task
 from django.conf import settings
 from django.core.mail import EmailMultiAlternatives
-from django.db.models import Q
+from django.db.models import Exists, F, OuterRef, Q, Subquery
 from django.template.loader import render_to_string
 from django.utils import timezone
 from django.utils.html import strip_tags
 from sentry_sdk import capture_exception
 
 import VLE.models
+import VLE.utils.email_handling as email_handling
 
 
 def _generate_upcoming_deadline_notifications(node_query, preferences):
@@ -20,42 +24,61 @@ def _generate_upcoming_deadline_notifications(node_query, preferences):
     Send notifications to all users that are connected to the upcoming deadline
     NOTE: skips when preferences are turned to not receive the upcoming deadline
 
+    The (node, author) pairs to remind are selected in a single query, the notifications are bulk created.
+
     Arguments:
     node_query -- query of Nodes
     preferences -- one of these preference options needs to be set in the user preference
     """
-    notifications = []
     # Remove all filled entrydeadline
     no_submissions = Q(preset__type=VLE.models.Node.ENTRYDEADLINE, entry__isnull=True) | \
         Q(preset__type=VLE.models.Node.PROGRESS)
-    nodes = node_query.filter(no_submissions).distinct()
-    for node in nodes:
-        # Only send to users who have a journal
-        try:
-            journal = VLE.models.Journal.objects.get(pk=node.journal.pk)
-        except VLE.models.Journal.DoesNotExist:
-            continue
-
-        # Dont send a mail when the target points is reached
-        if node.preset.type == VLE.models.Node.PROGRESS and journal.grade >= node.preset.target:
-            continue
-
-        for author in journal.authors.filter(user__preferences__upcoming_deadline_reminder__in=preferences):
-            # Filter out any duplicate creation of upcoming deadline notifications
-            if VLE.models.Notification.objects.filter(
-               type=VLE.models.Notification.UPCOMING_DEADLINE, user=author.user, node=node,
-               creation_date__gt=timezone.now().date() - datetime.timedelta(days=1)).exists():
-                continue
-            # Do not send email to users that cannot view the assignment
-            if not author.user.can_view(node.journal.assignment):
-                continue
-            notifications.append(VLE.models.Notification.objects.create(
-                type=VLE.models.Notification.UPCOMING_DEADLINE,
-                user=author.user,
-                node=node,
-            ))
+    # Only send to users who have a journal, and dont send a mail when the target points is reached
+    nodes = node_query.filter(no_submissions).annotate(journal_grade=Subquery(
+        VLE.models.Journal.objects.with_annotations('grade').filter(pk=OuterRef('journal')).values('grade')[:1]
+    )).filter(
+        Q(preset__type=VLE.models.Node.ENTRYDEADLINE) | Q(journal_grade__lt=F('preset__target')),
+        journal_grade__isnull=False,
+    )
+
+    def participation(**kwargs):
+        return Exists(VLE.models.Participation.objects.filter(
+            user=OuterRef('user'), course__assignment=OuterRef('assignment'), **kwargs))
+
+    assigned_groups = VLE.models.Assignment.assigned_groups.through.objects.filter(assignment=OuterRef('assignment'))
+    authors = VLE.models.AssignmentParticipation.objects.filter(
+        journal__node__in=nodes.values('pk'),
+        user__preferences__upcoming_deadline_reminder__in=preferences,
+    ).annotate(
+        node=F('journal__node'),
+    ).annotate(
+        # Filter out any duplicate creation of upcoming deadline notifications
+        reminded=Exists(VLE.models.Notification.objects.filter(
+            type=VLE.models.Notification.UPCOMING_DEADLINE, user=OuterRef('user'), node=OuterRef('node'),
+            creation_date__gt=timezone.now().date() - datetime.timedelta(days=1))),
+        is_participant=participation(),
+        can_have_journal=participation(role__can_have_journal=True),
+        can_view_unpublished_assignment=participation(role__can_view_unpublished_assignment=True),
+        has_assigned_groups=Exists(assigned_groups),
+        is_assigned=Exists(assigned_groups.filter(group__participation__user=OuterRef('user'))),
+    ).filter(
+        # Do not send email to users that cannot view the assignment, see `User.can_view`
+        Q(user__is_superuser=True) | (
+            Q(is_participant=True) &
+            ~Q(can_have_journal=True, has_assigned_groups=True, is_assigned=False) &
+            (Q(assignment__is_published=True) | Q(can_view_unpublished_assignment=True))
+        ),
+        reminded=False,
+    ).values_list('node', 'user').distinct()
 
-    return notifications
+    authors = list(authors)
+    nodes = VLE.models.Node.objects.select_related('journal__assignment', 'preset__forced_template').in_bulk(
+        {node for node, _ in authors})
+
+    return VLE.models.Notification.objects.bulk_create_notifications([
+        VLE.models.Notification(type=VLE.models.Notification.UPCOMING_DEADLINE, user_id=user, node=nodes[node])
+        for node, user in authors
+    ])
 
 
 def generate_upcoming_deadline_notifications():
@@ -80,113 +103,134 @@ def generate_upcoming_deadline_notifications():
     )
 
 
-def add_notifications_to_content(content, notifications, period, name):
-    """Add the notifications to the content supplied in a mail-template-friendly object.
-
-    Skips over notifications that are sent or should be sent at another time.
-    Will batch batchable notifications if there is more than one of them.
+# Number of users whose digest notifications are loaded and marked sent at once
+DIGEST_CHUNK_SIZE = 500
 
-    params:
-    content -- list of content to add the notifications in
-    notifications -- list of notifications to loop over and add to the content list
-    period -- period in which the notifications are send
 
-    returns: list of id's that are added (even when batched)
-    """
-    if not notifications:
-        return []
+def digest_notifications(user_pks, period):
+    """Loads the unsent notifications of the users which should be sent in the period, grouped per user.
 
-    sending = []
-    content.append({
-        'name': name,
-        'notifications': [],
-    })
+    Notifications without a course are never part of a digest.
+    The text of the notifications is stored along, only their user, course and assignment are loaded.
 
+    returns: {user.pk: [notifications]}
+    """
+    preference_fields = {field.name for field in VLE.models.Preferences._meta.get_fields()}
+    in_period = functools.reduce(operator.or_, [
+        Q(type=type, **{'user__preferences__{}__in'.format(options['name']): period})
+        for type, options in VLE.models.Notification.TYPES.items() if options['name'] in preference_fields
+    ])
+
+    notifications = VLE.models.Notification.objects.filter(
+        in_period,
+        user__in=user_pks,
+        sent=False,
+        course__isnull=False,
+    ).select_related(
+        'user',
+        'course',
+        'assignment',
+    ).order_by('user', 'pk')
+
+    per_user = {}
     for notification in notifications:
-        notification.refresh_from_db()
-        if not notification.sent and notification.email_preference in period:
-            notification.sent = True
-            notification.save()
-
-            sending.append(notification.pk)
-            notification_content = notification.content
+        per_user.setdefault(notification.user_id, []).append(notification)
 
-            # Potentially batch notifications
-            if notification.type in VLE.models.Notification.BATCHED_TYPES:
-                filter = {
-                    'type': notification.type,
-                    VLE.models.Notification.BATCHED_TYPES[notification.type]: getattr(
-                        notification, VLE.models.Notification.BATCHED_TYPES[notification.type]).pk
-                }
-                # Add any additional batched notifications to sending
-                sending += notifications.filter(**filter).exclude(pk=notification.pk).values_list('pk', flat=True)
+    return per_user
 
-                # See if there are also other notifications
-                count = 1 + notifications.filter(**filter).count()
 
-                # Include them in the send as a batched notification
-                notifications.filter(**filter).update(sent=True)
-                if count > 1:
-                    notification_content = notification.batch_content(n=count)
+def add_notifications_to_content(content, notifications, name):
+    """Add the notifications to the content supplied in a mail-template-friendly object.
 
-            content[-1]['notifications'].append({
-                'title': notification.title,
-                'content': notification_content,
-                'url': notification.url,
-            })
+    Batchable notifications are batched if there is more than one of them.
 
-    # If nothing is sent, remove it from the list
-    if not sending:
-        content.pop()
+    params:
+    content -- list of content to add the notifications in
+    notifications -- list of notifications to add to the content list
+    name -- name of the content section
+    """
+    batches = {}
+    for notification in notifications:
+        key = notification.pk
+        if notification.type in VLE.models.Notification.BATCHED_TYPES:
+            key = (notification.type, getattr(
+                notification, '{}_id'.format(VLE.models.Notification.BATCHED_TYPES[notification.type])))
+        batches.setdefault(key, []).append(notification)
 
-    return sending
+    content.append({
+        'name': name,
+        'notifications': [{
+            'title': batch[0].title,
+            'content': batch[0].batch_content(n=len(batch)) if len(batch) > 1 else batch[0].content,
+            'url': batch[0].url,
+        } for batch in batches.values()],
+    })
 
 
-def gen_content_from_notifications(notifications, period):
-    """Generate an object to be passed onto the digest template from a list of notifications
+def gen_content_from_notifications(notifications):
+    """Generate an object to be passed onto the digest template from a list of notifications of a single user
 
-    Skips over notifications that are sent or should be sent at another time.
-    Will batch batchable notifications if there is more than one of them.
+    Course notifications are listed per course, followed by the notifications of each assignment of that course.
 
     params:
-    notifications -- list of notifications to loop over and add to the content list\
-    period -- period in which the notifications are send
+    notifications -- list of notifications to add to the content list, see `digest_notifications`
 
     returns: tuple of:
         - Object that can be passed to the digest template
         - list of id's that are added (even when batched)
     """
-    sending = []
+    courses = {}
+    for notification in notifications:
+        course = courses.setdefault(notification.course_id, {'course': notification.course, 'assignments': {}})
+        course['assignments'].setdefault(notification.assignment_id, []).append(notification)
+
     content = []
-    # Loop over notifications belonging to one course
-    for course in notifications.filter(course__isnull=False).values_list('course', flat=True).distinct():
-        course = VLE.models.Course.objects.get(pk=course)
+    for course in courses.values():
         content.append({
-            'name': course.name,
+            'name': course['course'].name,
             'subcontent': [],
         })
-        sending += add_notifications_to_content(
-            content=content[-1]['subcontent'],
-            notifications=notifications.filter(course=course, assignment__isnull=True),
-            period=period,
-            name='Course notifications'
-        )
-
-        # Loop over notifications belonging to one assignment
-        for assignment in notifications.filter(
-           course=course, assignment__isnull=False).values_list('assignment', flat=True).distinct():
-            assignment = VLE.models.Assignment.objects.get(pk=assignment)
-            sending += add_notifications_to_content(
+        if None in course['assignments']:
+            add_notifications_to_content(
                 content=content[-1]['subcontent'],
-                notifications=notifications.filter(course=course, assignment=assignment),
-                period=period,
-                name=assignment.name,
+                notifications=course['assignments'].pop(None),
+                name='Course notifications',
             )
+        for assignment_notifications in course['assignments'].values():
+            add_notifications_to_content(
+                content=content[-1]['subcontent'],
+                notifications=assignment_notifications,
+                name=assignment_notifications[0].assignment.name,
+            )
+
+    return content, [notification.pk for notification in notifications]
 
-        # If nothing is sent, remove it from the list
-        if not content[-1]['subcontent']:
-            content.pop()
-    return content, sending
+
+def digest_email(user, content):
+    """Renders the digest email of the user."""
+    email_data = {
+        'heading': 'Your recent notifications',
+        'main_content': ['You have signed up to receive notifications about these events on eJournal.'],
+        'notifications': content,
+        'full_name': user.full_name,
+        'button_url': '{}/Home/'.format(settings.BASELINK),
+        'button_text': 'Go to eJournal',
+        'profile_url': '{}/Profile'.format(settings.BASELINK)
+    }
+
+    html_content = render_to_string('digest.html', {'email_data': email_data})
+    text_content = strip_tags(html_content)
+
+    email = EmailMultiAlternatives(
+        subject='Recent notification digest - eJournal',
+        body=text_content,
+        from_email=settings.EMAILS.noreply.sender,
+        headers={'Content-Type': 'text/plain'},
+        to=[user.email]
+    )
+
+    email.attach_alternative(html_content, 'text/html')
+    return email
 
 
 @shared_task
@@ -195,9 +239,18 @@ def send_digest_notifications():
 
     For users with daily notifications, it will send all non send notifications that the user would like to receive
     For users with weekly notifications, it will only send all notifications on mondays
+
+    Users are handled in chunks. The notifications of a chunk are loaded at once and marked sent with a single update,
+    the digest emails of a chunk are sent over shared connections, see `email_handling.send_messages`.
+    The notifications of users whose email fails to send are marked unsent again.
+
+    Returns the sent and failed notifications per user, the number of generated upcoming deadline notifications and
+    the seconds spent generating those and sending the digest.
     """
+    start = time.perf_counter()
     # Generate the new upcoming deadline notifications of the day
-    generate_upcoming_deadline_notifications()
+    upcoming_deadline_notifications = generate_upcoming_deadline_notifications()
+    timings = {'upcoming_deadline_notifications': time.perf_counter() - start}
 
     period = [VLE.models.Preferences.DAILY]
     if datetime.datetime.today().weekday() == 0:
@@ -205,57 +258,42 @@ def send_digest_notifications():
     sending = dict()
     failed = dict()
 
-    # Loop over all users that potentially have a new notification
-    for user in VLE.models.Notification.objects.filter(
-       sent=False).order_by('user__pk').values_list('user', flat=True).distinct():
-        user = VLE.models.User.objects.get(pk=user)
-        if not user.verified_email:
-            continue
-
-        content, user_sending = gen_content_from_notifications(
-            VLE.models.Notification.objects.filter(user=user, sent=False),
-            period
-        )
-        sending[user.pk] = user_sending
-
-        # If there is nothing to be sent, dont send an email
-        if not user_sending:
-            continue
-
-        email_data = {
-            'heading': 'Your recent notifications',
-            'main_content': ['You have signed up to receive notifications about these events on eJournal.'],
-            'notifications': content,
-            'full_name': user.full_name,
-            'button_url': '{}/Home/'.format(settings.BASELINK),
-            'button_text': 'Go to eJournal',
-            'profile_url': '{}/Profile'.format(settings.BASELINK)
-        }
-
-        html_content = render_to_string('digest.html', {'email_data': email_data})
-        text_content = strip_tags(html_content)
-
-        email = EmailMultiAlternatives(
-            subject='Recent notification digest - eJournal',
-            body=text_content,
-            from_email=settings.EMAILS.noreply.sender,
-            headers={'Content-Type': 'text/plain'},
-            to=[user.email]
-        )
-
-        email.attach_alternative(html_content, 'text/html')
-
-        try:
-            email.send()
-        except Exception as e:
-            failed[user.pk] = sending[user.pk]
-            VLE.models.Notification.objects.filter(pk__in=sending[user.pk]).update(sent=False)
-            del sending[user.pk]
-            capture_exception(e)
+    # All users with a verified email that potentially have a new notification
+    user_pks = list(VLE.models.Notification.objects.filter(
+        sent=False, user__verified_email=True).order_by('user__pk').values_list('user', flat=True).distinct())
+
+    for i in range(0, len(user_pks), DIGEST_CHUNK_SIZE):
+        chunk = user_pks[i:i + DIGEST_CHUNK_SIZE]
+        notifications = digest_notifications(chunk, period)
+        VLE.models.Notification.objects.filter(pk__in=[
+            notification.pk for user_notifications in notifications.values() for notification in user_notifications
+        ]).update(sent=True)
+
+        emails = {}
+        for user_pk in chunk:
+            # If there is nothing to be sent, dont send an email
+            if user_pk not in notifications:
+                sending[user_pk] = []
+                continue
+
+            content, sending[user_pk] = gen_content_from_notifications(notifications[user_pk])
+            emails[user_pk] = digest_email(notifications[user_pk][0].user, content)
+
+        for user_pk, error in zip(emails, email_handling.send_messages(emails.values())):
+            if error is not None:
+                failed[user_pk] = sending.pop(user_pk)
+                capture_exception(error)
+
+        VLE.models.Notification.objects.filter(
+            pk__in=[pk for user_pk in emails if user_pk in failed for pk in failed[user_pk]]).update(sent=False)
+
+    timings['digest'] = time.perf_counter() - start - timings['upcoming_deadline_notifications']
 
     return {
         'sent_notifications': sending,
         'failed_notifications': failed,
+        'upcoming_deadline_notifications': len(upcoming_deadline_notifications),
+        'timings': timings,
     }
 
 
@@ -6,31 +6,17 @@ from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
+from sentry_sdk import capture_exception
 
 import VLE.models
+import VLE.utils.email_handling as email_handling
 
 # QUESTION: What action should be taken if sending the email goes wrong? E.g. SMTP auth exception
 # Idempotent tasks and retry? Will still require handling for when the retries ultimately fail
 
 
-@shared_task
-def send_push_notification(notification_pk):
-    """Send a notification with corresponding pk to the user.
-
-    Note: does not send the notification if it is not already sent.
-    """
-    notification = VLE.models.Notification.objects.get(pk=notification_pk)
-    if notification.sent:
-        return {
-            'description': 'Notification nr {} was already sent'.format(notification_pk),
-            'successful': False,
-        }
-    if not notification.user.verified_email:
-        return {
-            'description': 'Notification nr {} has unverified email adress'.format(notification_pk),
-            'successful': False,
-        }
-
+def push_notification_email(notification):
+    """Builds the email of a single notification."""
     email_data = {
         'heading': notification.title,
         'main_content': notification.content,
@@ -56,14 +42,67 @@ def send_push_notification(notification_pk):
     )
 
     email.attach_alternative(html_content, 'text/html')
-    email.send()
-    notification.sent = True
-    notification.save()
+    return email
 
-    return {
-        'description': 'Sent notification nr {}'.format(notification_pk),
-        'successful': True,
-    }
+
+@shared_task
+def send_push_notification(notification_pk):
+    """Send a notification with corresponding pk to the user.
+
+    Note: does not send the notification if it is not already sent.
+    """
+    return send_push_notifications([notification_pk])[0]
+
+
+@shared_task
+def send_push_notifications(notification_pks):
+    """Send the notifications with corresponding pks to their users, see `send_push_notification`.
+
+    The emails are sent in batches over shared connections, only the notifications which are sent are marked sent.
+    """
+    notifications = VLE.models.Notification.objects.filter(pk__in=notification_pks).select_related(
+        'user', 'course', 'assignment').in_bulk()
+
+    results = {}
+    sending = []
+    for notification_pk in notification_pks:
+        notification = notifications.get(notification_pk)
+        if notification is None:
+            results[notification_pk] = {
+                'description': 'Notification nr {} does not exist'.format(notification_pk),
+                'successful': False,
+            }
+        elif notification.sent:
+            results[notification_pk] = {
+                'description': 'Notification nr {} was already sent'.format(notification_pk),
+                'successful': False,
+            }
+        elif not notification.user.verified_email:
+            results[notification_pk] = {
+                'description': 'Notification nr {} has unverified email adress'.format(notification_pk),
+                'successful': False,
+            }
+        else:
+            sending.append(notification)
+
+    errors = email_handling.send_messages([push_notification_email(notification) for notification in sending])
+    for notification, error in zip(sending, errors):
+        if error is None:
+            results[notification.pk] = {
+                'description': 'Sent notification nr {}'.format(notification.pk),
+                'successful': True,
+            }
+        else:
+            results[notification.pk] = {
+                'description': 'Failed to send notification nr {}'.format(notification.pk),
+                'successful': False,
+            }
+            capture_exception(error)
+
+    VLE.models.Notification.objects.filter(
+        pk__in=[notification.pk for notification, error in zip(sending, errors) if error is None]).update(sent=True)
+
+    return [results[notification_pk] for notification_pk in notification_pks]
 
 
 @shared_task
@@ -106,6 +145,7 @@ def send_invite_emails(user_pks):
     users = VLE.models.User.objects.filter(pk__in=user_pks)
     instance_name = VLE.models.Instance.objects.get_or_create(pk=1)[0].name
     token_generator = PasswordResetTokenGenerator()
+    emails = []
     for user in users:
         email_data = {}
         email_data['heading'] = 'Welcome to eJournal!'
@@ -131,7 +171,11 @@ def send_invite_emails(user_pks):
         )
 
         email.attach_alternative(html_content, 'text/html')
-        email.send()
+        emails.append(email)
+
+    for error in email_handling.send_messages(emails):
+        if error is not None:
+            capture_exception(error)
 
 
 @shared_task
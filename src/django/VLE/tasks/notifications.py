@@ -1,49 +1,78 @@
 from __future__ import absolute_import, unicode_literals
 
 from celery import shared_task
+from django.db.models import Exists, OuterRef, Q
 
 import VLE.models
 
 
 @shared_task
 def generate_new_assignment_notifications(ap_ids):
-    aps = VLE.models.AssignmentParticipation.objects.filter(pk__in=ap_ids)
-    for ap in aps:
-        ap.create_new_assignment_notification()
+    user_assignments = list(VLE.models.AssignmentParticipation.objects.filter(pk__in=ap_ids).values_list(
+        'user', 'assignment'))
+    assignments = VLE.models.Assignment.objects.in_bulk({assignment for _, assignment in user_assignments})
+
+    VLE.models.Notification.objects.bulk_create_notifications([
+        VLE.models.Notification(
+            type=VLE.models.Notification.NEW_ASSIGNMENT, user_id=user, assignment=assignments[assignment])
+        for user, assignment in user_assignments
+    ])
 
 
 @shared_task
 def generate_new_node_notifications(node_ids):
-    nodes = VLE.models.Node.objects.filter(pk__in=node_ids)
+    nodes = VLE.models.Node.objects.filter(pk__in=node_ids).select_related(
+        'journal__assignment', 'preset__forced_template')
+    journal_nodes = {}
     for node in nodes:
-        for author in node.journal.authors.all():
-            if author.user.can_view(node.journal):
-                VLE.models.Notification.objects.create(
-                    type=VLE.models.Notification.NEW_NODE,
-                    user=author.user,
-                    node=node,
-                )
+        journal_nodes.setdefault(node.journal_id, []).append(node)
+
+    # Only notify the authors who can view their journal
+    can_have_journal = VLE.models.Participation.objects.filter(
+        user=OuterRef('user'), course__assignment=OuterRef('assignment'), role__can_have_journal=True)
+    authors = VLE.models.AssignmentParticipation.objects.filter(journal__in=journal_nodes.keys()).annotate(
+        can_have_journal=Exists(can_have_journal)).filter(Q(can_have_journal=True) | Q(user__is_superuser=True))
+
+    VLE.models.Notification.objects.bulk_create_notifications([
+        VLE.models.Notification(type=VLE.models.Notification.NEW_NODE, user_id=user, node=node)
+        for journal, user in authors.values_list('journal', 'user')
+        for node in journal_nodes[journal]
+    ])
 
 
 @shared_task
-def generate_new_comment_notifications(comment_id):
-    comment = VLE.models.Comment.objects.select_related('entry__node__journal', 'author').get(pk=comment_id)
+def generate_new_grade_notifications(grade_ids):
+    """Notifies the authors of the journals of the (published) grades, see `grading.publish_grades`."""
+    grades = VLE.models.Grade.objects.filter(pk__in=grade_ids).select_related(
+        'entry__template', 'entry__node__journal__assignment')
+    journal_grades = {}
+    for grade in grades:
+        journal_grades.setdefault(grade.entry.node.journal_id, []).append(grade)
 
-    # Generate notifications for supervisors even when commenter is not student
-    for user in VLE.permissions.get_supervisors_of(comment.entry.node.journal).exclude(pk=comment.author.pk):
-        VLE.models.Notification.objects.create(
-            type=VLE.models.Notification.NEW_COMMENT,
-            user=user,
-            comment=comment,
-        )
+    VLE.models.Notification.objects.bulk_create_notifications([
+        VLE.models.Notification(type=VLE.models.Notification.NEW_GRADE, user_id=user, grade=grade)
+        for journal, user in VLE.models.AssignmentParticipation.objects.filter(
+            journal__in=journal_grades.keys()).values_list('journal', 'user')
+        for grade in journal_grades[journal]
+    ])
+
+
+@shared_task
+def generate_new_comment_notifications(comment_id):
+    comment = VLE.models.Comment.objects.select_related('entry__node__journal__assignment', 'author').get(
+        pk=comment_id)
 
-    # Generate notifications for all other students in journal
-    for author in comment.entry.node.journal.authors.all().exclude(user=comment.author):
-        VLE.models.Notification.objects.create(
-            type=VLE.models.Notification.NEW_COMMENT,
-            user=author.user,
-            comment=comment,
-        )
+    # Generate notifications for supervisors even when commenter is not student,
+    # and for all other students in journal
+    VLE.models.Notification.objects.bulk_notify(
+        VLE.models.Notification.NEW_COMMENT,
+        [
+            *VLE.permissions.get_supervisors_of(comment.entry.node.journal).exclude(
+                pk=comment.author.pk).values_list('pk', flat=True),
+            *comment.entry.node.journal.authors.exclude(user=comment.author).values_list('user', flat=True),
+        ],
+        comment=comment,
+    )
 
 
 @shared_task
@@ -55,9 +84,8 @@ def generate_new_entry_notifications(entry_id, node_id):
         # see UnlimitedEntryFactory.fix_node
         entry.node = VLE.models.Node.objects.select_related('journal', 'journal__assignment').get(pk=node_id)
 
-    for user in VLE.permissions.get_supervisors_of(entry.node.journal):
-        VLE.models.Notification.objects.create(
-            type=VLE.models.Notification.NEW_ENTRY,
-            user=user,
-            entry=entry,
-        )
+    VLE.models.Notification.objects.bulk_notify(
+        VLE.models.Notification.NEW_ENTRY,
+        VLE.permissions.get_supervisors_of(entry.node.journal),
+        entry=entry,
+    )
@@ -3,29 +3,99 @@ timeline.py.
 
 Useful timeline functions.
 """
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import prefetch_related_objects
 from django.utils import timezone
 
-from VLE.models import Entry, Node, Template
+from VLE.models import Entry, JournalStats, Node, PresetNode, Template
 from VLE.serializers import EntrySerializer, FileSerializer, TemplateSerializer
 
 
+def get_etag(journal, user):
+    """
+    Returns an ETag identifying the timeline of the journal as serialized for the user.
+
+    Besides the timeline version of the journal, this includes the visibility scope of the user and the number of
+    assignment and preset dates which have passed, as these (un)lock entries and move the add node.
+    """
+    version = JournalStats.objects.values_list('timeline_version', flat=True).get(journal=journal)
+
+    assignment = journal.assignment
+    dates = [assignment.unlock_date, assignment.due_date, assignment.lock_date]
+    for preset_dates in PresetNode.objects.filter(format=assignment.format_id).values_list(
+            'unlock_date', 'due_date', 'lock_date'):
+        dates += preset_dates
+    now = timezone.now()
+    passed_dates = sum(1 for date in dates if date and date <= now)
+
+    scope = [
+        user.pk,
+        journal.can_see_drafted_entries(user),
+        journal.can_add(user),
+        user.has_permission('can_grade', assignment),
+    ]
+
+    return '"{}"'.format('-'.join(str(int(part)) for part in [journal.pk, version, passed_dates, *scope]))
+
+
+def get_cached_nodes(journal, user, etag):
+    """
+    Returns `get_nodes` of the journal for the user, cached server side under its ETag if enabled.
+
+    As the ETag changes whenever the serialized timeline does, cached timelines never need to be invalidated.
+    """
+    if not settings.TIMELINE_CACHE_TIMEOUT:
+        return get_nodes(journal, user)
+
+    key = 'timeline-{}'.format(etag.strip('"'))
+    nodes = cache.get(key)
+    if nodes is None:
+        nodes = get_nodes(journal, user)
+        cache.set(key, nodes, settings.TIMELINE_CACHE_TIMEOUT)
+
+    return nodes
+
+
 def get_nodes(journal, user=None):
     """Convert a journal to a list of node dictionaries.
 
     First sorts the nodes on date, then attempts to add an
     add-node if the user can add to the journal, the subsequent
     progress node is in the future and maximally one.
+
+    The entries and forced templates of all nodes are fetched up front, so the number of queries does not depend
+    on the number of nodes.
     """
     needs_add_node = journal.can_add(user)
+    # Shared by all entry serializers, so the grade permission is checked only once
+    context = {'user': user}
+    if user:
+        context['can_grade'] = user.has_permission('can_grade', journal.assignment)
 
-    node_qry = journal.get_sorted_nodes(user=user).select_related(
+    nodes = list(journal.get_sorted_nodes(user=user).select_related(
         'preset__forced_template',
     ).prefetch_related(
         'preset__attached_files',
-    )
+    ))
+
+    entries = {
+        entry.pk: entry
+        for entry in EntrySerializer.setup_eager_loading(
+            Entry.objects.filter(pk__in=[node.entry_id for node in nodes if node.entry_id]))
+    }
+    # The entry template is selected, so its nested relations are not covered by the entry prefetch.
+    prefetch_related_objects(
+        [entry.template for entry in entries.values()], *TemplateSerializer.prefetch_related)
+    templates = {
+        template.pk: template
+        for template in TemplateSerializer.setup_eager_loading(Template.objects.filter(pk__in=[
+            node.preset.forced_template_id for node in nodes if node.is_deadline and node.preset
+        ]))
+    }
 
     node_list = []
-    for node in node_qry:
+    for node in nodes:
         # Add an add node to the timeline before the first progress goal with a deadline in the future.
         # NOTE: Order is relevant
         if node.is_progress:
@@ -38,9 +108,12 @@ def get_nodes(journal, user=None):
 
             node_list.append(get_progress(journal, node))
         elif node.is_entry:
-            node_list.append(get_entry_node(journal, node, user))
+            node_list.append(get_entry_node(journal, node, user, entry=entries.get(node.entry_id), context=context))
         elif node.is_deadline:
-            node_list.append(get_deadline(journal, node, user))
+            node_list.append(get_deadline(
+                journal, node, user, entry=entries.get(node.entry_id), context=context,
+                template=templates.get(node.preset.forced_template_id) if node.preset else None,
+            ))
 
     if needs_add_node:
         add_node = get_add_node(journal)
@@ -72,11 +145,16 @@ def get_add_node(journal):
     }
 
 
-def get_entry_node(journal, node, user):
-    entry_data = EntrySerializer(
-        EntrySerializer.setup_eager_loading(Entry.objects.filter(node=node))[0],
-        context={'user': user}
-    ).data if node.entry else None
+def _serialize_entry(node, user, entry=None, context=None):
+    """Serializes the entry of the node, the given entry is used if already (eagerly) fetched."""
+    if entry is None and node.entry_id:
+        entry = EntrySerializer.setup_eager_loading(Entry.objects.filter(node=node)).first()
+
+    return EntrySerializer(entry, context=context or {'user': user}).data if entry else None
+
+
+def get_entry_node(journal, node, user, entry=None, context=None):
+    entry_data = _serialize_entry(node, user, entry, context)
 
     return {
         'type': node.type,
@@ -86,15 +164,15 @@ def get_entry_node(journal, node, user):
     } if node else None
 
 
-def get_deadline(journal, node, user):
-    """Convert entrydeadline to a dictionary."""
+def get_deadline(journal, node, user, entry=None, template=None, context=None):
+    """Convert entrydeadline to a dictionary.
+
+    The entry and forced template are fetched unless already provided (eagerly loaded).
+    """
     if not node:
         return None
 
-    entry_data = EntrySerializer(
-        EntrySerializer.setup_eager_loading(Entry.objects.filter(node=node)).first(),
-        context={'user': user}
-    ).data if node.entry else None
+    entry_data = _serialize_entry(node, user, entry, context)
 
     node_data = {
         'type': node.type,
@@ -112,7 +190,8 @@ def get_deadline(journal, node, user):
         # NOTE: 'template' duplicate serialization, Entry also serializes its template.
         # Is it needed to serialize the template, if an Entry is present?
         'template': TemplateSerializer(
-            TemplateSerializer.setup_eager_loading(Template.objects.filter(pk=node.preset.forced_template_id)).get(),
+            template or TemplateSerializer.setup_eager_loading(
+                Template.objects.filter(pk=node.preset.forced_template_id)).get(),
             context={'user': user},
         ).data,
         'attached_files': FileSerializer(node.preset.attached_files, many=True).data,
@@ -1,18 +1,32 @@
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from sentry_sdk import configure_scope
+from sentry_sdk.scope import add_global_event_processor
 
 import VLE.models
 import VLE.serializers
 
 
 def set_sentry_user_scope(user):
+    """Sets the user reported along with errors, the permissions of the user are added once an error is reported."""
     with configure_scope() as scope:
         scope.user = {
-            **VLE.serializers.OwnUserSerializer(user).data,
+            **{field: getattr(user, field) for field in VLE.serializers.OwnUserSerializer.Meta.fields
+               if field != 'permissions'},
             'id': user.pk,
         }
 
 
+@add_global_event_processor
+def add_sentry_user_permissions(event, hint):
+    """Adds the permissions of the user to a reported error, these take multiple queries to serialize."""
+    user = event.get('user')
+    if user and user.get('id') is not None and 'permissions' not in user:
+        user['permissions'] = VLE.serializers.OwnUserSerializer(
+            VLE.models.User.objects.get(pk=user['id'])).data['permissions']
+
+    return event
+
+
 class SentryContextAwareJWTAuthentication(JWTAuthentication):
     """Sets context data related to the user authenticated via JWT."""
     def authenticate(self, request):
@@ -0,0 +1,55 @@
+"""
+email_handling.py.
+
+Sending batches of emails over shared backend connections.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+
+def _send_chunk(messages, attempts):
+    connection = get_connection()
+    errors = []
+    try:
+        connection.open()
+        for message in messages:
+            message.connection = connection
+            error = None
+            for _ in range(attempts):
+                try:
+                    message.send()
+                    error = None
+                    break
+                except Exception as e:
+                    error = e
+            errors.append(error)
+    finally:
+        connection.close()
+
+    return errors
+
+
+def send_messages(messages, batch_size=None, attempts=None, workers=None):
+    """Sends the email messages, reusing a single backend connection for each batch of messages.
+
+    Every message is attempted up to `attempts` times. The batches are sent by at most `workers` concurrent threads.
+    Defaults to the EMAIL_BATCH_SIZE, EMAIL_SEND_ATTEMPTS and EMAIL_SEND_WORKERS settings.
+
+    Returns for each message the exception of its last attempt, or None if it was sent.
+    """
+    batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+    attempts = attempts or settings.EMAIL_SEND_ATTEMPTS
+    workers = workers or settings.EMAIL_SEND_WORKERS
+
+    messages = list(messages)
+    batches = [messages[i:i + batch_size] for i in range(0, len(messages), batch_size)]
+
+    if workers > 1 and len(batches) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(batches))) as executor:
+            results = list(executor.map(lambda batch: _send_chunk(batch, attempts), batches))
+    else:
+        results = [_send_chunk(batch, attempts) for batch in batches]
+
+    return [error for errors in results for error in errors]
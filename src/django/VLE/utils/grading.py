@@ -1,12 +1,16 @@
 
+import datetime
+
 from celery import shared_task
 from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, prefetch_related_objects
 from django.utils import timezone
 from sentry_sdk import capture_exception, push_scope
 
-from VLE import factory
-from VLE.lti_grade_passback import GradePassBackRequest
-from VLE.models import AssignmentParticipation, Comment, Entry, Journal
+from VLE.lti_grade_passback import GradePassBackRequest, send_post_requests
+from VLE.models import AssignmentParticipation, Comment, Counter, Entry, Grade, Journal, PendingPassback
+from VLE.tasks.notifications import generate_new_grade_notifications
 from VLE.utils.error_handling import LmsGradingResponseException
 
 
@@ -16,23 +20,98 @@ def publish_all_journal_grades(journal, publisher):
     - journal: the journal in question
     - publisher: the publisher of the grade
     """
-    entries = Entry.objects.filter(node__journal=journal).exclude(grade=None)
+    publish_grades([journal.pk], publisher)
+
+
+def publish_grades(journal_pks, publisher):
+    """Publish the unpublished grades of all entries of the journals at once.
+
+    A published copy of the latest grade of each of these entries is created by the publisher, the entries are pointed
+    to their new grade in a single update, and the comments of all graded entries are published.
+    The grade notifications are created in batches in the background, the LMS passback is left to the pending outbox.
+
+    returns the pks of the new grades.
+    """
+    journal_pks = list(journal_pks)
+    with transaction.atomic():
+        entries = Entry.objects.filter(node__journal__in=journal_pks, grade__published=False)
+        grades = Grade.objects.bulk_create([
+            Grade(entry_id=entry, grade=grade, published=True, author=publisher)
+            for entry, grade in entries.values_list('pk', 'grade__grade')
+        ])
+        grade_pks = [grade.pk for grade in grades]
+
+        # Equivalent to `Entry.save`, which sets the latest grade as the grade of the entry
+        latest_grade = Grade.objects.filter(entry=OuterRef('pk')).order_by('-creation_date', '-pk').values('pk')[:1]
+        Entry.objects.filter(pk__in=[grade.entry_id for grade in grades]).update(
+            grade=Subquery(latest_grade),
+            update_date=timezone.now(),
+        )
+        Comment.objects.filter(entry__node__journal__in=journal_pks).exclude(entry__grade=None).update(published=True)
+        Journal.all_objects.filter(pk__in=journal_pks).refresh_stats()
+        PendingPassback.objects.enqueue(journal_pks)
+
+    for i in range(0, len(grade_pks), Grade.NOTIFICATION_BATCH_SIZE):
+        generate_new_grade_notifications.apply_async(
+            args=[grade_pks[i:i + Grade.NOTIFICATION_BATCH_SIZE]], countdown=settings.WEBSERVER_TIMEOUT)
 
-    for entry in entries:
-        factory.make_grade(entry, publisher.pk, entry.grade.grade, True)
+    return grade_pks
 
-    Comment.objects.filter(entry__node__journal=journal).exclude(entry__grade=None).update(published=True)
+
+def send_pending_passbacks(window=None):
+    """Send the grade passbacks which have been pending for at least the window (in seconds).
+
+    Every journal, or author of a journal, is sent once with its latest state, no matter how often it was requested.
+    A pending passback of a journal includes all its authors, pending passbacks of those authors are coalesced into it.
+    The total number of requested and sent passbacks is kept in the 'passback_requests' and 'passback_sends' counters.
+
+    returns the number of requested, sent and coalesced passbacks, the results and the passback reports.
+    """
+    window = settings.LTI_PASSBACK_WINDOW if window is None else window
+    pending = PendingPassback.objects.drain(timezone.now() - datetime.timedelta(seconds=window))
+
+    journal_pks = {passback.journal_id for passback in pending if passback.author_id is None}
+    authors = [
+        passback for passback in pending
+        if passback.author_id is not None and (passback.left_journal or passback.journal_id not in journal_pks)
+    ]
+    journals = Journal.objects.with_annotations('grade').in_bulk(
+        journal_pks | {passback.journal_id for passback in authors})
+    journal_pks &= journals.keys()
+    authors = [passback for passback in authors if passback.journal_id in journals]
+
+    journal_results, journal_report = send_journals_status_to_LMS(journals[pk] for pk in journal_pks)
+    author_results, author_report = send_authors_status_to_LMS(
+        [(journals[passback.journal_id], passback.author) for passback in authors if not passback.left_journal])
+    left_results, left_report = send_authors_status_to_LMS(
+        [(journals[passback.journal_id], passback.author) for passback in authors if passback.left_journal],
+        left_journal=True,
+    )
+
+    requests = sum(passback.requests for passback in pending)
+    sends = len(journal_pks) + len(authors)
+    Counter.increment('passback_requests', requests)
+    Counter.increment('passback_sends', sends)
+
+    return {
+        'requests': requests,
+        'sent': sends,
+        'coalesced': requests - sends,
+        'journals': journal_results,
+        'authors': author_results + left_results,
+        'reports': [journal_report, author_report, left_report],
+    }
 
 
 @shared_task
 def task_bulk_send_journal_status_to_LMS(journal_pks):
-    for journal_pk in journal_pks:
-        task_journal_status_to_LMS(journal_pk)
+    results, report = send_journals_status_to_LMS(Journal.objects.with_annotations('grade').filter(pk__in=journal_pks))
+    return {'journals': results, 'report': report}
 
 
 @shared_task
 def task_journal_status_to_LMS(journal_pk):
-    return send_journal_status_to_LMS(Journal.objects.get(pk=journal_pk))
+    return send_journal_status_to_LMS(Journal.objects.with_annotations('grade').get(pk=journal_pk))
 
 
 def send_journal_status_to_LMS(journal):
@@ -43,56 +122,97 @@ def send_journal_status_to_LMS(journal):
 
     returns the lti reponse.
     """
-    if not journal.authors.exists():
-        return None
+    return send_journals_status_to_LMS([journal])[0][journal.pk]
 
-    Entry.objects.filter(node__in=journal.published_nodes).exclude(vle_coupling=Entry.LINK_COMPLETE) \
-        .update(vle_coupling=Entry.NEEDS_GRADE_PASSBACK)
 
-    response = {}
-    failed = False
-    for author in journal.authors.all():
-        response[author.id] = send_author_status_to_LMS(journal, author)
-        if not response[author.id]['successful']:
-            failed = True
+def send_journals_status_to_LMS(journals):
+    """Replace the grades of the journals on the LTI instance, see `send_journal_status_to_LMS`.
 
-    if not failed:
-        Entry.objects.filter(node__in=journal.published_nodes).update(vle_coupling=Entry.LINK_COMPLETE)
-        Entry.objects.filter(node__in=journal.unpublished_nodes).update(vle_coupling=Entry.SENT_SUBMISSION)
+    The grade passback requests of all authors of all journals are sent concurrently, see `send_post_requests`.
 
-    return {
-        'successful': not failed,
-        **response,
-    }
+    returns the lti response per journal pk, and the passback report.
+    """
+    journals = [journal for journal in journals]
+    prefetch_related_objects(journals, 'authors__user')
+
+    for journal in journals:
+        if journal.authors.all():
+            Entry.objects.filter(node__in=journal.published_nodes).exclude(vle_coupling=Entry.LINK_COMPLETE) \
+                .update(vle_coupling=Entry.NEEDS_GRADE_PASSBACK)
+
+    journal_authors = [(journal, author) for journal in journals for author in journal.authors.all()]
+    author_results, report = send_authors_status_to_LMS(journal_authors)
+
+    results = {journal.pk: None for journal in journals}
+    for (journal, author), result in zip(journal_authors, author_results):
+        results[journal.pk] = results[journal.pk] or {'successful': True}
+        results[journal.pk][author.id] = result
+        results[journal.pk]['successful'] &= result['successful']
+
+    for journal in journals:
+        if results[journal.pk] and results[journal.pk]['successful']:
+            Entry.objects.filter(node__in=journal.published_nodes).update(vle_coupling=Entry.LINK_COMPLETE)
+            Entry.objects.filter(node__in=journal.unpublished_nodes).update(vle_coupling=Entry.SENT_SUBMISSION)
+
+    return results, report
 
 
 @shared_task
 def task_author_status_to_LMS(journal_pk, author_pk, left_journal=False):
     return send_author_status_to_LMS(
-        Journal.objects.get(pk=journal_pk), AssignmentParticipation.objects.get(pk=author_pk), left_journal)
+        Journal.objects.with_annotations('grade').get(pk=journal_pk),
+        AssignmentParticipation.objects.get(pk=author_pk),
+        left_journal,
+    )
 
 
 def send_author_status_to_LMS(journal, author, left_journal=False):
     """Send the status of about the author of the journal to both the teacher and the author"""
+    return send_authors_status_to_LMS([(journal, author)], left_journal=left_journal)[0][0]
+
+
+def send_authors_status_to_LMS(journal_authors, left_journal=False):
+    """Send the status of each (journal, author) pair, see `send_author_status_to_LMS`.
+
+    The grade passback requests are sent concurrently, see `send_post_requests`.
+
+    returns the result per pair, and the passback report.
+    """
+    passbacks = [_author_passback(journal, author, left_journal) for journal, author in journal_authors]
+    grade_requests = [
+        request for passback in passbacks for request in [passback.get('to_student'), passback.get('to_teacher')]
+        if request is not None
+    ]
+    responses, report = send_post_requests(grade_requests)
+    responses = dict(zip(grade_requests, responses))
+
+    return [_author_passback_result(passback, responses) for passback in passbacks], report
+
+
+def _author_passback(journal, author, left_journal=False):
+    """Determine the grade passback requests to send about the author of the journal to the student and teacher.
+
+    returns a dictionary holding either the unsuccessful result, or the requests to send.
+    """
     if author not in journal.authors.all() and not left_journal:
-        return {
+        return {'result': {
             'description': '{} not in journal {}'.format(author.user.full_name, journal.to_string()),
             'code_mayor': 'error',
             'successful': False,
-        }
+        }}
 
     if author.sourcedid is None:
-        return {
+        return {'result': {
             'description': '{} has no sourcedid'.format(author.to_string(user=author.user)),
             'code_mayor': 'error',
             'successful': False,
-        }
+        }}
     if author.grade_url is None:
-        return {
+        return {'result': {
             'description': '{} has no grade_url'.format(author.to_string(user=author.user)),
             'code_mayor': 'error',
             'successful': False,
-        }
+        }}
 
     course = journal.assignment.get_active_course(author.user)
     if not left_journal:
@@ -109,9 +229,9 @@ def send_author_status_to_LMS(journal, author, left_journal=False):
         grade = journal.grade if not journal.assignment.remove_grade_upon_leaving_group else 0
 
     submitted_at = None
+    passback = {'journal': journal, 'to_student': None, 'to_teacher': None}
 
     # Send student latest grade. But only send it when there are new entries OR grade changed
-    response_student = None
     if journal.published_nodes.filter(entry__vle_coupling=Entry.NEEDS_GRADE_PASSBACK).exists() or \
        journal.LMS_grade != grade:
         if journal.LMS_grade != grade:
@@ -119,16 +239,9 @@ def send_author_status_to_LMS(journal, author, left_journal=False):
         else:
             submitted_at = str(journal.published_nodes.last().entry.last_edited)
         # TODO This is reached, now how to show this in a test
-        grade_request = GradePassBackRequest(
+        passback['to_student'] = GradePassBackRequest(
             author, grade, result_data=result_data, send_score=True, submitted_at=submitted_at)
-        response_student = grade_request.send_post_request()
-        response_student['old_grade'] = journal.LMS_grade
-        response_student['new_grade'] = journal.grade
-        if response_student['code_mayor'] == 'success':
-            journal.LMS_grade = journal.grade
-            journal.save()
 
-    response_teacher = None
     if not left_journal:
         # Notify teacher about last ungraded submission
         if journal.unpublished_nodes.exists():
@@ -138,9 +251,30 @@ def send_author_status_to_LMS(journal, author, left_journal=False):
                     journal.unpublished_nodes.first().pk)
             }
             submitted_at = str(journal.unpublished_nodes.first().entry.last_edited)
-            grade_request = GradePassBackRequest(
+            passback['to_teacher'] = GradePassBackRequest(
                 author, grade, result_data=result_data, send_score=False, submitted_at=submitted_at)
-            response_teacher = grade_request.send_post_request()
+
+    return passback
+
+
+def _author_passback_result(passback, responses):
+    """Process the responses to the grade passback requests determined by `_author_passback`."""
+    if 'result' in passback:
+        return passback['result']
+
+    journal = passback['journal']
+    response_student = None
+    if passback['to_student'] is not None:
+        response_student = responses[passback['to_student']]
+        response_student['old_grade'] = journal.LMS_grade
+        response_student['new_grade'] = journal.grade
+        if response_student['code_mayor'] == 'success':
+            journal.LMS_grade = journal.grade
+            journal.save()
+
+    response_teacher = None
+    if passback['to_teacher'] is not None:
+        response_teacher = responses[passback['to_teacher']]
 
     successful = (response_teacher is None or response_teacher['code_mayor'] == 'success') and \
         (response_student is None or response_student['code_mayor'] == 'success')
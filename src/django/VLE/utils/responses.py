@@ -8,7 +8,7 @@ to receive the appropriate error code.
 from urllib import parse
 
 from django.conf import settings
-from django.http import FileResponse, HttpResponse, JsonResponse
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, JsonResponse
 from sentry_sdk import capture_exception, capture_message
 
 import VLE.models
@@ -43,6 +43,13 @@ def created(payload={}, description=''):
     return json_response(payload=payload, description=description, status=201)
 
 
+def not_modified(etag):
+    """Returns an empty response with status 304: Not Modified, used when the resource matches the client's ETag."""
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
+
+
 def bad_request(description='Something went wrong.', exception=None):
     """Calls a json_response with status 400: Bad Request.
 
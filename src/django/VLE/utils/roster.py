@@ -0,0 +1,186 @@
+"""
+Bulk course roster import
+"""
+import csv
+import io
+import json
+
+from django.conf import settings
+from django.db import transaction
+
+import VLE.permissions
+from VLE.models import Group, Participation, Role, User
+from VLE.tasks import send_invite_emails
+from VLE.utils.error_handling import VLEBadRequest
+
+ROSTER_FIELDS = ['username', 'full_name', 'email', 'lti_id', 'role', 'groups']
+CSV_GROUP_SEPARATOR = ';'
+DEFAULT_ROLE = 'Student'
+BATCH_SIZE = 500
+
+
+def parse_roster(content, roster_format='csv'):
+    """Parses a roster into a list of rows (dicts with a subset of the `ROSTER_FIELDS`).
+
+    A CSV roster starts with a header row naming its columns, the groups of a row are separated by semicolons.
+    A JSON roster is a list of objects, the groups of a row are a list of group names.
+    """
+    if roster_format == 'json':
+        try:
+            return json.loads(content)
+        except ValueError:
+            raise VLEBadRequest('Roster is not valid JSON.')
+
+    if roster_format == 'csv':
+        rows = []
+        for row in csv.DictReader(io.StringIO(content)):
+            if row.get('groups'):
+                row['groups'] = row['groups'].split(CSV_GROUP_SEPARATOR)
+            rows.append(row)
+        return rows
+
+    raise VLEBadRequest('Unknown roster format {}, should be csv or json.'.format(roster_format))
+
+
+def clean_roster(rows):
+    """Removes excess whitespace and empty values, and validates that the roster rows identify unique users.
+
+    The role defaults to `DEFAULT_ROLE`, the groups are a set of group names.
+    """
+    def clean(value):
+        return ' '.join(str(value).split()) if value is not None else ''
+
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise VLEBadRequest('A roster should be a list of users.')
+    if not all(isinstance(row.get('groups') or [], (list, set)) for row in rows):
+        raise VLEBadRequest('The groups of a user should be a list of group names.')
+
+    cleaned = []
+    for i, row in enumerate(rows):
+        username = clean(row.get('username'))
+        if not username:
+            raise VLEBadRequest('Row {} of the roster has no username.'.format(i + 1))
+        cleaned.append({
+            'username': username,
+            'full_name': clean(row.get('full_name')),
+            'email': clean(row.get('email')) or None,
+            'lti_id': clean(row.get('lti_id')) or None,
+            'role': clean(row.get('role')) or DEFAULT_ROLE,
+            'groups': {clean(group) for group in row.get('groups') or [] if clean(group)},
+        })
+
+    for field in ['username', 'email', 'lti_id']:
+        values = set()
+        duplicates = [
+            row[field] for row in cleaned
+            if row[field] and (row[field].lower() in values or values.add(row[field].lower()))
+        ]
+        if duplicates:
+            raise VLEBadRequest('Duplicate {}s in the roster: {}.'.format(field, ', '.join(duplicates)))
+
+    return cleaned
+
+
+def _new_user(row):
+    """Unsaved user of a roster row. LTI users log in through the LMS, other users are invited to set a password."""
+    user = User(username=row['username'], full_name=row['full_name'], email=row['email'], lti_id=row['lti_id'],
+                verified_email=bool(row['lti_id']) and bool(row['email']), is_active=bool(row['lti_id']),
+                profile_picture=settings.DEFAULT_PROFILE_PICTURE)
+    user.set_unusable_password()
+    return user
+
+
+def import_roster(course, rows, notify_users=True, batch_size=BATCH_SIZE, progress=None):
+    """Upserts the users of the roster rows, their participations, roles and group memberships in the course.
+
+    Users are matched on their username, existing users are left as they are. New users without an LTI id are
+    invited by email. Missing groups are created by name, memberships are only added.
+    New participations are created with `ParticipationQuerySet.bulk_create`, which connects the users to the assignments
+    (and journals) of the course and notifies them in batches. Importing the same roster again changes nothing.
+    The rows are imported per batch of {batch_size}, after each batch {progress} is called with the number of
+    imported and total rows.
+
+    returns the number of created users, participations, groups, memberships and updated roles.
+    """
+    rows = clean_roster(rows)
+    roles = {role.name: role for role in Role.objects.filter(course=course)}
+    unknown_roles = {row['role'] for row in rows} - roles.keys()
+    if unknown_roles:
+        raise VLEBadRequest('Unknown roles in the roster: {}.'.format(', '.join(sorted(unknown_roles))))
+
+    existing_users = {
+        user.username.lower(): user for user in User.objects.filter(username__in=[row['username'] for row in rows])}
+    new_rows = [row for row in rows if row['username'].lower() not in existing_users]
+    missing_names = [row['username'] for row in new_rows if not row['full_name']]
+    if missing_names:
+        raise VLEBadRequest('No full name is provided for the new users: {}.'.format(', '.join(missing_names)))
+    missing_emails = [row['username'] for row in new_rows if not row['email'] and not row['lti_id']]
+    if missing_emails:
+        raise VLEBadRequest('No email address is provided for the new users: {}.'.format(', '.join(missing_emails)))
+    taken = list(User.objects.filter(email__in=[row['email'] for row in new_rows if row['email']]).values_list(
+        'email', flat=True)) + list(User.objects.filter(
+            lti_id__in=[row['lti_id'] for row in new_rows if row['lti_id']]).values_list('lti_id', flat=True))
+    if taken:
+        raise VLEBadRequest('Email addresses or LTI ids of other users in the roster: {}.'.format(
+            ', '.join(sorted(taken))))
+
+    counts = {'users': 0, 'participations': 0, 'roles': 0, 'groups': 0, 'memberships': 0}
+    group_names = set().union(*[row['groups'] for row in rows])
+    groups = {}
+    for group in Group.objects.filter(course=course, name__in=group_names).order_by('pk'):
+        groups.setdefault(group.name, group)
+    with transaction.atomic():
+        for group in Group.objects.bulk_create([
+                Group(course=course, name=name) for name in sorted(group_names - groups.keys())]):
+            groups[group.name] = group
+            counts['groups'] += 1
+
+    for i in range(0, len(rows), batch_size):
+        batch = rows[i:i + batch_size]
+        with transaction.atomic():
+            new_users = User.objects.bulk_create(
+                [_new_user(row) for row in batch if row['username'].lower() not in existing_users])
+            existing_users.update({user.username.lower(): user for user in new_users})
+            counts['users'] += len(new_users)
+            users = [existing_users[row['username'].lower()] for row in batch]
+
+            participations = {
+                participation.user_id: participation
+                for participation in Participation.objects.filter(course=course, user__in=users)
+            }
+            changed_roles = []
+            for row, user in zip(batch, users):
+                role = roles[row['role']]
+                if user.pk in participations and participations[user.pk].role_id != role.pk:
+                    participations[user.pk].role = role
+                    changed_roles.append(participations[user.pk])
+            Participation.objects.bulk_update(changed_roles, ['role'])
+            counts['roles'] += len(changed_roles)
+
+            new_participations = Participation.objects.bulk_create([
+                Participation(user=user, course=course, role=roles[row['role']])
+                for row, user in zip(batch, users) if user.pk not in participations
+            ], notify_users=notify_users)
+            participations.update({participation.user_id: participation for participation in new_participations})
+            counts['participations'] += len(new_participations)
+
+            memberships = set(Participation.groups.through.objects.filter(
+                participation__in=participations.values()).values_list('participation', 'group'))
+            new_memberships = Participation.groups.through.objects.bulk_create([
+                Participation.groups.through(participation_id=participations[user.pk].pk, group_id=groups[name].pk)
+                for row, user in zip(batch, users) for name in sorted(row['groups'])
+                if (participations[user.pk].pk, groups[name].pk) not in memberships
+            ])
+            counts['memberships'] += len(new_memberships)
+
+            VLE.permissions.clear_permission_matrices()
+            if settings.PERMISSION_CACHE_TIMEOUT:
+                VLE.permissions.invalidate_permission_cache([user.pk for user in users])
+
+        invited = [user.pk for user in new_users if not user.is_active]
+        if invited:
+            send_invite_emails.delay(invited)
+        if progress:
+            progress(i + len(batch), len(rows))
+
+    return counts
@@ -1,10 +1,17 @@
 """
 Utility functions in relation to generic statistics
 """
+from django.db.models import OuterRef
 
 import VLE.models
 
 
+def _get_shared_courses(assignment, user, course=None):
+    if course is None:
+        return assignment.courses.filter(users=user)
+    return VLE.models.Course.objects.filter(pk=course.pk, users=user)
+
+
 def get_user_lists_with_scopes(assignment, user, course=None):
     """Get lists of users in [assignment] in different scopes connected to [user].
     Allows for setting [course] to limit the users retrieved to only being from that course.
@@ -24,12 +31,33 @@ def get_user_lists_with_scopes(assignment, user, course=None):
         The assumption that all of of [course] participation users have APs in a linked assignment is False on
         production. Otherwise p_all could simply be `course.participation_set.all()`
     """
-    if course is None:
-        shared_courses = assignment.courses.filter(users=user)
-    else:
-        shared_courses = VLE.models.Course.objects.filter(pk=course.pk, users=user)
+    shared_courses = _get_shared_courses(assignment, user, course=course)
 
     return {
         'all': assignment.get_all_users(courses=shared_courses, user=user),
         'own': assignment.get_users_in_own_groups(courses=shared_courses, user=user)
     }
+
+
+def get_author_participations_with_scopes(assignment, user, course=None):
+    """Get the participations of the authors of a journal in the same scopes as `get_user_lists_with_scopes`.
+
+    The participations are correlated to the journal via `OuterRef('pk')`, so they are meant to be used in an
+    `Exists` annotation on journals of [assignment]. A journal is in a scope if any of its authors is.
+
+    Returns:
+        dict:
+            - all: Participations of the journal authors in the courses [user] shares with [assignment].
+            - own: Subset of all which are in a group of [user].
+    """
+    shared_courses = _get_shared_courses(assignment, user, course=course)
+    participations = VLE.models.Participation.objects.filter(
+        course__in=shared_courses,
+        user__assignmentparticipation__journal=OuterRef('pk'),
+    )
+
+    return {
+        'all': participations,
+        'own': participations.filter(
+            groups__in=user.participation_set.filter(course__in=shared_courses).values('groups')),
+    }
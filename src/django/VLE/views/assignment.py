@@ -21,9 +21,9 @@ import VLE.utils.generic_utils as utils
 import VLE.utils.import_utils as import_utils
 import VLE.utils.responses as response
 import VLE.validators as validators
-from VLE.models import Assignment, Course, Group, Journal, PresetNode, Template, User
+from VLE.models import Assignment, Course, Group, Journal, PendingPassback, PresetNode, Template, User
 from VLE.serializers import AssignmentSerializer, CourseSerializer, SmallAssignmentSerializer, TeacherEntrySerializer
-from VLE.utils import file_handling, grading
+from VLE.utils import file_handling
 from VLE.utils.error_handling import VLEMissingRequiredKey, VLEParamWrongType
 from VLE.utils.file_handling import copy_assignment_related_rt_files
 
@@ -113,8 +113,8 @@ class AssignmentView(viewsets.ViewSet):
             course = settings.EXPLICITLY_WITHOUT_CONTEXT
             courses = request.user.participations.all()
 
-        query = SmallAssignmentSerializer.setup_eager_loading(Assignment.objects.filter(courses__in=courses).distinct())
-        viewable = [assignment for assignment in query if request.user.can_view(assignment)]
+        viewable = SmallAssignmentSerializer.setup_eager_loading(
+            Assignment.objects.filter(courses__in=courses).distinct().viewable_by(request.user))
         serializer = SmallAssignmentSerializer(viewable, many=True, context={'user': request.user, 'course': course})
 
         data = serializer.data
@@ -364,10 +364,9 @@ class AssignmentView(viewsets.ViewSet):
             courses = request.user.participations.all()
 
         now = timezone.now()
-        query = SmallAssignmentSerializer.setup_eager_loading(Assignment.objects.filter(
+        viewable = SmallAssignmentSerializer.setup_eager_loading(Assignment.objects.filter(
             Q(lock_date__gt=now) | Q(lock_date=None), courses__in=courses
-        ).distinct())
-        viewable = [assignment for assignment in query if request.user.can_view(assignment)]
+        ).distinct().viewable_by(request.user))
         upcoming = SmallAssignmentSerializer(
             viewable, context={'user': request.user, 'course': course}, many=True).data
 
@@ -457,7 +456,7 @@ class AssignmentView(viewsets.ViewSet):
         for j, b in bonuses.items():
             j.bonus_points = b
             j.save()
-        grading.task_bulk_send_journal_status_to_LMS.delay([journal.pk for journal in bonuses.keys()])
+        PendingPassback.objects.enqueue([journal.pk for journal in bonuses.keys()])
 
         return response.success()
 
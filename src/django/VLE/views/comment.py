@@ -56,15 +56,11 @@ class CommentView(viewsets.ViewSet):
         entry_id, = utils.required_params(request.query_params, "entry_id")
 
         entry = Entry.objects.get(pk=entry_id)
-        journal = Journal.objects.get(node__entry=entry)
-        assignment = journal.assignment
+        journal = Journal.objects.with_annotations('minimal').get(node__entry=entry)
 
         request.user.check_can_view(journal)
 
-        if request.user.has_permission('can_grade', assignment):
-            comments = Comment.objects.filter(entry=entry)
-        else:
-            comments = Comment.objects.filter(entry=entry, published=True)
+        comments = Comment.objects.filter(entry=entry).viewable_by(request.user)
 
         return response.success({
             'comments': CommentSerializer(
@@ -99,7 +95,7 @@ class CommentView(viewsets.ViewSet):
         published, = utils.optional_typed_params(request.data, (bool, 'published'))
 
         entry = Entry.objects.get(pk=entry_id)
-        journal = Journal.objects.get(node__entry=entry)
+        journal = Journal.objects.with_annotations('minimal').get(node__entry=entry)
         assignment = journal.assignment
 
         request.user.check_permission('can_comment', assignment)
@@ -37,7 +37,7 @@ def names(request, course_id, assignment_id, journal_id):
         result['assignment'] = assignment.name
 
     if journal_id:
-        journal = Journal.objects.get(pk=journal_id)
+        journal = Journal.objects.with_annotations('name').get(pk=journal_id)
         request.user.check_can_view(journal)
         result['journal'] = journal.name
 
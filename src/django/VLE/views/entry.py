@@ -13,8 +13,7 @@ import VLE.utils.entry_utils as entry_utils
 import VLE.utils.file_handling as file_handling
 import VLE.utils.generic_utils as utils
 import VLE.utils.responses as response
-from VLE.models import Entry, Field, FileContext, Journal, Node, Template
-from VLE.utils import grading
+from VLE.models import Entry, Field, FileContext, Journal, Node, PendingPassback, Template
 
 
 class EntryView(viewsets.ViewSet):
@@ -48,7 +47,7 @@ class EntryView(viewsets.ViewSet):
             (bool, 'is_draft', False),
         )
 
-        journal = Journal.objects.get(pk=journal_id, authors__user=request.user)
+        journal = Journal.objects.with_annotations('needs_lti_link').get(pk=journal_id, authors__user=request.user)
         assignment = journal.assignment
         template = Template.objects.get(pk=template_id)
 
@@ -85,7 +84,7 @@ class EntryView(viewsets.ViewSet):
 
         entry_utils.create_entry_content(content_dict, entry, request.user)
         # Notify teacher on new entry
-        grading.task_journal_status_to_LMS.delay(journal.pk)
+        PendingPassback.objects.enqueue([journal.pk])
 
         return response.created({
             'added': entry_utils.get_node_index(journal, node, request.user),
@@ -115,7 +114,7 @@ class EntryView(viewsets.ViewSet):
         title, is_draft = utils.optional_typed_params(request.data, (str, 'title'), (bool, 'is_draft', False))
         entry_id, = utils.required_typed_params(kwargs, (int, 'pk'))
         entry = Entry.objects.get(pk=entry_id)
-        journal = Journal.objects.get(node__entry=entry)
+        journal = Journal.objects.with_annotations('needs_lti_link').get(node__entry=entry)
         assignment = journal.assignment
 
         # Entries should not be able to be drafted when it is no longer editable
@@ -185,7 +184,7 @@ class EntryView(viewsets.ViewSet):
                 file_handling.establish_file(request.user, file_context=fc, content=old_content,
                                              in_rich_text=old_content.field.type == Field.RICH_TEXT)
 
-        grading.task_journal_status_to_LMS.delay(journal.pk)
+        PendingPassback.objects.enqueue([journal.pk])
         entry.last_edited_by = request.user
         entry.last_edited = timezone.now()
         entry.title = title
@@ -212,7 +211,7 @@ class EntryView(viewsets.ViewSet):
         pk, = utils.required_typed_params(kwargs, (int, 'pk'))
 
         entry = Entry.objects.get(pk=pk)
-        journal = Journal.objects.get(node__entry=entry)
+        journal = Journal.objects.with_annotations('needs_lti_link').get(node__entry=entry)
         assignment = journal.assignment
 
         if journal.authors.filter(user=request.user).exists():
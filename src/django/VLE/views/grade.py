@@ -10,7 +10,7 @@ import VLE.factory as factory
 import VLE.utils.generic_utils as utils
 import VLE.utils.grading as grading
 import VLE.utils.responses as response
-from VLE.models import Assignment, Comment, Entry, Journal
+from VLE.models import Assignment, Comment, Entry, Journal, PendingPassback
 from VLE.serializers import EntrySerializer, GradeHistorySerializer
 
 
@@ -73,7 +73,7 @@ class GradeView(viewsets.ViewSet):
                                                                  (bool, 'published'))
 
         entry = Entry.objects.get(pk=entry_id)
-        journal = Journal.objects.get(node__entry=entry)
+        journal = Journal.objects.with_annotations('minimal').get(node__entry=entry)
         assignment = journal.assignment
 
         request.user.check_permission('can_grade', assignment)
@@ -88,7 +88,7 @@ class GradeView(viewsets.ViewSet):
 
         if published:
             Comment.objects.filter(entry=entry).update(published=True)
-        grading.task_journal_status_to_LMS.delay(journal.pk)
+        PendingPassback.objects.enqueue([journal.pk])
 
         return response.created({
             'entry': EntrySerializer(
@@ -105,9 +105,7 @@ class GradeView(viewsets.ViewSet):
 
         request.user.check_permission('can_publish_grades', assignment)
 
-        journals = Journal.objects.filter(assignment=assignment, unpublished__gt=0).distinct()
-        for journal in journals:
-            grading.publish_all_journal_grades(journal, request.user)
-        grading.task_bulk_send_journal_status_to_LMS.delay(list(journals.values_list('pk', flat=True)))
+        grading.publish_grades(
+            Journal.objects.filter(assignment=assignment, unpublished__gt=0).values_list('pk', flat=True), request.user)
 
         return response.success()
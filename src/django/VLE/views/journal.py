@@ -10,7 +10,7 @@ import VLE.factory
 import VLE.utils.generic_utils as utils
 import VLE.utils.grading as grading
 import VLE.utils.responses as response
-from VLE.models import Assignment, AssignmentParticipation, Course, Journal, User
+from VLE.models import Assignment, AssignmentParticipation, Course, Journal, PendingPassback, User
 from VLE.serializers import AssignmentParticipationSerializer, JournalSerializer
 
 
@@ -85,7 +85,7 @@ class JournalView(viewsets.ViewSet):
         request.user.check_can_view(course)
 
         journals = JournalSerializer(
-            Journal.objects.filter(assignment=assignment).for_course(course),
+            Journal.objects.filter(assignment=assignment).for_course(course).order_by('pk'),
             many=True,
             context={
                 'user': request.user,
@@ -149,7 +149,7 @@ class JournalView(viewsets.ViewSet):
         Journal.objects.bulk_create(journals)
 
         serializer = JournalSerializer(
-            Journal.objects.filter(assignment=assignment), many=True, context={'user': request.user})
+            Journal.objects.filter(assignment=assignment).order_by('pk'), many=True, context={'user': request.user})
         return response.created({'journals': serializer.data})
 
     def partial_update(self, request, *args, **kwargs):
@@ -172,7 +172,7 @@ class JournalView(viewsets.ViewSet):
 
         """
         pk, = utils.required_typed_params(kwargs, (int, 'pk'))
-        journal = Journal.objects.get(pk=pk)
+        journal = Journal.objects.with_annotations('minimal').get(pk=pk)
 
         request.user.check_can_view(journal)
 
@@ -189,7 +189,7 @@ class JournalView(viewsets.ViewSet):
             req_data.pop('bonus_points', None)
             journal.bonus_points = bonus_points
             journal.save()
-            grading.task_journal_status_to_LMS.delay(journal.pk)
+            PendingPassback.objects.enqueue([journal.pk])
             return response.success({
                 'journal': JournalSerializer(Journal.objects.get(pk=journal.pk), context={'user': request.user}).data
             })
@@ -235,7 +235,7 @@ class JournalView(viewsets.ViewSet):
     def destroy(self, request, *args, **kwargs):
         """Deleting a journals"""
         journal_id, = utils.required_typed_params(kwargs, (int, 'pk'))
-        journal = Journal.objects.get(pk=journal_id)
+        journal = Journal.objects.with_annotations('minimal').get(pk=journal_id)
 
         request.user.check_can_view(journal.assignment)
         request.user.check_permission('can_manage_journals', journal.assignment)
@@ -252,7 +252,7 @@ class JournalView(viewsets.ViewSet):
     @action(['patch'], detail=True)
     def join(self, request, pk):
         """Become a member of a journal"""
-        journal = Journal.objects.get(pk=pk)
+        journal = Journal.objects.with_annotations('minimal').get(pk=pk)
 
         request.user.check_can_view(journal.assignment)
         request.user.check_permission('can_have_journal', journal.assignment)
@@ -272,7 +272,7 @@ class JournalView(viewsets.ViewSet):
 
         author = AssignmentParticipation.objects.get(assignment=journal.assignment, user=request.user)
         journal.add_author(author)
-        grading.task_author_status_to_LMS.delay(journal.pk, author.pk)
+        PendingPassback.objects.enqueue([journal.pk], author=author.pk)
 
         return response.success({
             'journal': JournalSerializer(Journal.objects.get(pk=journal.pk), context={'user': request.user}).data
@@ -281,7 +281,7 @@ class JournalView(viewsets.ViewSet):
     @action(['get'], detail=True)
     def get_members(self, request, pk):
         """Get the list of members of the journal."""
-        journal = Journal.objects.filter(pk=pk).select_related('assignment').get()
+        journal = Journal.objects.with_annotations('minimal').filter(pk=pk).select_related('assignment').get()
 
         can_view_journal = request.user.can_view(journal)
         can_have_journal_in_group_assignment = (
@@ -308,7 +308,7 @@ class JournalView(viewsets.ViewSet):
         request -- request data
             user_id -- user who joins the journal
         """
-        journal = Journal.objects.get(pk=pk)
+        journal = Journal.objects.with_annotations('minimal').get(pk=pk)
 
         request.user.check_permission('can_edit_assignment', journal.assignment)
 
@@ -337,7 +337,7 @@ class JournalView(viewsets.ViewSet):
         for user in users:
             author = AssignmentParticipation.objects.get(assignment=journal.assignment, user=user)
             journal.add_author(author)
-            grading.task_author_status_to_LMS.delay(journal.pk, author.pk)
+            PendingPassback.objects.enqueue([journal.pk], author=author.pk)
 
         return response.success({
             'authors': AssignmentParticipationSerializer(
@@ -350,7 +350,7 @@ class JournalView(viewsets.ViewSet):
     @action(['patch'], detail=True)
     def leave(self, request, pk):
         """Leave a journal"""
-        journal = Journal.objects.get(pk=pk)
+        journal = Journal.objects.with_annotations('minimal').get(pk=pk)
         request.user.check_can_view(journal.assignment)
 
         if not journal.assignment.is_group_assignment:
@@ -365,7 +365,7 @@ class JournalView(viewsets.ViewSet):
         author = AssignmentParticipation.objects.get(user=request.user, journal=journal)
         journal.remove_author(author)
 
-        grading.task_author_status_to_LMS.delay(journal.pk, author.pk, left_journal=True)
+        PendingPassback.objects.enqueue([journal.pk], author=author.pk, left_journal=True)
         return response.success(description='Successfully removed from the journal.')
 
     @action(['patch'], detail=True)
@@ -376,7 +376,7 @@ class JournalView(viewsets.ViewSet):
         request -- request data
             user_id -- user of student who gets kicked from the journal
         """
-        journal = Journal.objects.get(pk=pk)
+        journal = Journal.objects.with_annotations('minimal').get(pk=pk)
 
         request.user.check_permission('can_edit_assignment', journal.assignment)
 
@@ -392,12 +392,12 @@ class JournalView(viewsets.ViewSet):
         author = AssignmentParticipation.objects.get(user=user, journal=journal)
         journal.remove_author(author)
 
-        grading.task_author_status_to_LMS.delay(journal.pk, author.pk, left_journal=True)
+        PendingPassback.objects.enqueue([journal.pk], author=author.pk, left_journal=True)
         return response.success(description='Successfully removed {} from the journal.'.format(author.user.full_name))
 
     @action(['patch'], detail=True)
     def lock(self, request, pk):
-        journal = Journal.objects.get(pk=pk)
+        journal = Journal.objects.with_annotations('minimal').get(pk=pk)
 
         request.user.check_can_view(journal.assignment)
 
@@ -431,7 +431,6 @@ class JournalView(viewsets.ViewSet):
 
     def publish(self, request, journal):
         grading.publish_all_journal_grades(journal, request.user)
-        grading.task_journal_status_to_LMS.delay(journal.pk)
 
         return response.success({
             'journal': JournalSerializer(Journal.objects.get(pk=journal.pk), context={'user': request.user}).data
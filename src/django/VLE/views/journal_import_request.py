@@ -3,9 +3,8 @@ from rest_framework import viewsets
 import VLE.utils.generic_utils as utils
 import VLE.utils.import_utils as import_utils
 import VLE.utils.responses as response
-from VLE.models import Assignment, Entry, Journal, JournalImportRequest, Node
+from VLE.models import Assignment, Entry, Journal, JournalImportRequest, Node, PendingPassback
 from VLE.serializers import JournalImportRequestSerializer
-from VLE.utils import grading
 
 
 class JournalImportRequestView(viewsets.ViewSet):
@@ -98,7 +97,7 @@ class JournalImportRequestView(viewsets.ViewSet):
             raise e
 
         if jir_action == jir.APPROVED_INC_GRADES:
-            grading.task_journal_status_to_LMS.delay(jir.target.pk)
+            PendingPassback.objects.enqueue([jir.target.pk])
 
         jir.save()
 
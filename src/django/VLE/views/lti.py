@@ -145,33 +145,37 @@ def get_lti_params_from_jwt(request):
     user = request.user
     jwt_params, = utils.required_params(request.data, 'jwt_params')
     lti_params = decode_lti_params(jwt_params)
-    if user != User.objects.get(lti_id=lti_params['user_id']):
+    # Only look up the user of the request when it is not the logged in user, to report whether it exists
+    if user.lti_id != lti_params['user_id']:
+        User.objects.get(lti_id=lti_params['user_id'])
         return response.forbidden(
             "The user specified that should be logged in according to the request is not the logged in user.")
 
     role = lti.roles_to_lti_roles(lti_params)
     # convert LTI param for True to python True
     lti_params['custom_assignment_publish'] = lti_params.get('custom_assignment_publish', 'false') == 'true'
+    context = lti.LaunchContext(lti_params, user)
 
     # If the course is already created, update that course, else return new course variables
-    course = lti.update_lti_course_if_exists(lti_params, user, role)
+    course = lti.update_lti_course_if_exists(lti_params, user, role, context=context)
     if course is None:
         return get_new_course_response(lti_params, role)
 
     # If the assignment is already created, update that assignment, else return new assignment variables
-    assignment = lti.update_lti_assignment_if_exists(lti_params)
+    assignment = lti.update_lti_assignment_if_exists(lti_params, context=context)
     if assignment is None:
         return get_new_assignment_response(lti_params, course, role)
 
     # Select a journal
+    journal = None
     if user.has_permission('can_have_journal', assignment):
-        journal = lti.select_create_journal(lti_params, user, assignment)
+        journal = lti.select_create_journal(lti_params, user, assignment, context=context)
 
     return response.success(payload={'params': {
         'state': get_finish_state(user, assignment, lti_params),
         'cID': course.pk,
         'aID': assignment.pk,
-        'jID': journal.pk if user.has_permission('can_have_journal', assignment) and journal else None,
+        'jID': journal.pk if journal else None,
     }})
 
 
@@ -3,6 +3,7 @@ node.py.
 
 In this file are all the node api requests.
 """
+from django.utils.http import parse_etags
 from rest_framework import viewsets
 
 import VLE.timeline as timeline
@@ -31,12 +32,21 @@ class NodeView(viewsets.ModelViewSet):
             not found -- when the course does not exist
             forbidden -- when the user is not part of the course
         On success:
-            success -- with the node data
+            success -- with the node data, tagged with the ETag of the timeline
+            not modified -- when the timeline still matches the ETag provided via If-None-Match
 
         """
         journal_id, = utils.required_typed_params(request.query_params, (int, 'journal_id'))
-        journal = Journal.objects.get(pk=journal_id)
+        journal = Journal.objects.with_annotations('needs_lti_link').get(pk=journal_id)
 
         request.user.check_can_view(journal)
 
-        return response.success({'nodes': timeline.get_nodes(journal, request.user)})
+        # The timeline is only rebuilt if it changed since the client last requested it
+        etag = timeline.get_etag(journal, request.user)
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            return response.not_modified(etag)
+
+        resp = response.success({'nodes': timeline.get_cached_nodes(journal, request.user, etag)})
+        resp['ETag'] = etag
+        resp['Cache-Control'] = 'private, no-cache'
+        return resp
@@ -7,6 +7,7 @@ import VLE.utils.generic_utils as utils
 import VLE.utils.responses as response
 from VLE.models import Course, Group, Participation, Role, User
 from VLE.serializers import ParticipationSerializer, UserSerializer
+from VLE.utils.roster import DEFAULT_ROLE, clean_roster, import_roster, parse_roster
 
 
 class ParticipationView(viewsets.ViewSet):
@@ -212,3 +213,44 @@ class ParticipationView(viewsets.ViewSet):
             'participants': UserSerializer(
                 found_users, context={'user': request.user, 'course': course}, many=True).data
         })
+
+    @action(methods=['post'], detail=False)
+    def roster(self, request):
+        """Import a roster of users into a course.
+
+        Arguments:
+        request -- request data
+            course_id -- course ID
+            roster -- list of users (username, full_name, email, lti_id, role and groups), or the roster as text
+            format -- format of a text roster, csv or json (default: csv)
+            notify -- whether new participants are notified (default: true)
+
+        Returns:
+        On failure:
+            unauthorized -- when the user is not logged in
+            not found -- when the course does not exist
+            forbidden -- when the user is not allowed to add users, roles or groups to the course
+            bad request -- when the roster is invalid
+        On success:
+            success -- with the number of created users, participations, groups, memberships and updated roles
+        """
+        course_id, = utils.required_typed_params(request.data, (int, 'course_id'))
+        rows, = utils.required_params(request.data, 'roster')
+        roster_format, notify = utils.optional_params(request.data, 'format', 'notify')
+
+        course = Course.objects.get(pk=course_id)
+        request.user.check_permission('can_add_course_users', course)
+
+        if isinstance(rows, str):
+            rows = parse_roster(rows, roster_format or 'csv')
+        rows = clean_roster(rows)
+        if any(row['role'] != DEFAULT_ROLE for row in rows):
+            request.user.check_permission('can_edit_course_roles', course)
+        if any(row['groups'] for row in rows):
+            request.user.check_permission('can_add_course_user_group', course)
+            request.user.check_permission('can_edit_course_user_group', course)
+
+        counts = import_roster(course, rows, notify_users=notify is not False)
+
+        return response.success(
+            {'imported': counts}, description='Successfully imported {} users.'.format(len(rows)))
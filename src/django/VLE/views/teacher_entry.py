@@ -3,16 +3,16 @@ teacher_entry.py.
 
 In this file are all the entry api requests.
 """
-from django.conf import settings
 from django.db import transaction
 from django.db.models import Max
 from rest_framework import viewsets
 
 import VLE.utils.generic_utils as utils
 import VLE.utils.responses as response
-from VLE.models import Assignment, Entry, EntryCategoryLink, Grade, Journal, Node, TeacherEntry, Template
+from VLE.models import (Assignment, Entry, EntryCategoryLink, Grade, Journal, Node, PendingPassback, TeacherEntry,
+                        Template)
 from VLE.serializers import TeacherEntrySerializer
-from VLE.utils import entry_utils, grading
+from VLE.utils import entry_utils
 from VLE.utils.error_handling import VLEBadRequest
 
 
@@ -145,10 +145,7 @@ class TeacherEntryView(viewsets.ViewSet):
         with transaction.atomic():
             deleted_entries.delete()
 
-            grading.task_bulk_send_journal_status_to_LMS.apply_async(
-                args=[deleted_entry_journal_ids],
-                countdown=settings.WEBSERVER_TIMEOUT,
-            )
+            PendingPassback.objects.enqueue(deleted_entry_journal_ids)
 
             new_journals, existing_journals = [], []
             for journal in journals:
@@ -253,11 +250,9 @@ class TeacherEntryView(viewsets.ViewSet):
             entry.grade_id = entry.newest_grade_id
             entry.last_edited = teacher_entry.last_edited
         Entry.objects.bulk_update(entries, ['grade', 'last_edited'])
+        Journal.all_objects.filter(pk__in=[journal.pk for journal in journals]).refresh_stats()
 
-        grading.task_bulk_send_journal_status_to_LMS.apply_async(
-            args=[[journal.pk for journal in journals]],
-            countdown=settings.WEBSERVER_TIMEOUT,
-        )
+        PendingPassback.objects.enqueue([journal.pk for journal in journals])
 
     def _update_existing_entries(self, teacher_entry, journals_data, new_category_ids, existing_category_ids, author):
         """
@@ -295,11 +290,9 @@ class TeacherEntryView(viewsets.ViewSet):
         for entry in entries:
             entry.grade_id = entry.newest_grade_id
         Entry.objects.bulk_update(entries, ['grade'])
+        Journal.all_objects.filter(pk__in=journal_pks).refresh_stats()
 
-        grading.task_bulk_send_journal_status_to_LMS.apply_async(
-            args=[journal_pks],
-            countdown=settings.WEBSERVER_TIMEOUT,
-        )
+        PendingPassback.objects.enqueue(journal_pks)
 
     def _check_teacher_entry_content(self, journals, assignment, is_new=False, teacher_entry=None):
         """Check if all journals that have been selected also have valid content.
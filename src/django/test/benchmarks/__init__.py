@@ -0,0 +1,6 @@
+"""
+Benchmarks comparing the query count and latency of (optimized) code paths.
+
+Benchmark modules are named `bench_*.py`, so they are not part of the regular test run. Run them explicitly, e.g.:
+    pytest src/django/test/benchmarks/bench_journal_annotations.py -s -n 0 --no-cov
+"""
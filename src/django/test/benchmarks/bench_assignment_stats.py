@@ -0,0 +1,61 @@
+import test.factory as factory
+from test.utils.performance import query_debug_manager
+
+from django.db.models import Avg, Sum
+from django.test import TestCase
+
+import VLE.utils.statistics
+from VLE.models import Journal
+from VLE.serializers import AssignmentSerializer
+
+
+def legacy_get_stats(assignment, user, course):
+    """The assignment stats as computed before, with two aggregates over Python lists of users"""
+    relevant_stat_users = VLE.utils.statistics.get_user_lists_with_scopes(assignment, user, course=course)
+    relevant_stat_users_all = list(relevant_stat_users['all'])
+    relevant_stat_users_own = list(relevant_stat_users['own'])
+
+    all_j = Journal.objects.filter(assignment=assignment, authors__user__in=relevant_stat_users_all)
+    own_j = Journal.objects.filter(assignment=assignment, authors__user__in=relevant_stat_users_own)
+
+    return (
+        all_j.aggregate(
+            average_points=Avg('grade'),
+            needs_marking_sum=Sum('needs_marking'),
+            unpublished_sum=Sum('unpublished'),
+            import_requests_sum=Sum('import_requests'),
+        ),
+        own_j.aggregate(
+            needs_marking_sum=Sum('needs_marking'),
+            unpublished_sum=Sum('unpublished'),
+            import_requests_sum=Sum('import_requests'),
+        ),
+    )
+
+
+class AssignmentStatsBenchmark(TestCase):
+    """Compares computing the assignment stats of a large course with the previous implementation."""
+    n_students = 100
+    n_groups = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = factory.Course()
+        cls.teacher = cls.course.author
+        cls.assignment = factory.Assignment(courses=[cls.course])
+        groups = [factory.Group(course=cls.course) for _ in range(cls.n_groups)]
+        cls.teacher.participation_set.get(course=cls.course).groups.add(groups[0])
+
+        for i in range(cls.n_students):
+            journal = factory.Journal(assignment=cls.assignment, entries__n=1)
+            journal.authors.first().user.participation_set.get(course=cls.course).groups.add(groups[i % cls.n_groups])
+
+    def test_get_stats(self):
+        serializer = AssignmentSerializer(context={
+            'user': self.teacher, 'course': self.course, 'can_grade': True, 'can_manage_journal_import_requests': True})
+
+        print(f'\nComputing the assignment stats of a course with {self.n_students} students')
+        with query_debug_manager(label='Before: aggregates over Python lists of users'):
+            legacy_get_stats(self.assignment, self.teacher, self.course)
+        with query_debug_manager(label='After: single query with conditional aggregates'):
+            serializer.get_stats(self.assignment)
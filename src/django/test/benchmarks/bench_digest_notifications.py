@@ -0,0 +1,53 @@
+import test.factory as factory
+from test.utils.performance import query_debug_manager
+
+from django.core import mail
+from django.test import TestCase
+
+from VLE.models import Notification, Preferences, User
+from VLE.tasks.beats.notifications import send_digest_notifications
+
+
+class DigestNotificationsBenchmark(TestCase):
+    """Sends the nightly digest to a large number of users, each with a course, assignment and batched notifications.
+
+    Before, the digest cost multiple queries per user, course, assignment and notification.
+    """
+    n_users = 10000
+    n_journals = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        daily = {
+            preference['name']: Preferences.DAILY
+            for type, preference in Notification.TYPES.items() if type != Notification.UPCOMING_DEADLINE
+        }
+        cls.course = factory.Course(author__preferences=daily)
+        cls.assignment = factory.Assignment(courses=[cls.course])
+        for _ in range(cls.n_journals):
+            factory.UnlimitedEntry(node__journal__assignment=cls.assignment, grade__grade=1)
+
+        cls.users = User.objects.bulk_create([
+            User(username=f'digest{i}', email=f'digest{i}@ejournal.app', full_name=f'Digest {i}', verified_email=True)
+            for i in range(cls.n_users)
+        ])
+        Preferences.objects.filter(user__in=cls.users).update(**daily)
+        notifications = [
+            Notification(type=type, user=user, course=cls.course, assignment=assignment)
+            for user in cls.users
+            for type, assignment in [(Notification.NEW_COURSE, None), (Notification.NEW_ASSIGNMENT, cls.assignment)]
+        ]
+        for notification in notifications:
+            notification.render()
+        Notification.objects.bulk_create(notifications)
+
+    def test_send_digest_notifications(self):
+        n_notifications = Notification.objects.filter(sent=False).count()
+
+        print(f'\nSending the digest of {n_notifications} notifications to {self.n_users} users')
+        with query_debug_manager(label='Set based digest'):
+            result = send_digest_notifications()
+
+        assert all(len(result['sent_notifications'][user.pk]) == 2 for user in self.users)
+        assert len(mail.outbox) > self.n_users
+        assert not Notification.objects.filter(user__in=self.users, sent=False).exists()
@@ -0,0 +1,79 @@
+import asyncore
+import smtpd
+import socket
+import threading
+import time
+
+from django.core import mail
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from VLE.utils import email_handling
+
+
+class DiscardingSMTPServer(smtpd.SMTPServer):
+    def __init__(self, *args, **kwargs):
+        self.received = 0
+        super().__init__(*args, **kwargs)
+
+    def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+        self.received += 1
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+class EmailSendingBenchmark(TestCase):
+    """Sends a large number of emails to a local SMTP server which discards them.
+
+    Before, every email opened (and logged in on) its own SMTP connection.
+    """
+    n_messages = 1000
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.port = free_port()
+        cls.server = DiscardingSMTPServer(('localhost', cls.port), None)
+        cls.thread = threading.Thread(target=asyncore.loop, kwargs={'timeout': 0.01}, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+        cls.thread.join()
+        super().tearDownClass()
+
+    def messages(self):
+        return [
+            mail.EmailMessage(subject=f'Benchmark {i}', body='Body', to=[f'bench{i}@ejournal.app'])
+            for i in range(self.n_messages)
+        ]
+
+    def benchmark(self, label, send):
+        messages = self.messages()
+        received = self.server.received
+        start = time.perf_counter()
+        send(messages)
+        duration = time.perf_counter() - start
+        # Delivery is only reported after the server processed the message, allow the loop to catch up
+        while self.server.received - received < self.n_messages:
+            time.sleep(0.01)
+        print(f'{label}: {duration:.2f}s, {self.n_messages / duration:.0f} messages/s')
+
+    def test_send_messages(self):
+        print(f'\nSending {self.n_messages} emails to a local SMTP server')
+        with override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='localhost',
+            EMAIL_PORT=self.port,
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='',
+        ):
+            self.benchmark('Connection per message', lambda messages: [message.send() for message in messages])
+            self.benchmark('Batched', lambda messages: email_handling.send_messages(messages, workers=1))
+            self.benchmark('Batched, 4 workers', lambda messages: email_handling.send_messages(messages, workers=4))
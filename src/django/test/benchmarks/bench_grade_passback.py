@@ -0,0 +1,47 @@
+import test.factory as factory
+from test.utils.lms import StubLMS
+from test.utils.performance import query_debug_manager
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from VLE.lti_grade_passback import GradePassBackRequest
+from VLE.models import AssignmentParticipation, Journal
+from VLE.utils import grading
+
+
+class GradePassBackBenchmark(TestCase):
+    """Passes back the grades of a large assignment to a local LMS which takes some time to respond.
+
+    Before, the grade passback requests were sent one by one, each over a new connection.
+    """
+    n_journals = 200
+    lms_delay = 0.02
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.assignment = factory.LtiAssignment(points_possible=10)
+        for _ in range(cls.n_journals):
+            journal = factory.LtiJournal(assignment=cls.assignment, entries__n=0)
+            factory.UnlimitedEntry(node__journal=journal, grade__grade=1, grade__published=True)
+
+    def journals(self, url):
+        Journal.objects.filter(assignment=self.assignment).update(LMS_grade=0)
+        AssignmentParticipation.objects.filter(assignment=self.assignment).update(grade_url=url)
+        return Journal.objects.with_annotations('grade').filter(assignment=self.assignment)
+
+    def test_send_journals_status_to_LMS(self):
+        print(f'\nPassing back the grades of {self.n_journals} journals')
+        with StubLMS(delay=self.lms_delay) as lms:
+            journals = self.journals(lms.url)
+            with query_debug_manager(label='Sequential, connection per request'):
+                for journal in journals:
+                    GradePassBackRequest(journal.authors.first(), journal.grade, send_score=True).send_post_request()
+
+            for workers in [1, 8]:
+                journals = self.journals(lms.url)
+                with override_settings(LTI_PASSBACK_WORKERS_PER_HOST=workers):
+                    with query_debug_manager(label=f'Passback engine, {workers} workers per host'):
+                        _, report = grading.send_journals_status_to_LMS(journals)
+                assert report['successful'] == self.n_journals
+                print(report)
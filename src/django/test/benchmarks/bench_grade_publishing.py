@@ -0,0 +1,40 @@
+import test.factory as factory
+from test.utils.performance import query_debug_manager
+
+from django.test import TestCase
+
+from VLE import factory as VLE_factory
+from VLE.models import Comment, Entry, Journal
+from VLE.utils import grading
+
+
+class GradePublishingBenchmark(TestCase):
+    """Publishes the unpublished grades of all journals of a large assignment.
+
+    Before, every grade was published on its own, which saved the entry and created the notifications one by one.
+    """
+    n_journals = 100
+    n_entries = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.assignment = factory.Assignment()
+        for _ in range(cls.n_journals):
+            journal = factory.Journal(assignment=cls.assignment, entries__n=0)
+            for _ in range(cls.n_entries):
+                factory.UnlimitedEntry(node__journal=journal, grade__grade=1, grade__published=False)
+        print(f'\nPublishing {cls.n_journals * cls.n_entries} grades of {cls.n_journals} journals')
+        cls.journal_pks = list(Journal.objects.filter(assignment=cls.assignment).values_list('pk', flat=True))
+
+    def test_publish_per_entry(self):
+        with query_debug_manager(label='Grade per entry'):
+            for journal_pk in self.journal_pks:
+                for entry in Entry.objects.filter(node__journal=journal_pk).exclude(grade=None):
+                    VLE_factory.make_grade(entry, self.assignment.author.pk, entry.grade.grade, True)
+                Comment.objects.filter(entry__node__journal=journal_pk).exclude(entry__grade=None).update(
+                    published=True)
+
+    def test_publish_grades(self):
+        with query_debug_manager(label='Bulk publishing'):
+            grading.publish_grades(self.journal_pks, self.assignment.author)
+        assert not Journal.objects.filter(pk__in=self.journal_pks, unpublished__gt=0).exists()
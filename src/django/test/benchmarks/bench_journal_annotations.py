@@ -0,0 +1,33 @@
+import test.factory as factory
+from test.utils.performance import query_debug_manager
+
+from django.test import TestCase
+
+from VLE.models import Journal
+
+
+class JournalAnnotationsBenchmark(TestCase):
+    """Compares fetching a journal with all annotated fields against the annotation profiles used by the views."""
+    n_journals = 50
+    n_entries = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        assignment = factory.Assignment()
+        cls.journals = [
+            factory.Journal(assignment=assignment, entries__n=cls.n_entries) for _ in range(cls.n_journals)]
+
+    def fetch(self, qry):
+        for journal in self.journals:
+            qry.get(pk=journal.pk)
+
+    def test_fetch_journal(self):
+        print(f'\nFetching {self.n_journals} journals with {self.n_entries} entries each, one by one')
+        with query_debug_manager(label='Before: all annotated fields'):
+            self.fetch(Journal.objects.all())
+        with query_debug_manager(label='After: minimal profile (e.g. grade, comment and journal member views)'):
+            self.fetch(Journal.objects.with_annotations('minimal'))
+        with query_debug_manager(label='After: needs_lti_link only (e.g. entry and node views)'):
+            self.fetch(Journal.objects.with_annotations('needs_lti_link'))
+        with query_debug_manager(label='After: name and grade only (notification text)'):
+            self.fetch(Journal.objects.with_annotations('name', 'grade'))
@@ -0,0 +1,53 @@
+import test.factory as factory
+from test.test_lti_launch import REQUEST, create_request
+from test.utils import api
+from test.utils.lti import gen_jwt_params, get_access_token
+from test.utils.performance import query_debug_manager
+from unittest import mock
+
+from django.test import TestCase
+
+import VLE.views.lti as lti_view
+
+
+class LtiLaunchBenchmark(TestCase):
+    """Launches a large number of students from the LMS into an assignment, as happens at the start of a semester.
+
+    Before, a launch of a linked student took 12 queries and the following parameter request 18.
+    """
+    n_students = 100
+    n_groups = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = factory.LtiCourse()
+        cls.assignment = factory.LtiAssignment(courses=[cls.course])
+        for i in range(cls.n_groups):
+            factory.Group(course=cls.course, lti_id=str(i))
+        cls.students = [factory.LtiStudent() for _ in range(cls.n_students)]
+
+    def launch(self, student, i):
+        params = {
+            'custom_course_id': self.course.active_lti_id,
+            'custom_assignment_id': self.assignment.active_lti_id,
+            'custom_assignment_publish': 'true',
+            'custom_section_id': str(i % self.n_groups),
+            'custom_user_image': student.profile_picture,
+            'lis_outcome_service_url': REQUEST['lis_outcome_service_url'],
+            'lis_result_sourcedid': 'sourcedid{}'.format(i),
+        }
+        # The signature is not part of the benchmark
+        with mock.patch('VLE.lti_launch.OAuthRequestValidater.check_signature'):
+            lti_view.lti_launch(create_request(params, user=student, course=self.course, assignment=self.assignment))
+        api.post(self, 'get_lti_params_from_jwt', params=gen_jwt_params(params, user=student), user=student,
+                 access=get_access_token(student))
+
+    def test_lti_launch(self):
+        print(f'\nLaunching {self.n_students} students')
+        with query_debug_manager(label='First launch'):
+            for i, student in enumerate(self.students):
+                self.launch(student, i)
+
+        with query_debug_manager(label='Repeated launch'):
+            for i, student in enumerate(self.students):
+                self.launch(student, i)
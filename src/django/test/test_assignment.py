@@ -4,7 +4,7 @@ import test.utils.generic_utils
 from copy import deepcopy
 from test.utils import api
 from test.utils.generic_utils import check_equality_of_imported_file_context, equal_models
-from test.utils.performance import QueryContext
+from test.utils.performance import QueryContext, queries_invariant_to_db_size
 from unittest import mock
 
 import pytest
@@ -20,8 +20,9 @@ from django.utils import timezone
 
 import VLE.tasks.beats.cleanup as cleanup
 import VLE.utils.statistics as stats_utils
-from VLE.models import (Assignment, AssignmentParticipation, Category, Course, Entry, Field, FileContext, Format, Group,
-                        Journal, JournalImportRequest, Node, Participation, PresetNode, Role, Template)
+from VLE.models import (Assignment, AssignmentParticipation, Category, Comment, Course, Entry, Field, FileContext,
+                        Format, Group, Journal, JournalImportRequest, Node, Notification, Participation,
+                        PendingPassback, PresetNode, Role, Template)
 from VLE.serializers import AssignmentSerializer, SmallAssignmentSerializer
 from VLE.utils.error_handling import VLEParticipationError, VLEProgrammingError
 from VLE.utils.file_handling import get_files_from_rich_text
@@ -324,6 +325,22 @@ class AssignmentAPITest(TestCase):
         student = factory.AssignmentParticipation(assignment=group_assignment).user
         api.get(self, 'assignments', params={'pk': group_assignment.pk}, user=student)
 
+    def test_get_assignment_stats_queries(self):
+        assignment = factory.Assignment(courses=[self.course])
+        serializer = AssignmentSerializer(context={
+            'user': self.teacher, 'course': self.course, 'can_grade': True, 'can_manage_journal_import_requests': True})
+
+        def add_journals():
+            for _ in range(3):
+                journal = factory.Journal(assignment=assignment, entries__n=2)
+                factory.JournalImportRequest(target=journal)
+
+        add_journals()
+        stats = serializer.get_stats(assignment)
+        # Besides resolving the course, the stats of all scopes are aggregated in a single query
+        queries_invariant_to_db_size(serializer.get_stats, [add_journals], call_args=[assignment], max=3)
+        assert serializer.get_stats(assignment)['needs_marking'] == 2 * stats['needs_marking']
+
     def test_get_assignment_with_given_course(self):
         assignment = factory.Assignment()
         course1 = assignment.courses.first()
@@ -1354,6 +1371,39 @@ class AssignmentAPITest(TestCase):
         assert not Entry.objects.get(pk=grade_other_journal.entry.pk).grade.published, \
             'grades not in assignment should not be published'
 
+    def test_publish_all_assignment_grades_bulk(self):
+        assignment = factory.Assignment()
+        journals = [factory.Journal(assignment=assignment, entries__n=0) for _ in range(2)]
+        unpublished = [factory.Grade(grade=3, published=False, entry__node__journal=journal) for journal in journals]
+        published = factory.Grade(grade=4, published=True, entry__node__journal=journals[0])
+        comment = factory.TeacherComment(entry=unpublished[0].entry)
+
+        def publish():
+            api.patch(
+                self, 'grades/publish_all_assignment_grades', params={'assignment_id': assignment.pk},
+                user=assignment.author)
+
+        publish()
+        for grade in unpublished:
+            entry = Entry.objects.get(pk=grade.entry.pk)
+            assert entry.grade.published and entry.grade.grade == 3 and entry.grade.author == assignment.author
+            assert entry.grade_set.count() == 2, 'The unpublished grade should be kept in the grade history'
+            assert Notification.objects.filter(
+                type=Notification.NEW_GRADE, grade=entry.grade, user=entry.node.journal.authors.first().user).exists()
+        assert Entry.objects.get(pk=published.entry.pk).grade == published, 'Published grades should not be copied'
+        assert Comment.objects.get(pk=comment.pk).published
+        assert not Journal.objects.filter(assignment=assignment, unpublished__gt=0).exists()
+        assert Journal.objects.get(pk=journals[0].pk).grade == 7
+        assert PendingPassback.objects.filter(journal__in=journals).count() == 2
+
+        def add_state():
+            for journal in [factory.Journal(assignment=assignment, entries__n=0) for _ in range(3)]:
+                for _ in range(2):
+                    factory.Grade(published=False, entry__node__journal=journal)
+
+        factory.Grade(published=False, entry__node__journal=journals[1])
+        queries_invariant_to_db_size(publish, [add_state])
+
     def test_get_active_course(self):
         no_startdate = factory.Course(startdate=None)
         teacher = no_startdate.author
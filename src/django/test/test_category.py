@@ -266,8 +266,11 @@ class CategoryAPITest(TestCase):
                 api.patch(self, 'categories/edit_entry', params={**params, 'add': add}, user=student, status=403)
                 with mock.patch('VLE.models.User.has_permission') as has_permission_mock:
                     api.patch(self, 'categories/edit_entry', params={**params, 'add': add}, user=student, status=200)
-                    has_permission_mock.assert_any_call('can_have_journal', self.assignment)
                     has_permission_mock.assert_any_call('can_grade', self.assignment)
+                with mock.patch('VLE.models.User.has_permission', side_effect=lambda permission, obj=None:
+                                permission == 'can_have_journal') as has_permission_mock:
+                    api.patch(self, 'categories/edit_entry', params={**params, 'add': add}, user=student, status=403)
+                    has_permission_mock.assert_any_call('can_have_journal', self.assignment)
 
             template.chain.allow_custom_categories = True
             template.chain.save()
@@ -2,16 +2,21 @@ import datetime
 import re
 import test.factory as factory
 from test.utils import api
+from test.utils.performance import queries_invariant_to_db_size
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from django.core import mail
+from django.core.mail import get_connection
 from django.test import TestCase
 from django.test.utils import override_settings
 from django.utils import timezone
 
 from VLE.models import Group, Journal, Notification, Participation, Preferences, Template, User
 from VLE.tasks.beats import notifications
+from VLE.tasks.email import send_push_notifications
+from VLE.utils import email_handling
 
 
 class EmailAPITest(TestCase):
@@ -378,6 +383,35 @@ class EmailAPITest(TestCase):
         assert mails.count(not_in_journal.user.email) == 0, \
             'If not in journal, one should also not get a mail'
 
+    def test_deadline_email_queries(self):
+        assignment = factory.Assignment()
+        for days in [1, 7]:
+            factory.DeadlinePresetNode(
+                due_date=timezone.now().date() + datetime.timedelta(days=days, hours=2),
+                lock_date=timezone.now().date() + datetime.timedelta(days=days + 1),
+                format=assignment.format,
+            )
+            factory.ProgressPresetNode(
+                due_date=timezone.now().date() + datetime.timedelta(days=days, hours=2),
+                lock_date=timezone.now().date() + datetime.timedelta(days=days + 1),
+                format=assignment.format,
+                target=5,
+            )
+
+        def add_journals(n):
+            for _ in range(n):
+                factory.Journal(assignment=assignment, entries__n=0)
+
+        def generate():
+            Notification.objects.filter(type=Notification.UPCOMING_DEADLINE).delete()
+            assert len(notifications.generate_upcoming_deadline_notifications()) == \
+                4 * Journal.objects.filter(assignment=assignment).count()
+
+        add_journals(1)
+        generate()
+        # Generating the reminders should cost the same number of queries, regardless of the number of journals
+        queries_invariant_to_db_size(generate, [lambda: add_journals(5)])
+
     def test_deadline_email_text(self):
         assignment = factory.Assignment()
         # ENTRYDEADLINE inside deadline
@@ -403,3 +437,40 @@ class EmailAPITest(TestCase):
 
         assert entry.forced_template.name in Notification.objects.get(node__preset=entry).content
         assert f'{journal.grade}/' not in Notification.objects.get(node__preset=entry).content
+
+    def test_send_messages(self):
+        def messages(n):
+            return [mail.EmailMessage(subject=str(i), to=[self.student.email]) for i in range(n)]
+
+        # Every batch is sent over a single connection
+        with mock.patch('VLE.utils.email_handling.get_connection', wraps=get_connection) as connection_mock:
+            assert email_handling.send_messages(messages(5), batch_size=2) == [None] * 5
+        assert connection_mock.call_count == 3
+        assert [message.subject for message in mail.outbox] == [str(i) for i in range(5)]
+
+        # Sending the batches concurrently should send the same messages
+        mail.outbox = []
+        assert email_handling.send_messages(messages(5), batch_size=2, workers=3) == [None] * 5
+        assert sorted(message.subject for message in mail.outbox) == [str(i) for i in range(5)]
+
+        # A message is retried, only the error of its last attempt is returned
+        error = Exception()
+        with mock.patch.object(mail.EmailMessage, 'send', side_effect=[Exception(), 1, Exception(), error, 1]):
+            assert email_handling.send_messages(messages(3), attempts=2) == [None, error, None]
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    def test_send_push_notifications(self):
+        course = factory.Course()
+        sent, failed, unverified = Notification.objects.bulk_create([
+            Notification(type=Notification.NEW_COURSE, user=user, course=course)
+            for user in [self.student, factory.Student(), self.not_verified]
+        ])
+
+        with mock.patch.object(mail.EmailMessage, 'send', side_effect=[1, Exception(), Exception()]):
+            results = send_push_notifications([sent.pk, failed.pk, unverified.pk])
+
+        assert [result['successful'] for result in results] == [True, False, False]
+        assert Notification.objects.get(pk=sent.pk).sent
+        assert not Notification.objects.get(pk=failed.pk).sent, 'Notifications which fail to send remain unsent'
+        assert not Notification.objects.get(pk=unverified.pk).sent
+        assert not send_push_notifications([sent.pk])[0]['successful'], 'Sent notifications are not sent again'
@@ -4,13 +4,17 @@ test_gradepassback.py.
 Test the lti grade passback.
 """
 import test.factory as factory
+from concurrent.futures import ThreadPoolExecutor
 from test.utils import api
+from test.utils.lms import StubLMS
 
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import override_settings
 
 import VLE.lti_grade_passback as lti_grade
 import VLE.tasks.beats.lti as lti_beats
-from VLE.models import Entry, Journal
+from VLE.models import AssignmentParticipation, Counter, Entry, Journal, PendingPassback
 from VLE.utils import grading
 
 
@@ -33,6 +37,9 @@ class GradePassBackRequestXMLTest(TestCase):
             ap__grade_url='https://uvadlo-tes.instructure.com/api/lti/v1/tools/267/grade_passback'
         )
         self.lti_journal = Journal.objects.get(pk=self.lti_journal.pk)
+        # The message_id sequence is not rolled back between tests
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT setval(%s, 0, false)', [lti_grade.MESSAGE_ID_SEQUENCE])
 
     def test_create_grade_passback(self):
         """Test if the GradePassBackRequest is correctly created when a journal is given"""
@@ -127,6 +134,20 @@ class GradePassBackRequestXMLTest(TestCase):
         now = lti_grade.GradePassBackRequest.get_message_id_and_increment()
         assert int(now) + 1 == int(lti_grade.GradePassBackRequest.get_message_id_and_increment())
 
+    def test_message_ids_are_unique(self):
+        """Test if concurrently allocated message ids are unique."""
+        def allocate(_):
+            try:
+                return [lti_grade.GradePassBackRequest.get_message_id_and_increment() for _ in range(50)] + \
+                    lti_grade.GradePassBackRequest.reserve_message_ids(50)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            message_ids = [message_id for ids in executor.map(allocate, range(32)) for message_id in ids]
+
+        assert len(message_ids) == len(set(message_ids)) == 32 * 100
+
     def test_parse_return_xml(self):
         """"""
         passback = lti_grade.GradePassBackRequest(self.lti_journal.authors.first(), self.lti_journal.grade)
@@ -203,3 +224,102 @@ class GradePassBackRequestXMLTest(TestCase):
         resp = grading.send_author_status_to_LMS(journal, author)
         assert 'has no grade_url' in resp['description'], \
             'When author has no grade url, it should say so'
+
+
+class GradePassBackEngineTest(TestCase):
+    """Test the concurrent grade passback against a local stub LMS."""
+    def setUp(self):
+        self.assignment = factory.LtiAssignment(points_possible=10)
+        self.journals = [factory.LtiJournal(assignment=self.assignment, entries__n=0) for _ in range(6)]
+        for journal in self.journals:
+            factory.UnlimitedEntry(node__journal=journal, grade__grade=1, grade__published=True)
+        AssignmentParticipation.objects.filter(assignment=self.assignment).update(grade_url=None)
+
+    def journals_with_url(self, url):
+        AssignmentParticipation.objects.filter(assignment=self.assignment).update(grade_url=url)
+        return Journal.objects.with_annotations('grade').filter(assignment=self.assignment)
+
+    @override_settings(LTI_PASSBACK_BACKOFF=0)
+    def test_send_journals_status_to_LMS(self):
+        with StubLMS(failures=1) as lms:
+            results, report = grading.send_journals_status_to_LMS(self.journals_with_url(lms.url))
+
+        assert all(result['successful'] for result in results.values())
+        assert report['requests'] == report['successful'] == len(self.journals)
+        assert report['retries'] == len(self.journals), 'The first request of every author should be retried'
+        assert len(lms.connections) <= report['requests'], 'Connections should be reused for the retries'
+        assert len(lms.requests) == len(self.journals)
+        assert all(request['score'] == '0.1' for request in lms.requests)
+        assert len({request['message_id'] for request in lms.requests}) == len(lms.requests)
+        assert not Journal.objects.filter(assignment=self.assignment).exclude(LMS_grade=1).exists()
+        assert not Entry.objects.filter(node__journal__assignment=self.assignment).exclude(
+            vle_coupling=Entry.LINK_COMPLETE).exists()
+
+        # Nothing changed, so nothing is sent again
+        with StubLMS() as lms:
+            results, report = grading.send_journals_status_to_LMS(self.journals_with_url(lms.url))
+        assert report['requests'] == 0 and not lms.requests
+
+    @override_settings(LTI_PASSBACK_ATTEMPTS=2, LTI_PASSBACK_BACKOFF=0, LTI_PASSBACK_TIMEOUT=1)
+    def test_send_post_requests_failure(self):
+        with StubLMS(failures=2) as lms:
+            journals = list(self.journals_with_url(lms.url))
+            results, report = grading.send_journals_status_to_LMS(journals[:1])
+        assert not results[journals[0].pk]['successful'], 'The request should fail when all attempts fail'
+        assert report['failed'] == 1 and report['retries'] == 1
+
+        with StubLMS(delay=2) as lms:
+            results, report = grading.send_journals_status_to_LMS(self.journals_with_url(lms.url)[:1])
+        assert report['failed'] == 1 and report['retries'] == 1, 'Timed out requests should be retried'
+        assert not Journal.objects.filter(assignment=self.assignment).exclude(LMS_grade=0).exists()
+
+
+class PendingPassbackTest(TestCase):
+    """Test the coalescing of grade passbacks in the pending outbox."""
+    def setUp(self):
+        self.assignment = factory.LtiAssignment(points_possible=10)
+        self.journals = [factory.LtiJournal(assignment=self.assignment, entries__n=0) for _ in range(3)]
+        for journal in self.journals:
+            factory.UnlimitedEntry(node__journal=journal, grade__grade=1, grade__published=True)
+
+    def test_enqueue(self):
+        journal = self.journals[0]
+        author = journal.authors.first()
+        for _ in range(3):
+            PendingPassback.objects.enqueue([journal])
+        PendingPassback.objects.enqueue([journal.pk], author=author)
+        PendingPassback.objects.enqueue([journal.pk], author=author.pk)
+        PendingPassback.objects.enqueue([journal.pk], author=author.pk, left_journal=True)
+        PendingPassback.objects.enqueue([])
+
+        assert PendingPassback.objects.count() == 3, 'Every journal and author should be pending only once'
+        assert PendingPassback.objects.get(author=None).requests == 3
+        assert PendingPassback.objects.get(author=author, left_journal=False).requests == 2
+        assert PendingPassback.objects.get(author=author, left_journal=True).requests == 1
+
+    def test_send_pending_passbacks(self):
+        with StubLMS() as lms:
+            AssignmentParticipation.objects.filter(assignment=self.assignment).update(grade_url=lms.url)
+            for _ in range(2):
+                PendingPassback.objects.enqueue(self.journals)
+            PendingPassback.objects.enqueue([self.journals[0]], author=self.journals[0].authors.first())
+
+            assert grading.send_pending_passbacks(window=60)['requests'] == 0, \
+                'Passbacks should only be sent once they have been pending for the window'
+            result = grading.send_pending_passbacks(window=0)
+
+        assert result['requests'] == 7 and result['sent'] == 3 and result['coalesced'] == 4
+        assert all(result['journals'][journal.pk]['successful'] for journal in self.journals)
+        assert len(lms.requests) == len(self.journals), 'The author passback should be coalesced into its journal'
+        assert not PendingPassback.objects.exists()
+        assert Counter.objects.get(name='passback_requests').count == 7
+        assert Counter.objects.get(name='passback_sends').count == 3
+        assert not Journal.objects.filter(assignment=self.assignment).exclude(LMS_grade=1).exists()
+
+    def test_grading_enqueues_passback(self):
+        journal = self.journals[0]
+        entry = factory.UnlimitedEntry(node__journal=journal)
+        for grade in range(2):
+            api.create(self, 'grades', params={'entry_id': entry.pk, 'grade': grade, 'published': True},
+                       user=self.assignment.author)
+        assert PendingPassback.objects.get(journal=journal).requests == 2
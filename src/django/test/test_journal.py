@@ -1,14 +1,17 @@
+import random
 import test.factory as factory
+from io import StringIO
 from test.utils import api
 from test.utils.performance import queries_invariant_to_db_size
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db.models import F, Sum
+from django.core.management import CommandError, call_command
+from django.db.models import F, Q, Sum
 from django.test import TestCase
 
 from VLE.models import (Assignment, AssignmentParticipation, Comment, Content, Course, Entry, FileContext, Group,
-                        Journal, JournalImportRequest, Participation, Role, User)
+                        Journal, JournalImportRequest, JournalStats, Participation, Role, User)
 from VLE.serializers import JournalSerializer
 from VLE.utils.error_handling import VLEProgrammingError
 
@@ -833,6 +836,53 @@ class JournalAPITest(TestCase):
         assert group_journal_c2 in journals_for_course_c2
         assert group_journal_c1 not in journals_for_course_c2
 
+    def test_allowed_journals_equivalence(self):
+        def legacy_allowed_journals(journals):
+            """The allowed journals filter as it was implemented using joins and DISTINCT"""
+            return journals.annotate(
+                p_user=F('assignment__courses__participation__user'),
+                p_group=F('assignment__courses__participation__groups'),
+                can_have_journal=F('assignment__courses__participation__role__can_have_journal')
+            ).filter(
+                Q(assignment__is_group_assignment=True) | Q(p_user__in=F('authors__user'), can_have_journal=True),
+            ).filter(
+                Q(assignment__is_group_assignment=True) | Q(p_group__in=F('assignment__assigned_groups')) |
+                Q(assignment__assigned_groups=None),
+            ).distinct()
+
+        rng = random.Random(3)
+        courses = [factory.Course() for _ in range(3)]
+        groups = [factory.Group(course=course) for course in courses for _ in range(2)]
+
+        for _ in range(8):
+            assignment = factory.Assignment(
+                courses=rng.sample(courses, rng.randint(1, 2)), group_assignment=rng.random() < 0.25)
+            assignment_groups = [group for group in groups if assignment.courses.filter(pk=group.course.pk).exists()]
+            assignment.assigned_groups.set(rng.sample(assignment_groups, rng.randint(0, 2)))
+
+            for _ in range(rng.randint(1, 4)):
+                journal_factory = factory.GroupJournal if assignment.is_group_assignment else factory.Journal
+                if rng.random() < 0.1:
+                    journal_factory(assignment=assignment, ap=False, entries__n=0)
+                    continue
+
+                journal = journal_factory(
+                    assignment=assignment, entries__n=0, ap__add_user_to_missing_courses=rng.random() < 0.8)
+                for participation in Participation.objects.filter(user__in=journal.authors.values('user')):
+                    if rng.random() < 0.2:
+                        participation.role = participation.course.role_set.get(name='TA')
+                        participation.save()
+                    participation.groups.set(rng.sample(
+                        [group for group in groups if group.course == participation.course], rng.randint(0, 2)))
+
+        allowed_pks = list(Journal.all_objects.allowed_journals().values_list('pk', flat=True))
+        assert len(allowed_pks) == len(set(allowed_pks)), 'Allowed journals should not contain duplicates'
+        assert set(allowed_pks) == set(legacy_allowed_journals(Journal.all_objects).values_list('pk', flat=True))
+        assert 0 < len(allowed_pks) < Journal.all_objects.count(), 'Fixtures should contain (dis)allowed journals'
+
+        assert 'DISTINCT' not in str(Journal.all_objects.allowed_journals().query)
+        assert Journal.objects.order_by('-pk').first().pk == max(allowed_pks), 'Ordering is left to the caller'
+
     def test_journal_serializer(self):
         journal = factory.Journal()
         journal = Journal.objects.get(pk=journal.pk)
@@ -946,6 +996,58 @@ class JournalAPITest(TestCase):
             pk=no_needs_marking_journal.pk).allowed_journals().annotate_needs_marking().get()
         no_needs_marking_journal.needs_marking == 0, 'Needs marking should default to zero not None'
 
+    def test_journal_stats(self):
+        def assert_stats_up_to_date(journal):
+            stats = JournalStats.objects.get(journal=journal)
+            computed = Journal.all_objects.filter(pk=journal.pk).annotate_computed_stats().get()
+            for field in JournalStats.FIELDS:
+                assert getattr(stats, field) == getattr(computed, 'computed_{}'.format(field)), \
+                    'Stored {} should match the value computed from the entries and grades'.format(field)
+            return stats
+
+        journal = factory.Journal(entries__n=0)
+        stats = assert_stats_up_to_date(journal)
+        assert stats.grade_sum == 0 and stats.unpublished == 0 and stats.needs_marking == 0
+
+        entry = factory.UnlimitedEntry(node__journal=journal, grade=None)
+        assert assert_stats_up_to_date(journal).needs_marking == 1
+
+        factory.Grade(entry=entry, grade=4, published=True)
+        stats = assert_stats_up_to_date(journal)
+        assert stats.grade_sum == 4 and stats.needs_marking == 0
+
+        factory.UnlimitedEntry(node__journal=journal, grade__grade=2, grade__published=False)
+        assert assert_stats_up_to_date(journal).unpublished == 1
+
+        entry.is_draft = True
+        entry.save()
+        assert assert_stats_up_to_date(journal).grade_sum == 0, 'Drafts should not contribute to the stats'
+        entry.is_draft = False
+        entry.save()
+        assert assert_stats_up_to_date(journal).grade_sum == 4
+
+        journal.bonus_points = 1.5
+        journal.save()
+        assert Journal.objects.get(pk=journal.pk).grade == 5.5, 'Bonus points are read directly from the journal'
+
+        entry.delete()
+        stats = assert_stats_up_to_date(journal)
+        assert stats.grade_sum == 0 and stats.unpublished == 1
+
+        journal.reset()
+        stats = assert_stats_up_to_date(journal)
+        assert stats.grade_sum == 0 and stats.unpublished == 0 and stats.needs_marking == 0
+
+        # The rebuild command recreates missing stats and verifies all are up to date
+        factory.UnlimitedEntry(node__journal=journal, grade__grade=3, grade__published=True)
+        JournalStats.objects.filter(journal=journal).delete()
+        JournalStats.objects.filter(journal__in=Journal.all_objects.exclude(pk=journal.pk)[:1]).update(grade_sum=-1)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_journal_stats', verify=True, stdout=StringIO())
+        call_command('rebuild_journal_stats', stdout=StringIO())
+        assert assert_stats_up_to_date(journal).grade_sum == 3
+        call_command('rebuild_journal_stats', verify=True, stdout=StringIO())
+
     def test_annotate_needs_lti_link(self):
         student2 = factory.Student(full_name='student2')
         student3 = factory.Student(full_name='student3')
@@ -1121,6 +1223,47 @@ class JournalAPITest(TestCase):
         journal = Journal.all_objects.filter(pk=journal.pk).annotate(full_names=F('pk')).get()
         assert journal.missing_annotated_field
 
+    def test_with_annotations(self):
+        journal = factory.Journal(entries__n=1)
+
+        minimal = Journal.objects.with_annotations('minimal').get(pk=journal.pk)
+        assert minimal.missing_annotated_field
+        assert not any(hasattr(minimal, field) for field in Journal.ANNOTATED_FIELDS)
+
+        partial = Journal.objects.with_annotations('grade', 'name').get(pk=journal.pk)
+        assert hasattr(partial, 'grade') and hasattr(partial, 'name')
+        assert not hasattr(partial, 'needs_lti_link')
+
+        full = Journal.objects.get(pk=journal.pk)
+        assert Journal.objects.with_annotations('full').get(pk=journal.pk).name == full.name
+        assert partial.grade == full.grade and partial.name == full.name
+
+        assert Journal.objects.with_annotations('minimal').filter(pk=journal.pk).exists(), \
+            'The annotation profile should not change which journals are allowed'
+        assert not Journal.objects.with_annotations('minimal').filter(pk=factory.Journal(ap=False).pk).exists()
+
+        with self.assertRaises(VLEProgrammingError):
+            Journal.objects.with_annotations('grades')
+
+    def test_fill_annotated_fields(self):
+        journal = factory.Journal(entries__n=1)
+        full = Journal.objects.get(pk=journal.pk)
+
+        journal = Journal.objects.with_annotations('grade').get(pk=journal.pk)
+        with self.assertNumQueries(1):
+            journal.fill_annotated_fields('name', 'grade')
+        assert journal.name == full.name and journal.grade == full.grade
+        assert not hasattr(journal, 'needs_lti_link')
+
+        with self.assertNumQueries(1):
+            journal.fill_annotated_fields()
+        assert not journal.missing_annotated_field
+        for field in Journal.ANNOTATED_FIELDS:
+            assert getattr(journal, field) == getattr(full, field)
+
+        with self.assertNumQueries(0):
+            journal.fill_annotated_fields()
+
     def test_can_add(self):
         student = factory.Student()
         student2 = factory.Student()
@@ -8,7 +8,9 @@ import datetime
 import test.factory as factory
 import time
 from test.utils import api
-from test.utils.lti import get_new_lti_id, get_signature, lti_launch_response_to_access_token
+from test.utils.lti import (gen_jwt_params, get_access_token, get_new_lti_id, get_signature,
+                            lti_launch_response_to_access_token)
+from unittest import mock
 
 import oauth2
 from django.conf import settings
@@ -952,3 +954,44 @@ class LtiLaunchTest(TestCase):
         )
         assert lti_course.participation_set.filter(user=teacher_now_student, role=student_role).exists(), \
             'Institution teacher but course student is added to the course as a student '
+
+    def test_lti_launch_query_budget(self):
+        course = factory.LtiCourse()
+        assignment = factory.LtiAssignment(courses=[course])
+        factory.Group(course=course, lti_id='1000')
+        student = factory.LtiStudent()
+        params = {
+            'custom_course_id': course.active_lti_id,
+            'custom_assignment_id': assignment.active_lti_id,
+            'custom_assignment_publish': 'true',
+            'custom_section_id': '1000',
+            'custom_user_image': student.profile_picture,
+            'lis_outcome_service_url': REQUEST['lis_outcome_service_url'],
+            'lis_result_sourcedid': REQUEST['lis_result_sourcedid'],
+        }
+        jwt_params = gen_jwt_params(params, user=student)
+        access = get_access_token(student)
+
+        def launch():
+            # The signature is checked without any queries
+            with mock.patch('VLE.lti_launch.OAuthRequestValidater.check_signature'):
+                resp = lti_view.lti_launch(create_request(params, user=student, course=course, assignment=assignment))
+            assert 'state={}'.format(lti_view.LTI_STATES.LOGGED_IN.value) in resp.url
+
+        def get_lti_params():
+            return api.post(self, 'get_lti_params_from_jwt', params=jwt_params, user=student, access=access)
+
+        # The first launch links the student to the course, groups and assignment
+        launch()
+        assert get_lti_params()['params']['jID'] == Journal.objects.get(authors__user=student, assignment=assignment).pk
+        assert Participation.objects.get(user=student, course=course).groups.get().lti_id == '1000'
+
+        # Launches of a linked student do not depend on the number of courses, groups or journals
+        factory.Group(course=course, lti_id='1001')
+        factory.LtiJournal(ap__user=student, assignment__courses=[factory.LtiCourse()])
+        with self.assertNumQueries(3):
+            launch()
+        # The user, participation with course, groups, assignment participation with assignment and journal, and the
+        # permissions of the user
+        with self.assertNumQueries(6):
+            get_lti_params()
@@ -1,12 +1,16 @@
 import datetime
 import test.factory as factory
 from test.utils import api
+from unittest import mock
 
+from django.core.cache import cache
 from django.db import IntegrityError
 from django.test import TestCase
+from django.test.utils import override_settings
 from django.utils import timezone
 
 import VLE.models
+import VLE.timeline
 from VLE.utils.error_handling import VLEProgrammingError
 
 
@@ -30,6 +34,69 @@ class NodeTest(TestCase):
         api.get(self, 'nodes', params={'journal_id': self.journal.pk}, user=factory.Teacher(), status=403)
         api.get(self, 'nodes', params={'journal_id': self.journal.pk}, user=self.teacher)
 
+    def test_get_etag(self):
+        journal = factory.Journal(assignment__format__templates=[{'type': VLE.models.Field.TEXT}], entries__n=1)
+        student = journal.authors.first().user
+        teacher = journal.assignment.courses.first().author
+        url = '/nodes/?journal_id={}'.format(journal.pk)
+
+        def get(user, etag='', status=200):
+            access = api.login(self, user)['access']
+            resp = self.client.get(url, HTTP_AUTHORIZATION='Bearer ' + access, HTTP_IF_NONE_MATCH=etag)
+            assert resp.status_code == status
+            return resp['ETag']
+
+        etag = get(student)
+        assert get(student, etag, status=304) == etag, 'An unchanged timeline should not be sent again'
+        with mock.patch('VLE.timeline.get_nodes') as get_nodes:
+            get(student, etag, status=304)
+            get_nodes.assert_not_called()
+        assert get(teacher) != etag, 'The ETag should depend on the user requesting the timeline'
+
+        def assert_changes_etag(change):
+            nonlocal etag
+            change()
+            new_etag = get(student, etag)
+            assert new_etag != etag
+            etag = new_etag
+
+        entry = VLE.models.Entry.objects.get(node__journal=journal)
+        assert_changes_etag(lambda: factory.UnlimitedEntry(node__journal=journal))
+        assert_changes_etag(lambda: factory.Grade(entry=entry, published=True))
+        assert_changes_etag(lambda: factory.ProgressPresetNode(format=journal.assignment.format))
+        assert_changes_etag(lambda: factory.Field(template=entry.template))
+        assert_changes_etag(lambda: entry.delete())
+
+        # Dates passing (e.g. a lock date) changes the timeline as well
+        preset = factory.DeadlinePresetNode(
+            format=journal.assignment.format, lock_date=timezone.now() + datetime.timedelta(days=1))
+        etag = get(student)
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + datetime.timedelta(days=2)):
+            assert get(student, etag) != etag
+        preset.delete()
+
+        # Changes to other journals do not affect the timeline
+        etag = get(student)
+        factory.UnlimitedEntry(node__journal__assignment=journal.assignment)
+        get(student, etag, status=304)
+
+    @override_settings(TIMELINE_CACHE_TIMEOUT=60)
+    def test_get_cached_nodes(self):
+        cache.clear()
+        journal = VLE.models.Journal.objects.with_annotations('needs_lti_link').get(pk=self.journal.pk)
+        etag = VLE.timeline.get_etag(journal, self.student)
+
+        with mock.patch('VLE.timeline.get_nodes', wraps=VLE.timeline.get_nodes) as get_nodes:
+            nodes = VLE.timeline.get_cached_nodes(journal, self.student, etag)
+            assert VLE.timeline.get_cached_nodes(journal, self.student, etag) == nodes
+            assert get_nodes.call_count == 1, 'The cached timeline should be reused for the same version'
+
+            factory.UnlimitedEntry(node__journal=journal)
+            new_etag = VLE.timeline.get_etag(journal, self.student)
+            assert new_etag != etag
+            assert VLE.timeline.get_cached_nodes(journal, self.student, new_etag) != nodes
+            assert get_nodes.call_count == 2
+
     def test_node_properties(self):
         assignment = factory.Assignment()
         journal = factory.Journal(assignment=assignment, entries__n=0)
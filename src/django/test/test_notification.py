@@ -1,17 +1,19 @@
 
 import datetime
 import test.factory as factory
-from test.utils.performance import QueryContext
+from io import StringIO
+from test.utils.performance import QueryContext, queries_invariant_to_db_size
 from unittest import mock
 
 from django.core import mail
+from django.core.management import call_command
 from django.test import TestCase
 from django.test.utils import override_settings
 
 import VLE.factory
 from VLE.models import JournalImportRequest, Notification, Preferences, Role, User, gen_url
 from VLE.permissions import get_supervisors_of
-from VLE.tasks.beats.notifications import send_digest_notifications
+from VLE.tasks.beats.notifications import generate_upcoming_deadline_notifications, send_digest_notifications
 from VLE.tasks.email import send_push_notification
 from VLE.tasks.notifications import generate_new_entry_notifications
 from VLE.utils.error_handling import VLEParticipationError, VLEProgrammingError
@@ -406,6 +408,77 @@ class NotificationTest(TestCase):
         assert batched_entry_notification1.pk in result['sent_notifications'][teacher.pk]
         assert batched_entry_notification2.pk in result['sent_notifications'][teacher.pk]
 
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    def test_digest_queries(self):
+        daily = {preference['name']: Preferences.DAILY for _, preference in Notification.TYPES.items()}
+        course = factory.Course(author__preferences=daily)
+
+        def add_journals(n):
+            for _ in range(n):
+                journal = factory.Journal(ap__user__preferences=daily, entries__n=0, assignment__courses=[course])
+                factory.UnlimitedEntry(node__journal=journal, grade__grade=1)
+                factory.StudentComment(entry__node__journal=journal)
+
+        def send_digest():
+            Notification.objects.update(sent=False)
+            mail.outbox = []
+            send_digest_notifications()
+            assert len(mail.outbox) == User.objects.filter(notification__isnull=False).distinct().count()
+
+        add_journals(1)
+        # The digest should cost the same number of queries, regardless of the number of users and notifications
+        queries_invariant_to_db_size(send_digest, [lambda: add_journals(5)])
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    def test_bulk_notify(self):
+        """Bulk notifying should create the same notifications as creating them one by one."""
+        course = factory.Course()
+        teacher = course.author
+        assignment = factory.Assignment(courses=[course])
+        journals = [factory.Journal(assignment=assignment, entries__n=0) for _ in range(3)]
+        students = [journal.authors.first().user for journal in journals]
+        group = factory.Group(course=course)
+        for user in [teacher, students[0]]:
+            user.participation_set.get(course=course).groups.add(group)
+        Preferences.objects.filter(user=students[0]).update(new_entry_notifications=Preferences.PUSH)
+        User.objects.filter(pk=students[0].pk).update(verified_email=True)
+        Preferences.objects.filter(user=students[1]).update(new_entry_notifications=Preferences.OFF)
+        recipients = [teacher, *students, factory.Student(), factory.Admin()]
+        entries = [factory.UnlimitedEntry(node__journal=journal) for journal in journals]
+
+        def notify(create):
+            Notification.objects.all().delete()
+            create()
+            return set(Notification.objects.values_list(
+                'type', 'user', 'course', 'assignment', 'journal', 'node', 'entry', 'sent'))
+
+        for entry in entries:
+            expected = notify(lambda: [
+                Notification.objects.create(type=Notification.NEW_ENTRY, user=user, entry=entry)
+                for user in recipients
+            ])
+            mail.outbox = []
+            assert notify(lambda: Notification.objects.bulk_notify(
+                Notification.NEW_ENTRY, recipients, entry=entry)) == expected
+            assert len(mail.outbox) == len([notification for notification in expected if notification[-1]]), \
+                'The notifications of users with push preference should be sent'
+
+        assert Notification.objects.filter(user=teacher).count() == 0, \
+            'The teacher should not be notified of journals outside its own group'
+        assert Notification.objects.filter(user=recipients[-1]).count() == 1, 'Admins can view every course'
+        assert Notification.objects.filter(user=recipients[-2]).count() == 0, 'Non participants are not notified'
+
+        def add_recipients():
+            for _ in range(5):
+                recipients.append(factory.Journal(assignment=assignment, entries__n=0).authors.first().user)
+            group.participation_set.add(recipients[-1].participation_set.get(course=course))
+
+        # Bulk notifying should cost the same number of queries, regardless of the number of recipients
+        queries_invariant_to_db_size(
+            lambda: Notification.objects.bulk_notify(Notification.NEW_ENTRY, recipients, entry=entries[0]),
+            [add_recipients],
+        )
+
     @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
     def test_error_during_digest_email_send(self):
         daily = {preference['name']: Preferences.DAILY for _, preference in Notification.TYPES.items()}
@@ -503,3 +576,40 @@ class NotificationTest(TestCase):
             state=JournalImportRequest.APPROVED_INC_GRADES
         )
         assert not Notification.objects.filter(jir=jir_not_pending).exists(), 'Non pending JIR should not create any'
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    def test_render_notification_text(self):
+        daily = {preference['name']: Preferences.DAILY for _, preference in Notification.TYPES.items()}
+        course = factory.Course(author__preferences=daily)
+        journal = factory.Journal(ap__user__preferences=daily, entries__n=0, assignment__courses=[course])
+        factory.UnlimitedEntry(node__journal=journal, grade__grade=1)
+        factory.StudentComment(entry__node__journal=journal)
+        factory.ProgressPresetNode(
+            format=journal.assignment.format,
+            due_date=datetime.date.today() + datetime.timedelta(days=1, hours=2),
+            lock_date=datetime.date.today() + datetime.timedelta(days=2),
+            target=5,
+        )
+        generate_upcoming_deadline_notifications()
+
+        def text(notification):
+            return notification.title, notification.content, notification.batch_content(n=2), notification.url
+
+        stored = {notification.pk: text(notification) for notification in Notification.objects.all()}
+        assert {notification.type for notification in Notification.objects.all()} >= {
+            Notification.NEW_COURSE, Notification.NEW_ENTRY, Notification.NEW_COMMENT, Notification.UPCOMING_DEADLINE}
+        assert all(title and content and url for title, content, _, url in stored.values())
+
+        # NOTE: factory boy sets the template of an entry after its creation, the new entry notification lacks it
+        for notification in Notification.objects.exclude(type=Notification.NEW_ENTRY):
+            notification.render()
+            assert text(notification) == stored[notification.pk], 'Stored text should equal the rendered text'
+
+        # Notifications created before the text was stored are rendered by the backfill
+        Notification.objects.filter(type=Notification.NEW_ENTRY).update(title='', content='', batch_text='', url='')
+        call_command('render_notification_text', stdout=StringIO())
+        for notification in Notification.objects.all():
+            if notification.type == Notification.NEW_ENTRY:
+                assert notification.entry.template.name in notification.content
+            else:
+                assert text(notification) == stored[notification.pk]
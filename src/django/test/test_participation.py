@@ -1,11 +1,17 @@
+import os
+import tempfile
 import test.factory as factory
+from io import StringIO
 from test.utils import api
 from test.utils.performance import QueryContext
 
+from django.core.management import CommandError, call_command
 from django.test import TestCase
 
-from VLE.models import Journal, Role, User
+import VLE.factory
+from VLE.models import AssignmentParticipation, Journal, Notification, Participation, Role, User
 from VLE.serializers import AssignmentParticipationSerializer, ParticipationSerializer
+from VLE.utils.roster import import_roster
 
 
 class ParticipationAPITest(TestCase):
@@ -201,3 +207,112 @@ class ParticipationAPITest(TestCase):
             ).data
 
         assert len(context_post) - len(context_pre) <= queries_per_additional_user
+
+
+class RosterImportTest(TestCase):
+    def setUp(self):
+        self.teacher = factory.Teacher()
+        self.course = factory.Course(author=self.teacher)
+        self.assignment = factory.Assignment(courses=[self.course])
+        self.group_assignment = factory.Assignment(courses=[self.course], group_assignment=True)
+        self.unpublished = factory.Assignment(courses=[self.course], is_published=False)
+        self.student = factory.Student()
+        self.roster = [
+            {'username': self.student.username, 'groups': ['Group A']},
+            {'username': 'lti-student', 'full_name': 'LTI Student', 'lti_id': 'lti-1', 'groups': ['Group A', 'B']},
+            {'username': 'ta', 'full_name': 'Teaching Assistant', 'email': 'ta@example.com', 'role': 'TA'},
+        ]
+
+    def import_params(self, **params):
+        return {'course_id': self.course.pk, 'roster': self.roster, **params}
+
+    def test_import_roster(self):
+        api.post(self, 'participations/roster', params=self.import_params(), user=self.student, status=403)
+        Role.objects.filter(course=self.course).update(can_edit_course_roles=False)
+        api.post(self, 'participations/roster', params=self.import_params(), user=self.teacher, status=403)
+        Role.objects.filter(course=self.course).update(can_edit_course_roles=True)
+
+        resp = api.post(self, 'participations/roster', params=self.import_params(), user=self.teacher)
+        assert resp['imported'] == {'users': 2, 'participations': 3, 'roles': 0, 'groups': 2, 'memberships': 3}
+
+        lti_student, ta = User.objects.get(username='lti-student'), User.objects.get(username='ta')
+        assert lti_student.is_active and lti_student.lti_id == 'lti-1', 'LTI users should log in through the LMS'
+        assert not ta.is_active, 'Users without an LTI id should be invited'
+        assert ta.participation_set.get(course=self.course).role.name == 'TA'
+        assert set(lti_student.participation_set.get().groups.values_list('name', flat=True)) == {'Group A', 'B'}
+        assert Journal.objects.filter(authors__user=self.student, assignment=self.assignment).exists()
+
+        # Importing the same roster again changes nothing, changed roles are updated
+        resp = api.post(self, 'participations/roster', params=self.import_params(), user=self.teacher)
+        assert resp['imported'] == {'users': 0, 'participations': 0, 'roles': 0, 'groups': 0, 'memberships': 0}
+        self.roster[2]['role'] = 'Student'
+        resp = api.post(self, 'participations/roster', params=self.import_params(), user=self.teacher)
+        assert resp['imported']['roles'] == 1
+        assert ta.participation_set.get(course=self.course).role.name == 'Student'
+
+        csv_roster = 'username,full_name,email,groups\ncsv-student,CSV Student,csv@example.com,B;C\n'
+        resp = api.post(self, 'participations/roster', params=self.import_params(roster=csv_roster),
+                        user=self.teacher)
+        assert resp['imported'] == {'users': 1, 'participations': 1, 'roles': 0, 'groups': 1, 'memberships': 2}
+
+        # Invalid rosters are rejected before anything is imported
+        for roster in [
+            [{'username': 'new', 'full_name': 'New', 'email': 'new@example.com', 'role': 'Unknown'}],
+            [{'username': 'new', 'full_name': 'New', 'email': self.student.email}],
+            [{'username': 'new', 'full_name': 'New'}],
+            [{'username': 'new', 'full_name': 'New', 'lti_id': '1'}, {'username': 'NEW', 'lti_id': '2'}],
+            [{'full_name': 'No username'}],
+            'not, a roster\n"',
+        ]:
+            api.post(self, 'participations/roster', params=self.import_params(roster=roster, format='json'),
+                     user=self.teacher, status=400)
+        assert not User.objects.filter(username='new').exists()
+
+    def test_import_roster_equivalent_to_participation_save(self):
+        saved, imported = factory.Student(), factory.Student()
+        VLE.factory.make_participation(saved, self.course, self.course.role_set.get(name='Student'))
+        import_roster(self.course, [{'username': imported.username}])
+
+        def state(user):
+            return (
+                set(AssignmentParticipation.objects.filter(user=user).values_list('assignment', 'journal__isnull')),
+                sorted(Notification.objects.filter(user=user).values_list('type', 'course', 'assignment')),
+                Journal.objects.filter(authors__user=user).values_list('node', flat=True).count(),
+            )
+
+        assert state(saved) == state(imported)
+        assert state(saved)[0] == {
+            (self.assignment.pk, False), (self.group_assignment.pk, True), (self.unpublished.pk, True)}
+
+    def test_import_roster_queries(self):
+        def roster(start, n):
+            return [
+                {'username': 'student{}'.format(i), 'full_name': 'Student', 'lti_id': str(i), 'groups': [str(i % 3)]}
+                for i in range(start, start + n)
+            ]
+
+        import_roster(self.course, roster(0, 3))
+        with QueryContext() as context_pre:
+            import_roster(self.course, roster(3, 3))
+        with QueryContext() as context_post:
+            import_roster(self.course, roster(6, 30))
+
+        assert len(context_pre) == len(context_post), 'Importing a roster takes a constant number of queries'
+        assert Participation.objects.filter(course=self.course).count() == 37
+
+    def test_import_roster_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'roster.csv')
+            with open(path, 'w') as roster:
+                roster.write('username,full_name,lti_id,role\n')
+                roster.writelines('student{0},Student {0},{0},Student\n'.format(i) for i in range(5))
+
+            out = StringIO()
+            call_command('import_roster', self.course.pk, path, batch_size=2, stdout=out)
+            assert 'Imported 4 of 5 users.' in out.getvalue()
+            assert 'Created 5 users, 5 participations' in out.getvalue()
+            call_command('import_roster', self.course.pk, path, stdout=out)
+            assert 'Created 0 users, 0 participations' in out.getvalue()
+
+            with self.assertRaises(CommandError):
+                call_command('import_roster', self.course.pk, path, format='json', stdout=out)
@@ -4,16 +4,18 @@ test_permissions.py
 This file tests whether all permissions behave as required.
 """
 import datetime
+import random
 import test.factory as test_factory
 from test.factory.user import DEFAULT_PASSWORD
-from test.utils.performance import QueryContext, assert_num_queries_less_than
+from test.utils.performance import QueryContext
 
+from django.core.cache import cache
 from django.core.validators import ValidationError
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 import VLE.factory as factory
 import VLE.permissions as permissions
-from VLE.models import Participation, Role
+from VLE.models import Assignment, Comment, Journal, Participation, Role
 from VLE.utils.error_handling import VLEParticipationError, VLEPermissionError, VLEProgrammingError
 
 
@@ -282,9 +284,8 @@ class PermissionTests(TestCase):
         assert result['can_edit_assignment']
         assert not result['can_have_journal']
         self.assertEqual(len(Role.ASSIGNMENT_PERMISSIONS), len(result))
-        assert len(queries_with_one_course) <= 2, \
-            'Max two queries may be used for permission serialization with one course attached' + \
-            '(get assignment courses & get roles from course)'
+        assert len(queries_with_one_course) == 1, \
+            'The permissions of all roles in the assignment courses should be aggregated in a single query'
 
         Participation.objects.filter(user=self.user).delete()
         role_can_do_stuff = factory.make_role_default_no_perms(
@@ -313,15 +314,36 @@ class PermissionTests(TestCase):
             'All permissions needs to be serialized, also some that were not in the make_role_default_no_perms call'
         Role.objects.filter(name='R1').update(can_view_all_journals=True)
         Role.objects.filter(name='R2').update(can_view_all_journals=False)
-        with assert_num_queries_less_than(
-            2 * len(queries_with_one_course),
-            msg='Query count of assignment serializer should only scale with the amount of connected courses',
-        ):
+        with self.assertNumQueries(1):
             result = permissions.serialize_assignment_permissions(self.user, self.assignment)
         assert result['can_view_all_journals'], \
             'Permission needs to be true when at least 1 role in a course has the permission.' + \
             'The order of roles should not matter'
 
+    def test_serialize_assignments_permissions(self):
+        role = factory.make_role_default_no_perms('SD', self.course1, can_have_journal=True)
+        factory.make_participation(self.user, self.course1, role)
+        role = factory.make_role_default_no_perms(
+            'Grader', self.course_independent, can_view_all_journals=True, can_grade=True)
+        factory.make_participation(self.user, self.course_independent, role)
+        assignments = [
+            self.assignment,
+            self.assignment_independent,
+            factory.make_assignment('Shared', 'Linked to both.', courses=[self.course1, self.course_independent]),
+            test_factory.Assignment(),
+        ]
+
+        with self.assertNumQueries(1):
+            result = permissions.serialize_assignments_permissions(self.user, assignments)
+
+        assert result == {
+            assignment.pk: permissions.serialize_assignment_permissions(self.user, assignment)
+            for assignment in assignments
+        }, 'The batched permissions should equal the permissions serialized per assignment'
+        assert result[self.assignment.pk]['can_have_journal']
+        assert not result[assignments[2].pk]['can_have_journal'] and result[assignments[2].pk]['can_grade']
+        assert result[assignments[3].pk] == {}
+
     def test_is_supervisor(self):
         high_user = test_factory.Teacher()
         middle_user = test_factory.Student()
@@ -364,6 +386,157 @@ class PermissionTests(TestCase):
         assert not permissions.is_user_supervisor_of(low_user, high_user)
         assert not permissions.is_user_supervisor_of(low_user, middle_user)
 
+    def test_permission_matrix(self):
+        """Within a permission matrix scope, permissions should be answered from memory, equal to the queried ones."""
+        self.assignment.is_published = True
+        self.assignment.save()
+        student_role = factory.make_role_default_no_perms('SD', self.course1, can_have_journal=True)
+        ta_role = factory.make_role_default_no_perms(
+            'Grader', self.course2, can_view_all_journals=True, can_grade=True, can_view_unpublished_assignment=True)
+        factory.make_participation(self.user, self.course1, student_role)
+        factory.make_participation(self.user, self.course2, ta_role)
+
+        other_role = factory.make_role_default_no_perms('SD', self.course_independent, can_have_journal=True)
+        participation = factory.make_participation(self.user, self.course_independent, other_role)
+        group_assignment = factory.make_assignment(
+            'Group assignment', 'Assigned to a group.', courses=[self.course_independent], is_published=True)
+        group_assignment.assigned_groups.set([test_factory.Group(course=self.course_independent)])
+
+        courses = [self.course1, self.course2, self.course_independent, test_factory.Course()]
+        assignments = [self.assignment, self.assignment_independent, group_assignment, test_factory.Assignment()]
+        journals = [Journal.objects.get(assignment=self.assignment), test_factory.Journal()]
+
+        def check_all():
+            return [
+                *[self.user.has_permission(permission, course)
+                  for permission in Role.COURSE_PERMISSIONS for course in courses],
+                *[self.user.has_permission(permission, assignment)
+                  for permission in Role.ASSIGNMENT_PERMISSIONS for assignment in assignments],
+                *[self.user.is_participant(obj) for obj in courses + assignments],
+                *[self.user.can_view(obj) for obj in courses + assignments + journals],
+            ]
+
+        expected = check_all()
+        with permissions.permission_matrix_scope():
+            with QueryContext() as loading_queries:
+                assert check_all() == expected
+            assert len(loading_queries) <= 5, 'The matrix, groups and journals of the user should be loaded only once'
+            with self.assertNumQueries(0):
+                assert check_all() == expected
+
+            # Changes to roles and participations made within the scope should be reflected
+            assert not self.user.has_permission('can_edit_assignment', self.assignment_independent)
+            other_role.can_edit_assignment = True
+            other_role.save()
+            assert self.user.has_permission('can_edit_assignment', self.assignment_independent)
+
+            assert not self.user.can_view(group_assignment)
+            participation.groups.add(*group_assignment.assigned_groups.all())
+            assert self.user.can_view(group_assignment)
+
+            participation.delete()
+            assert not self.user.is_participant(self.course_independent)
+            assert not self.user.has_permission('can_edit_assignment', self.assignment_independent)
+
+            self.assignment_independent.courses.add(self.course1)
+            assert self.user.is_participant(self.assignment_independent)
+
+            expected = check_all()
+        assert check_all() == expected
+
+    @override_settings(PERMISSION_CACHE_TIMEOUT=60)
+    def test_permission_cache(self):
+        """Course permissions should be cached across scopes, and invalidated by role and participation changes."""
+        cache.clear()
+        role = factory.make_role_default_no_perms('SD', self.course_independent, can_have_journal=True)
+
+        def check(permission, obj):
+            with permissions.permission_matrix_scope():
+                return self.user.has_permission(permission, obj)
+
+        def assert_cached(cached, permission, obj):
+            stats = permissions.get_permission_cache_stats()
+            result = check(permission, obj)
+            after = permissions.get_permission_cache_stats()
+            assert after['hits'] == stats['hits'] + cached
+            assert after['misses'] == stats['misses'] + (not cached)
+            return result
+
+        assert not assert_cached(False, 'can_edit_course_details', self.course_independent)
+        assert not assert_cached(True, 'can_edit_course_details', self.course_independent)
+
+        participation = factory.make_participation(self.user, self.course_independent, role)
+        assert not assert_cached(False, 'can_edit_course_details', self.course_independent)
+        with self.assertNumQueries(0):
+            assert not check('can_edit_course_details', self.course_independent)
+
+        role.can_edit_course_details = True
+        role.save()
+        assert assert_cached(False, 'can_edit_course_details', self.course_independent)
+
+        assert not assert_cached(True, 'can_have_journal', self.assignment)
+        self.assignment.courses.add(self.course_independent)
+        assert assert_cached(False, 'can_have_journal', self.assignment)
+        self.assignment.courses.remove(self.course_independent)
+        assert not assert_cached(False, 'can_have_journal', self.assignment)
+        self.course_independent.assignment_set.add(self.assignment)
+        assert assert_cached(False, 'can_have_journal', self.assignment)
+
+        participation.delete()
+        assert not assert_cached(False, 'can_edit_course_details', self.course_independent)
+
+        with override_settings(PERMISSION_CACHE_TIMEOUT=0):
+            participation = factory.make_participation(self.user, self.course_independent, role)
+            stats = permissions.get_permission_cache_stats()
+            assert check('can_edit_course_details', self.course_independent)
+            assert permissions.get_permission_cache_stats() == stats, 'A disabled cache should not be used'
+
+    def test_viewable_by(self):
+        """The viewable_by filters should be equivalent to can_view, tested over randomized fixtures."""
+        random.seed(8)
+        make_roles = [
+            factory.make_role_student,
+            factory.make_role_ta,
+            factory.make_role_observer,
+            factory.make_role_teacher,
+            lambda name, course: factory.make_role_default_no_perms(
+                name, course, can_have_journal=True, can_view_unpublished_assignment=True),
+        ]
+
+        courses = [test_factory.Course() for _ in range(3)]
+        groups = {course: [test_factory.Group(course=course) for _ in range(2)] for course in courses}
+        users = [test_factory.Student() for _ in range(6)]
+        participations = []
+        for i, user in enumerate(users):
+            for j, course in enumerate(courses):
+                if random.random() < 0.7:
+                    role = random.choice(make_roles)('Role {} {}'.format(i, j), course)
+                    participation = factory.make_participation(user, course, role)
+                    participation.groups.set(random.sample(groups[course], random.randint(0, 2)))
+                    participations.append(participation)
+
+        for i in range(6):
+            assignment_courses = random.sample(courses, random.randint(1, 2))
+            assignment = factory.make_assignment(
+                'Assignment {}'.format(i), '', courses=assignment_courses, is_published=random.random() < 0.7)
+            course_groups = [group for course in assignment_courses for group in groups[course]]
+            assignment.assigned_groups.set(random.sample(course_groups, random.randint(0, 2)))
+
+        # Change some roles after the journals are created, so also non students have journals
+        for participation in random.sample(participations, 3):
+            participation.role = factory.make_role_ta('Changed {}'.format(participation.pk), participation.course)
+            participation.save()
+
+        for journal in Journal.all_objects.all():
+            entry = test_factory.UnlimitedEntry(node__journal=journal)
+            test_factory.StudentComment(entry=entry)
+            test_factory.TeacherComment(entry=entry)
+
+        assert Journal.all_objects.exists() and Comment.objects.filter(published=False).exists()
+        for user in [*users, *[course.author for course in courses], test_factory.Admin()]:
+            for queryset in [Assignment.objects.all(), Journal.all_objects.all(), Comment.objects.all()]:
+                assert set(queryset.viewable_by(user)) == {obj for obj in queryset if user.can_view(obj)}
+
     def test_all_permissions_are_in_model(self):
         assert set(p.name for p in Role._meta.get_fields(include_parents=False) if p.name.startswith('can_')) == \
             set(Role.PERMISSIONS), 'All permission fields should be in Role.PERMISSIONS and the other way around'
@@ -5,7 +5,7 @@ Test all about the timeline.
 """
 import datetime
 import test.factory as factory
-from test.utils.performance import assert_num_queries_less_than
+from test.utils.performance import assert_num_queries_less_than, queries_invariant_to_db_size
 
 from django.test import TestCase
 from django.utils import timezone
@@ -158,3 +158,27 @@ class TimelineTests(TestCase):
         data = timeline.get_nodes(journal, user=student)
         for n in data:
             assert n['type'] != Node.ADDNODE, 'When the assignment is locked no add node should be serialized'
+
+    def test_get_nodes_queries(self):
+        assignment = factory.Assignment(format__templates=[{'type': Field.TEXT}])
+        journal = factory.Journal(assignment=assignment, entries__n=0)
+        journal = Journal.objects.get(pk=journal.pk)
+        student = journal.author
+        template = assignment.format.template_set.first()
+
+        def add_nodes(n):
+            for i in range(n):
+                factory.UnlimitedEntry(node__journal=journal, grade__grade=1, grade__published=i % 2 == 0)
+
+                deadline = factory.DeadlinePresetNode(format=assignment.format, forced_template=template)
+                if i % 2 == 0:
+                    factory.PresetEntry(node=journal.node_set.get(preset=deadline))
+
+                factory.ProgressPresetNode(format=assignment.format)
+
+        add_nodes(1)
+        assert journal.node_set.count() == 3
+        # Serializing the timeline should cost the same number of queries, regardless of the number of nodes
+        queries_invariant_to_db_size(
+            timeline.get_nodes, [lambda: add_nodes(33)], call_args=[journal], call_kwargs={'user': student})
+        assert journal.node_set.count() == 102
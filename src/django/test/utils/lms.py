@@ -0,0 +1,85 @@
+import threading
+import time
+import xml.etree.cElementTree as ET
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+NAMESPACE = '{http://www.imsglobal.org/services/ltiv1p1/xsd/imsoms_v1p0}'
+
+RESPONSE = '''<?xml version="1.0" encoding="UTF-8"?>
+<imsx_POXEnvelopeResponse xmlns="http://www.imsglobal.org/services/ltiv1p1/xsd/imsoms_v1p0">
+<imsx_POXHeader><imsx_POXResponseHeaderInfo><imsx_version>V1.0</imsx_version>
+<imsx_messageIdentifier>{message_id}</imsx_messageIdentifier>
+<imsx_statusInfo><imsx_codeMajor>success</imsx_codeMajor><imsx_severity>status</imsx_severity>
+<imsx_description>Score for {sourcedid} is now {score}</imsx_description>
+<imsx_messageRefIdentifier>{message_id}</imsx_messageRefIdentifier>
+<imsx_operationRefIdentifier>replaceResult</imsx_operationRefIdentifier></imsx_statusInfo>
+</imsx_POXResponseHeaderInfo></imsx_POXHeader><imsx_POXBody><replaceResultResponse/></imsx_POXBody>
+</imsx_POXEnvelopeResponse>'''
+
+
+class StubLMSHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps the connection alive between requests
+    protocol_version = 'HTTP/1.1'
+    # Answer immediately instead of waiting for the acknowledgement of the headers before sending the body
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        root = ET.fromstring(body)
+        message_id = root.find('.//{}imsx_messageIdentifier'.format(NAMESPACE)).text
+        sourcedid = root.find('.//{}sourcedId'.format(NAMESPACE)).text
+        score = root.find('.//{}textString'.format(NAMESPACE))
+        score = None if score is None else score.text
+
+        status = self.server.receive(self, message_id, sourcedid, score)
+        if self.server.delay:
+            time.sleep(self.server.delay)
+
+        content = RESPONSE.format(message_id=message_id, sourcedid=sourcedid, score=score).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class StubLMS(ThreadingMixIn, HTTPServer):
+    """Local LMS which parses the POX grade passback requests and records them.
+
+    Responds after `delay` seconds, the first `failures` attempts of every message are answered with a 503.
+    """
+    daemon_threads = True
+
+    def __init__(self, delay=0, failures=0):
+        super().__init__(('localhost', 0), StubLMSHandler)
+        self.delay = delay
+        self.failures = failures
+        self.lock = threading.Lock()
+        self.requests = []
+        self.connections = set()
+        self.attempts = {}
+
+    @property
+    def url(self):
+        return 'http://localhost:{}/grade_passback'.format(self.server_address[1])
+
+    def receive(self, handler, message_id, sourcedid, score):
+        with self.lock:
+            self.connections.add(handler.client_address)
+            self.attempts[message_id] = self.attempts.get(message_id, 0) + 1
+            if self.attempts[message_id] <= self.failures:
+                return 503
+            self.requests.append({'message_id': message_id, 'sourcedid': sourcedid, 'score': score})
+            return 200
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()